@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark grouping device-status sensor entries per host.
+
+Compares the single pass `group_by_host` against the previous `combined_Dict_List`
+implementation, which took the union of the seen hosts for every sensor and therefore
+scaled quadratically with the number of hosts.
+
+Usage
+=====
+    python benchmarks/bench_grouping.py [--hosts 64 128 256 512 1024] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sensor_poll import group_by_host  # noqa: E402
+
+# Roughly the number of device-status sensors on an fhost/xhost pair
+SENSORS_PER_HOST = 20
+
+
+def quadratic_combined_dict_list(*args):
+    """The combined_Dict_List implementation replaced by group_by_host"""
+    result = {}
+    for _dict in args:
+        for key in result.viewkeys() | _dict.keys():
+            if key in _dict:
+                result.setdefault(key, []).extend([_dict[key]])
+    return result
+
+
+def synthetic_pairs(hosts):
+    return [
+        ("%shost%02d" % (host_type, host), ["sensor%d" % _c, "nominal"])
+        for host_type in ("f", "x")
+        for host in xrange(hosts // 2)
+        for _c in xrange(SENSORS_PER_HOST)
+    ]
+
+
+def best_time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-host grouping.")
+    parser.add_argument(
+        "--hosts",
+        dest="hosts",
+        nargs="+",
+        type=int,
+        default=[64, 128, 256, 512, 1024],
+        help="Number of hosts to group [Default: 64 128 256 512 1024]",
+    )
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=5,
+        help="Best of x runs [Default: 5]",
+    )
+    args = vars(parser.parse_args())
+
+    print("%8s %10s %16s %16s %10s" % ("hosts", "sensors", "quadratic (ms)", "linear (ms)", "speedup"))
+    for hosts in args.get("hosts"):
+        pairs = synthetic_pairs(hosts)
+        dicts = [{host: entry} for host, entry in pairs]
+        assert quadratic_combined_dict_list(*dicts) == group_by_host(pairs)
+        quadratic = best_time(lambda: quadratic_combined_dict_list(*dicts), args.get("repeat"))
+        linear = best_time(lambda: group_by_host(pairs), args.get("repeat"))
+        print(
+            "%8d %10d %16.2f %16.2f %9.1fx"
+            % (hosts, len(pairs), quadratic * 1e3, linear * 1e3, quadratic / linear)
+        )
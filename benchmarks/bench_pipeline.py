@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Benchmark the poller's mapping pipeline on synthetic CBF sensor sets.
+
+Every stage of a poll cycle is measured on its own, from the katcp informs to the json
+dumps:
+
+    snapshot      SensorSnapshot of the sensor-value informs
+    mapping       hostname-functional-mapping and input-labelling parsing, once per array
+    index         SensorNameIndex of the sensor names, once per array
+    fhost_rows    map_fhost_sensors, grouped by host and ordered along the signal chain
+    xhost_rows    map_xhost_sensors
+    host_rows     StatusMatrix of the fhost and xhost rows, and its host rows view
+    non_nominal   get_original_mapped_sensors
+    json_dump     the indented sensor_values.json and ordered_sensor_values.json
+    change_diff   sensor_changes.diff_documents against the previous poll cycle
+    cycle         a whole poll cycle, snapshot to json dump
+
+For every array size and stage it reports the best wall time, the container objects the
+stage allocated and did not free (gc counts, python 2 has no tracemalloc) and the peak
+memory above the RSS the stage started with (Linux only, see /proc/self/clear_refs).
+
+--save writes the results as a baseline, --baseline compares against one and exits with 1
+when a stage got slower or bigger than the tolerance allows.
+
+Usage
+=====
+    python benchmarks/bench_pipeline.py [--sizes 4k 16k 64k 256k] [--repeat 5]
+    python benchmarks/bench_pipeline.py --sizes 4k 16k --save benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json [--tolerance 0.25]
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import timeit
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from poll_metrics import PollMetrics  # noqa: E402
+from sensor_changes import diff_documents  # noqa: E402
+from sensor_poll import SensorNameIndex, SensorPoll, SensorSnapshot  # noqa: E402
+from status_matrix import FHOST_SIG_CHAIN, XHOST_SIG_CHAIN, StatusMatrix  # noqa: E402
+from synthetic_cbf import PRESETS, churn, sensor_set  # noqa: E402
+
+# differences below these are noise, not regressions
+MIN_TIME = 2e-3
+MIN_OBJECTS = 100
+MIN_PEAK_KB = 1024
+
+
+class SyntheticPoll(SensorPoll):
+    """
+    SensorPoll reading a synthetic sensor set instead of an array's katcp ports
+
+    Params
+    ======
+    sensors: synthetic_cbf.SensorSet
+    """
+
+    def __init__(self, sensors):
+        self.sensors = sensors
+        self.array_name = "synthetic"
+        self.hostname = "synthetic"
+        self.sampling_strategy = None
+        self._sensor_index = None
+        self.status_matrix = None
+        self.metrics = PollMetrics()
+        self.input_mapping, self.hostname_mapping = self.do_mapping()
+
+    @property
+    def get_sensor_values(self):
+        yield self.sensors.sensor_values
+
+    @property
+    def get_hostmapping(self):
+        yield self.sensors.hostname_mapping
+
+    @property
+    def get_inputlabel(self):
+        yield self.sensors.input_labelling
+
+
+def host_rows(poll, snapshot):
+    matrix = StatusMatrix.from_chains(
+        ("fhost", FHOST_SIG_CHAIN, poll.map_fhost_sensors(snapshot)),
+        ("xhost", XHOST_SIG_CHAIN, poll.map_xhost_sensors(snapshot)),
+    )
+    return {
+        "sensor_values": matrix.to_rows(),
+        "ordered_sensor_values": poll.get_original_mapped_sensors(snapshot),
+    }
+
+
+def json_dump(state):
+    return [json.dumps(state[doc], indent=4, sort_keys=True) for doc in sorted(state)]
+
+
+def pipeline_stages(sensors):
+    """
+    Params
+    ======
+    sensors: synthetic_cbf.SensorSet
+
+    Return
+    ======
+    stages: OrderedDict
+        {stage: callable}, each callable runs one stage on the previous stages' results
+    """
+    poll = SyntheticPoll(sensors)
+    snapshot = poll.take_snapshot()
+    poll.sensor_index(snapshot)
+    fhost_rows = poll.map_fhost_sensors(snapshot)
+    xhost_rows = poll.map_xhost_sensors(snapshot)
+    state = host_rows(poll, snapshot)
+    next_state = host_rows(poll, SensorSnapshot(churn(sensors.sensor_values)))
+
+    def cycle():
+        _snapshot = poll.take_snapshot()
+        return json_dump(host_rows(poll, _snapshot))
+
+    return OrderedDict([
+        ("snapshot", poll.take_snapshot),
+        ("mapping", poll.do_mapping),
+        ("index", lambda: SensorNameIndex(snapshot.names, poll.hostname_mapping)),
+        ("fhost_rows", lambda: poll.map_fhost_sensors(snapshot)),
+        ("xhost_rows", lambda: poll.map_xhost_sensors(snapshot)),
+        ("host_rows", lambda: StatusMatrix.from_chains(
+            ("fhost", FHOST_SIG_CHAIN, fhost_rows), ("xhost", XHOST_SIG_CHAIN, xhost_rows)
+        ).to_rows()),
+        ("non_nominal", lambda: poll.get_original_mapped_sensors(snapshot)),
+        ("json_dump", lambda: json_dump(state)),
+        ("change_diff", lambda: diff_documents(state, next_state)),
+        ("cycle", cycle),
+    ])
+
+
+def reset_peak_rss():
+    """
+    Reset the process' peak RSS, VmHWM, False when the kernel does not support it
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except IOError:
+        return False
+
+
+def proc_status(field):
+    """
+    eg: VmRSS in kB
+    """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+
+def measure(func, repeat):
+    """
+    Params
+    ======
+    func: callable
+        stage to measure
+    repeat: int
+        best of x runs
+
+    Return
+    ======
+    result: dict
+        {"time": best seconds, "objects": container objects allocated and not freed,
+         "peak_kb": peak memory above the starting RSS, None when unknown}
+    """
+    # memory first, before the timing runs grew the heap
+    gc.collect()
+    gc.disable()
+    try:
+        peak_supported = reset_peak_rss()
+        rss = proc_status("VmRSS") if peak_supported else None
+        objects = gc.get_count()[0]
+        result = func()
+        objects = gc.get_count()[0] - objects
+        peak_kb = max(proc_status("VmHWM") - rss, 0) if peak_supported else None
+    finally:
+        gc.enable()
+    del result
+    # the poller runs with the garbage collector enabled
+    best = min(timeit.repeat(func, setup="import gc; gc.enable()", number=1, repeat=repeat))
+    return {"time": best, "objects": objects, "peak_kb": peak_kb}
+
+
+def run(sizes, repeat):
+    """
+    Return
+    ======
+    results: dict
+        {size: {"hosts": ..., "sensors": ..., "stages": {stage: measure(...)}}}
+    """
+    results = OrderedDict()
+    for size in sizes:
+        sensors = sensor_set(PRESETS[size])
+        stages = pipeline_stages(sensors)
+        results[size] = {
+            "hosts": sensors.hosts,
+            "sensors": len(sensors.sensor_values),
+            "stages": OrderedDict(
+                (stage, measure(func, repeat)) for stage, func in stages.iteritems()
+            ),
+        }
+        del sensors, stages
+        gc.collect()
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Return
+    ======
+    regressions: list
+        [(size, stage, metric, baseline value, value), ...] of every metric that grew by more
+        than the tolerance and the noise floor
+    """
+    floors = {"time": MIN_TIME, "objects": MIN_OBJECTS, "peak_kb": MIN_PEAK_KB}
+    found = []
+    for size, result in results.iteritems():
+        for stage, metrics in result["stages"].iteritems():
+            old = baseline.get("sizes", {}).get(size, {}).get("stages", {}).get(stage)
+            if old is None:
+                continue
+            for metric, floor in floors.iteritems():
+                if metrics.get(metric) is None or old.get(metric) is None:
+                    continue
+                if (metrics[metric] > old[metric] * (1 + tolerance)
+                        and metrics[metric] - old[metric] > floor):
+                    found.append((size, stage, metric, old[metric], metrics[metric]))
+    return found
+
+
+def report(results, baseline=None):
+    for size, result in results.iteritems():
+        print("\n%s: %d hosts per host type, %d sensors" % (
+            size, result["hosts"], result["sensors"]))
+        print("%-12s %12s %12s %12s %14s" % (
+            "stage", "time (ms)", "objects", "peak (MB)", "baseline (ms)"))
+        for stage, metrics in result["stages"].iteritems():
+            old = (baseline or {}).get("sizes", {}).get(size, {}).get("stages", {}).get(stage)
+            print("%-12s %12.2f %12d %12s %14s" % (
+                stage,
+                metrics["time"] * 1e3,
+                metrics["objects"],
+                "%.1f" % (metrics["peak_kb"] / 1024.0) if metrics["peak_kb"] is not None else "-",
+                "%.2f" % (old["time"] * 1e3) if old else "-",
+            ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the sensor mapping pipeline.")
+    parser.add_argument(
+        "--sizes",
+        dest="sizes",
+        nargs="+",
+        choices=list(PRESETS),
+        default=list(PRESETS),
+        help="Array sizes by number of sensors [Default: 4k 16k 64k 256k]",
+    )
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=5,
+        help="Best of x runs [Default: 5]",
+    )
+    parser.add_argument(
+        "--save",
+        dest="save",
+        default=None,
+        help="Write the results to this baseline file [Default: None]",
+    )
+    parser.add_argument(
+        "--baseline",
+        dest="baseline",
+        default=None,
+        help="Compare against this baseline file, exit with 1 on a regression [Default: None]",
+    )
+    parser.add_argument(
+        "--tolerance",
+        dest="tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed growth of a stage's time, objects or peak memory [Default: 0.25]",
+    )
+    args = vars(parser.parse_args())
+    # the poller's info logs would drown the report
+    logging.disable(logging.INFO)
+
+    baseline = None
+    if args.get("baseline"):
+        with open(args.get("baseline")) as baseline_file:
+            baseline = json.load(baseline_file)
+    results = run(args.get("sizes"), args.get("repeat"))
+    report(results, baseline)
+
+    if args.get("save"):
+        with open(args.get("save"), "w") as baseline_file:
+            json.dump({
+                "created": time.ctime(),
+                "python": platform.python_version(),
+                "machine": platform.node(),
+                "sizes": results,
+            }, baseline_file, indent=4)
+        print("\nSaved the results as a baseline to %s" % args.get("save"))
+    if baseline is not None:
+        found = regressions(results, baseline, args.get("tolerance"))
+        for size, stage, metric, old, new in found:
+            print("REGRESSION %s %s %s: %s -> %s" % (size, stage, metric, old, new))
+        if found:
+            sys.exit(1)
+        print("\nNo regressions against %s" % args.get("baseline"))
@@ -0,0 +1,138 @@
+"""
+Synthetic CBF sensor sets, generated in memory.
+
+A sensor set holds what the poller reads from an array's sensor port: the ?sensor-value
+informs of every fhostNN/xhostNN device-status hierarchy plus other host sensors, and the
+hostname-functional-mapping and input-labelling sensors.
+
+Usage
+=====
+    from synthetic_cbf import PRESETS, sensor_set
+    sensors = sensor_set(PRESETS["16k"])
+"""
+
+import random
+from collections import OrderedDict, namedtuple
+
+FHOST_DEVICES = ["", "network", "spead-rx", "network-reorder", "cd", "pfb", "ct", "spead-tx"]
+XHOST_DEVICES = ["", "network", "spead-rx", "network-reorder", "missing-pkts"]
+XENG_DEVICES = ["vacc", "spead-tx", "bram-reorder"]
+XENGINES = 4
+# counters, temperatures and the like that are not device-status sensors
+OTHER_SENSORS = [
+    "network.tx-err", "network.rx-err", "network.tx-pkts", "network.rx-pkts",
+    "spead-rx.pkt-cnt", "spead-rx.err-cnt", "spead-tx.pkt-cnt", "sys.temperature",
+    "sys.fan-speed", "sys.voltage", "sys.current", "sys.uptime",
+]
+STATUSES = ["warn", "error", "failure"]
+
+SensorSet = namedtuple("SensorSet", ["hosts", "sensor_values", "hostname_mapping", "input_labelling"])
+
+
+def informs_per_host_pair():
+    fhost = len(FHOST_DEVICES) + len(OTHER_SENSORS)
+    xhost = len(XHOST_DEVICES) + XENGINES * len(XENG_DEVICES) + len(OTHER_SENSORS)
+    return fhost + xhost
+
+
+def hosts_for(informs):
+    """
+    Hosts per host type of an array with about x sensor-value informs
+    """
+    return max(1, informs // informs_per_host_pair())
+
+
+# array sizes by number of sensor-value informs, eg: 16k has 16384 sensors
+PRESETS = OrderedDict(
+    (name, hosts_for(informs))
+    for name, informs in [("4k", 4096), ("16k", 16384), ("64k", 65536), ("256k", 262144)]
+)
+
+
+def skarab(host_type, host):
+    return "skarab02%s%03d-01" % ("0" if host_type == "fhost" else "1", host)
+
+
+def status(rng, bad):
+    return rng.choice(STATUSES) if rng.random() < bad else "nominal"
+
+
+def sensor_set(hosts, bad=0.05, seed=1, timestamp="1539856800.0"):
+    """
+    Params
+    ======
+    hosts: int
+        fhosts, and as many xhosts
+    bad: float
+        fraction of sensors that are not nominal [Defaults: 0.05]
+    seed: int
+        random seed, the same seed makes the same sensor set [Defaults: 1]
+
+    Return
+    ======
+    sensor_set: SensorSet
+        hosts, sensor-value inform arguments [timestamp, '1', name, status, value], and the
+        hostname-functional-mapping and input-labelling inform arguments
+    """
+    rng = random.Random(seed)
+    informs = []
+    for host_type in ("fhost", "xhost"):
+        for host in xrange(hosts):
+            name = "%s%02d" % (host_type, host)
+            devices = list(FHOST_DEVICES if host_type == "fhost" else XHOST_DEVICES)
+            if host_type == "xhost":
+                devices += [
+                    "xeng%d.%s" % (xeng, device)
+                    for xeng in xrange(XENGINES)
+                    for device in XENG_DEVICES
+                ]
+            for device in devices:
+                informs.append([
+                    timestamp, "1", ".".join([name] + ([device] if device else []) + [
+                        "device-status"]), status(rng, bad), "ok",
+                ])
+            for sensor in OTHER_SENSORS:
+                informs.append([
+                    timestamp, "1", "%s.%s" % (name, sensor), status(rng, bad),
+                    str(rng.randint(0, 1000)),
+                ])
+    hostname_mapping = dict(
+        (skarab(host_type, host), "%s%02d" % (host_type, host))
+        for host_type in ("fhost", "xhost")
+        for host in xrange(hosts)
+    )
+    # both polarisations of an antenna on its fhost
+    input_labelling = [
+        ("ant%d_%s" % (host, pol), 2 * host + _p, skarab("fhost", host), _p)
+        for host in xrange(hosts)
+        for _p, pol in enumerate("xy")
+    ]
+    return SensorSet(
+        hosts,
+        informs,
+        [[timestamp, "1", "hostname-functional-mapping", "nominal", repr(hostname_mapping)]],
+        [[timestamp, "1", "input-labelling", "nominal", repr(input_labelling)]],
+    )
+
+
+def churn(informs, fraction=0.01, seed=2):
+    """
+    Params
+    ======
+    informs: list
+        sensor-value inform arguments
+    fraction: float
+        fraction of the device-status sensors whose status changes [Defaults: 0.01]
+
+    Return
+    ======
+    informs: list
+        a copy of informs with some device-status statuses changed, eg: the next poll cycle
+    """
+    rng = random.Random(seed)
+    informs = [list(inform) for inform in informs]
+    device_status = [inform for inform in informs if inform[2].endswith(".device-status")]
+    for inform in rng.sample(device_status, max(1, int(len(device_status) * fraction))):
+        inform[3] = rng.choice([_status for _status in ["nominal"] + STATUSES
+                                if _status != inform[3]])
+    return informs
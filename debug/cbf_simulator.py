@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+"""
+Stand-in for a correlator master controller, to load test the sensor poller, its reconnect
+logic and the dashboard end to end without a CBF.
+
+The primary port answers ?array-list with the array and sensor ports of every simulated
+array. An array port serves the hostname-functional-mapping and input-labelling sensors, a
+sensor port serves every fhost/xhost sensor of a synthetic sensor set, see
+benchmarks/synthetic_cbf.py, plus the hostname-functional-mapping. Sensors are katcp
+sensors, ?sensor-value and ?sensor-sampling work as on a real array.
+
+While running, device-status sensors change status at the churn rate, every request is
+answered after the configured latency and, when asked to, client connections are dropped,
+array ports go down for a while or an array moves to new ports.
+
+Usage
+=====
+    python debug/cbf_simulator.py --port 7147 [--arrays 1] [--size 16k | --hosts 64]
+        [--churn 10] [--latency 0.05 --jitter 0.05]
+        [--disconnect-every 60 --disconnect-mode drop|outage|move --outage 10]
+    python src/sensor_poll.py --hostip 127.0.0.1 --port 7147
+"""
+
+import argcomplete
+import argparse
+import coloredlogs
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+
+import katcp
+
+from katcp import Sensor, ioloop_manager
+from katcp.kattypes import request, return_reply, Str
+from tornado import gen
+from tornado.ioloop import PeriodicCallback
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from synthetic_cbf import PRESETS, STATUSES, sensor_set  # noqa: E402
+
+LOGGER = logging.getLogger(__name__)
+MAPPING_SENSORS = ("hostname-functional-mapping", "input-labelling")
+# seconds between sensor churn steps
+CHURN_TICK = 0.1
+
+
+def katcp_sensors(informs):
+    """
+    Params
+    ======
+    informs: list
+        sensor-value inform arguments, [timestamp, '1', name, status, value]
+
+    Return
+    ======
+    sensors: list
+        katcp string sensors holding the informs' values and statuses
+    """
+    sensors = []
+    for timestamp, _, name, status, value in informs:
+        sensor = Sensor.string(name, default=value, initial_status=Sensor.STATUS_NAMES[status])
+        sensor.set_value(value, Sensor.STATUS_NAMES[status], float(timestamp))
+        sensors.append(sensor)
+    return sensors
+
+
+class SimulatorServer(katcp.DeviceServer):
+    """
+    katcp device server serving a fixed list of sensors, answering every request after the
+    simulator's response latency
+
+    Params
+    ======
+    host, port: str, int
+        address to listen on
+    sensors: list
+        katcp sensors, shared by the servers of an array
+    latency: callable
+        seconds to delay the next reply by [Defaults: no delay]
+    """
+
+    VERSION_INFO = ("cbf-simulator", 0, 1)
+    BUILD_INFO = ("cbf-simulator", 0, 1, "")
+
+    def __init__(self, host, port, sensors=(), latency=None, **kwargs):
+        self._sim_sensors = sensors
+        self._latency = latency
+        super(SimulatorServer, self).__init__(host, port, **kwargs)
+        self.set_concurrency_options(thread_safe=False, handler_thread=False)
+
+    def setup_sensors(self):
+        for sensor in self._sim_sensors:
+            self.add_sensor(sensor)
+
+    @gen.coroutine
+    def handle_request(self, connection, msg):
+        delay = self._latency() if self._latency is not None else 0
+        if delay > 0:
+            yield gen.sleep(delay)
+        done = super(SimulatorServer, self).handle_request(connection, msg)
+        if done is not None:
+            yield done
+
+    def drop_clients(self, reason="simulated disconnect"):
+        """
+        Close every client connection, the server keeps listening
+        """
+        for conn in list(self._server._connections.values()):
+            conn.disconnect(reason)
+
+
+class PrimaryServer(SimulatorServer):
+    """
+    Primary port, lists the simulated arrays
+    """
+
+    def __init__(self, host, port, simulator, **kwargs):
+        self.simulator = simulator
+        super(PrimaryServer, self).__init__(host, port, **kwargs)
+
+    @request(Str(optional=True))
+    @return_reply(Str())
+    def request_array_list(self, req, array_name=None):
+        """List the arrays, eg: #array-list array0 7148,7149"""
+        arrays = [
+            array for array in self.simulator.arrays
+            if array_name is None or array.name == array_name
+        ]
+        for array in arrays:
+            req.inform(array.name, "%d,%d" % array.ports)
+        return ("ok", str(len(arrays)))
+
+
+class SimulatedArray(object):
+    """
+    An array's katcp array and sensor port servers and its sensors
+
+    Params
+    ======
+    name: str
+        eg: array0
+    hosts: int
+        fhosts, and as many xhosts
+    ports: tuple
+        (array port, sensor port)
+    bad: float
+        fraction of sensors that start out not nominal
+    seed: int
+        random seed of the sensor set and its churn
+    """
+
+    def __init__(self, name, hosts, ports, host="127.0.0.1", bad=0.05, seed=1, latency=None,
+                 ioloop=None):
+        self.name = name
+        self.host = host
+        self.ports = ports
+        self._latency = latency
+        self._ioloop = ioloop
+        self._rng = random.Random(seed)
+        self._churn_budget = 0.0
+        sensors = sensor_set(hosts, bad=bad, seed=seed)
+        self.host_sensors = katcp_sensors(sensors.sensor_values)
+        self.mapping_sensors = dict(
+            (informs[0][2], katcp_sensors(informs)[0])
+            for informs in (sensors.hostname_mapping, sensors.input_labelling)
+        )
+        self.device_status = [
+            sensor for sensor in self.host_sensors if sensor.name.endswith(".device-status")
+        ]
+        self.servers = []
+
+    def start(self):
+        """
+        Listen on the array and sensor ports
+        """
+        array_port, sensor_port = self.ports
+        self.servers = [
+            SimulatorServer(
+                self.host, array_port, latency=self._latency,
+                sensors=[self.mapping_sensors[name] for name in MAPPING_SENSORS],
+            ),
+            SimulatorServer(
+                self.host, sensor_port, latency=self._latency,
+                sensors=self.host_sensors + [self.mapping_sensors[MAPPING_SENSORS[0]]],
+            ),
+        ]
+        for server in self.servers:
+            server.set_ioloop(self._ioloop)
+            server.start()
+        LOGGER.info("%s listening on array port %s and sensor port %s with %s sensors" % (
+            self.name, array_port, sensor_port, len(self.host_sensors)))
+
+    def stop(self):
+        for server in self.servers:
+            server.stop(timeout=None)
+        self.servers = []
+
+    def drop_clients(self):
+        for server in self.servers:
+            server.drop_clients()
+
+    def churn(self, rate, elapsed):
+        """
+        Change the status of about rate x elapsed device-status sensors
+
+        Params
+        ======
+        rate: float
+            status changes per second
+        elapsed: float
+            seconds since the last call
+        """
+        self._churn_budget += rate * elapsed
+        changes = min(int(self._churn_budget), len(self.device_status))
+        self._churn_budget -= changes
+        for sensor in self._rng.sample(self.device_status, changes):
+            current = Sensor.STATUSES[sensor.status()]
+            status = self._rng.choice([
+                _status for _status in ["nominal"] + STATUSES if _status != current
+            ])
+            sensor.set_value(sensor.value(), Sensor.STATUS_NAMES[status])
+
+
+class CBFSimulator(object):
+    """
+    Primary port plus simulated arrays, all served from a single ioloop thread
+
+    Params
+    ======
+    port: int
+        primary port, the arrays take the ports above it [Defaults: 7147]
+    arrays: int
+        number of arrays [Defaults: 1]
+    hosts: int
+        fhosts, and as many xhosts, per array [Defaults: 4]
+    churn: float
+        device-status changes per second per array [Defaults: 1]
+    latency: float
+        seconds every request is answered after [Defaults: 0]
+    jitter: float
+        up to x seconds added to the latency at random [Defaults: 0]
+    disconnect_every: float
+        seconds between injected disconnects, 0 to never disconnect [Defaults: 0]
+    disconnect_mode: str
+        'drop' closes the client connections of an array, 'outage' also stops its ports for
+        outage seconds and 'move' restarts it on new ports, such that clients have to look
+        them up on the primary port again [Defaults: 'drop']
+    outage: float
+        seconds an array's ports stay down [Defaults: 10]
+    """
+
+    def __init__(self, host="127.0.0.1", port=7147, arrays=1, hosts=4, bad=0.05, churn=1,
+                 latency=0, jitter=0, disconnect_every=0, disconnect_mode="drop", outage=10,
+                 seed=1):
+        self.host = host
+        self.port = port
+        self.churn_rate = churn
+        self.latency = latency
+        self.jitter = jitter
+        self.disconnect_every = disconnect_every
+        self.disconnect_mode = disconnect_mode
+        self.outage = outage
+        self._rng = random.Random(seed)
+        self._next_port = port + 1
+        self._io_manager = ioloop_manager.IOLoopManager(managed_default=True)
+        self.ioloop = self._io_manager.get_ioloop()
+        self.arrays = [
+            SimulatedArray(
+                "array%d" % _a, hosts, self._take_ports(), host=host, bad=bad, seed=seed + _a,
+                latency=self.response_latency, ioloop=self.ioloop,
+            )
+            for _a in xrange(arrays)
+        ]
+        self.primary = PrimaryServer(host, port, self, latency=self.response_latency)
+        self.primary.set_ioloop(self.ioloop)
+        self._churn = PeriodicCallback(self._churn_step, CHURN_TICK * 1e3, io_loop=self.ioloop)
+
+    def _take_ports(self):
+        ports = (self._next_port, self._next_port + 1)
+        self._next_port += 2
+        return ports
+
+    def response_latency(self):
+        return self.latency + self._rng.uniform(0, self.jitter)
+
+    def start(self):
+        self._io_manager.start()
+        started = threading.Event()
+
+        def _start():
+            self.primary.start()
+            for array in self.arrays:
+                array.start()
+            if self.churn_rate:
+                self._churn.start()
+            self._schedule_disconnect()
+            started.set()
+
+        self.ioloop.add_callback(_start)
+        started.wait()
+        LOGGER.info("Primary port %s serving %s arrays" % (self.port, len(self.arrays)))
+
+    def stop(self):
+        def _stop():
+            self._churn.stop()
+            for array in self.arrays:
+                array.stop()
+            self.primary.stop(timeout=None)
+
+        self.ioloop.add_callback(_stop)
+        self._io_manager.stop()
+        self._io_manager.join(timeout=5)
+
+    def _churn_step(self):
+        for array in self.arrays:
+            if array.servers:
+                array.churn(self.churn_rate, CHURN_TICK)
+
+    def _schedule_disconnect(self):
+        if self.disconnect_every > 0:
+            self.ioloop.call_later(
+                self._rng.uniform(0.5, 1.5) * self.disconnect_every, self._disconnect)
+
+    def _disconnect(self):
+        array = self._rng.choice(self.arrays)
+        if not array.servers:
+            # still down from the previous disconnect
+            pass
+        elif self.disconnect_mode == "drop":
+            LOGGER.warning("Dropping the client connections of %s" % array.name)
+            array.drop_clients()
+        else:
+            array.stop()
+            if self.disconnect_mode == "move":
+                array.ports = self._take_ports()
+                LOGGER.warning("Moving %s to ports %s,%s in %ss" % (
+                    (array.name,) + array.ports + (self.outage,)))
+            else:
+                LOGGER.warning("Stopping the ports of %s for %ss" % (array.name, self.outage))
+            self.ioloop.call_later(self.outage, array.start)
+        self._schedule_disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a CBF's katcp sensor interface.")
+    parser.add_argument(
+        "--host",
+        dest="host",
+        action="store",
+        default="127.0.0.1",
+        help="Address to listen on [Default: 127.0.0.1]",
+    )
+    parser.add_argument(
+        "--port",
+        dest="port",
+        action="store",
+        default=7147,
+        type=int,
+        help="Primary port, the array and sensor ports follow it [Default: 7147]",
+    )
+    parser.add_argument(
+        "--arrays",
+        dest="arrays",
+        action="store",
+        default=1,
+        type=int,
+        help="Number of arrays [Default: 1]",
+    )
+    parser.add_argument(
+        "--hosts",
+        dest="hosts",
+        action="store",
+        default=4,
+        type=int,
+        help="fhosts, and as many xhosts, per array [Default: 4]",
+    )
+    parser.add_argument(
+        "--size",
+        dest="size",
+        action="store",
+        default=None,
+        choices=list(PRESETS),
+        help="Size the arrays by number of sensors instead of --hosts [Default: None]",
+    )
+    parser.add_argument(
+        "--bad",
+        dest="bad",
+        action="store",
+        default=0.05,
+        type=float,
+        help="Fraction of sensors that start out not nominal [Default: 0.05]",
+    )
+    parser.add_argument(
+        "--churn",
+        dest="churn",
+        action="store",
+        default=1,
+        type=float,
+        help="device-status changes per second per array, 0 for none [Default: 1]",
+    )
+    parser.add_argument(
+        "--latency",
+        dest="latency",
+        action="store",
+        default=0,
+        type=float,
+        help="Answer every request after x seconds [Default: 0]",
+    )
+    parser.add_argument(
+        "--jitter",
+        dest="jitter",
+        action="store",
+        default=0,
+        type=float,
+        help="Add up to x seconds to the latency at random [Default: 0]",
+    )
+    parser.add_argument(
+        "--disconnect-every",
+        dest="disconnect_every",
+        action="store",
+        default=0,
+        type=float,
+        help="Inject a disconnect about every x seconds, 0 for never [Default: 0]",
+    )
+    parser.add_argument(
+        "--disconnect-mode",
+        dest="disconnect_mode",
+        action="store",
+        default="drop",
+        choices=["drop", "outage", "move"],
+        help="Drop an array's client connections, stop its ports for --outage seconds or "
+        "move it to new ports after --outage seconds [Default: drop]",
+    )
+    parser.add_argument(
+        "--outage",
+        dest="outage",
+        action="store",
+        default=10,
+        type=float,
+        help="Seconds an array's ports stay down [Default: 10]",
+    )
+    parser.add_argument(
+        "--seed",
+        dest="seed",
+        action="store",
+        default=1,
+        type=int,
+        help="Random seed of the sensor sets, churn and disconnects [Default: 1]",
+    )
+    parser.add_argument(
+        "--loglevel",
+        dest="log_level",
+        action="store",
+        default="INFO",
+        help="log level to use, default INFO, options INFO, DEBUG, ERROR",
+    )
+
+    argcomplete.autocomplete(parser)
+    args = vars(parser.parse_args())
+    log_level = args.get("log_level", "INFO").upper()
+    try:
+        logging.basicConfig(level=getattr(logging, log_level))
+    except AttributeError:
+        raise RuntimeError("No such log level: %s" % log_level)
+    coloredlogs.install(level=log_level)
+
+    simulator = CBFSimulator(
+        host=args.get("host"),
+        port=args.get("port"),
+        arrays=args.get("arrays"),
+        hosts=PRESETS[args.get("size")] if args.get("size") else args.get("hosts"),
+        bad=args.get("bad"),
+        churn=args.get("churn"),
+        latency=args.get("latency"),
+        jitter=args.get("jitter"),
+        disconnect_every=args.get("disconnect_every"),
+        disconnect_mode=args.get("disconnect_mode"),
+        outage=args.get("outage"),
+        seed=args.get("seed"),
+    )
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    simulator.start()
+    while not stopped.is_set():
+        stopped.wait(1)
+    LOGGER.info("Stopping the simulator")
+    simulator.stop()
@@ -9,10 +9,12 @@ import os
 import socket
 import struct
 import sys
+import threading
 import time
 import types
 import urllib2
-from collections import OrderedDict
+import zlib
+from collections import OrderedDict, namedtuple
 from pprint import PrettyPrinter
 
 import argcomplete
@@ -21,10 +23,19 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 # import flask
-from dash.dependencies import Event, Input, Output
-from flask import send_from_directory
+from dash.dependencies import Event, Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import Response, request, send_from_directory
 
 import Config
+import sensor_changes
+import sensor_events
+import sensor_history
+import shm_transport
+import snapshot_http
+import snapshot_io
+from snapshot_watcher import SnapshotWatcher
+from status_matrix import HealthSummary
 
 pp = PrettyPrinter(indent=4)
 log_level = None
@@ -61,12 +72,32 @@ parser.add_argument(
     default=True,
     help="flask with threading [Default: False]",
 )
+parser.add_argument(
+    "--updates",
+    dest="updates",
+    action="store",
+    default="push",
+    choices=["push", "cells", "full"],
+    help="push: send changed sensors to the browsers as they happen, cells: browsers poll "
+    "for the changed sensors every interval, full: browsers reload the whole table every "
+    "interval [Default: push]",
+)
 parser.add_argument(
     "--path",
     dest="sensor_path",
     action="store",
     default=None,
-    help="path to where the sensor data .json file is!",
+    help="path to where the sensor data .json file, sensor_snapshot.cbfs, sensor_changes.log "
+    "or shared memory sensor_table (poller --shm-dir) is, or the poller's snapshot url "
+    "(poller --http-port), eg: http://127.0.0.1:8080/arrays/array0/snapshot",
+)
+parser.add_argument(
+    "--history",
+    dest="history_path",
+    action="store",
+    default=None,
+    help="the poller's sensor history directory shown on /history [Default: the history next "
+    "to --path]",
 )
 parser.add_argument(
     "--loglevel",
@@ -159,7 +190,7 @@ def add_buttons(child, _id, _status):
     return html.A(_button, id="button", href="/page-2")
 
 
-def generate_line(host):
+def generate_line(sensor_format, host):
     """
     Params
     ======
@@ -174,7 +205,7 @@ def generate_line(host):
     ]
 
 
-def generate_table():
+def generate_table(sensor_format):
     """
     Params
     ======
@@ -183,12 +214,125 @@ def generate_table():
     ======
 
     """
-    return [
-        html.Div(
-            [html.Span(children=i, style={"display": "inline-block"}) for i in generate_line(x)]
-        )
-        for x in sorted(sensor_format.keys())
-    ]
+    return [generate_row(sensor_format, x) for x in sorted(sensor_format.keys())]
+
+
+def generate_row(sensor_format, host):
+    """
+    Params
+    ======
+    sensor_format: dict
+        host rows
+    host: str
+        eg: host00
+
+    Return
+    ======
+    row: html.Div
+        sensor buttons of one host
+    """
+    return html.Div(
+        [
+            html.Span(children=i, style={"display": "inline-block"})
+            for i in generate_line(sensor_format, host)
+        ]
+    )
+
+
+class RowCache(object):
+    """
+    Memoized host rows, a row is only rebuilt when the labels or statuses of its sensors
+    changed. Rows of hosts that are gone are dropped on every update.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self.rebuilt = 0
+
+    @staticmethod
+    def row_key(row):
+        return tuple((i[0], i[-1]) for i in row)
+
+    def generate_table(self, sensor_format, changes=None):
+        """
+        Same as generate_table, reusing the rows that did not change
+
+        Params
+        ======
+        sensor_format: dict
+            {host: [[label, status], ...]}
+        changes: list
+            [(host, index, cell), ...] changed since the last call, only the rows of their
+            hosts are rebuilt [Defaults: None, compare every row]
+        """
+        self.rebuilt = 0
+        if changes is not None and len(self._rows) == len(sensor_format) and all(
+                host in self._rows for host in sensor_format):
+            for host in set(host for host, _, _ in changes):
+                row = sensor_format[host]
+                self._rows[host] = (self.row_key(row), generate_row(sensor_format, host))
+                self.rebuilt += 1
+            return [self._rows[host][1] for host in sorted(self._rows)]
+        rows = {}
+        for host in sensor_format:
+            key = self.row_key(sensor_format[host])
+            cached = self._rows.get(host)
+            if cached is None or cached[0] != key:
+                cached = (key, generate_row(sensor_format, host))
+                self.rebuilt += 1
+            rows[host] = cached
+        self._rows = rows
+        return [rows[host][1] for host in sorted(rows)]
+
+
+class VersionCache(object):
+    """
+    Values computed once per sensor data version and shared by every request, only the
+    latest version is kept
+    """
+
+    def __init__(self):
+        self._version = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, version, key, compute):
+        """
+        Params
+        ======
+        version: int
+            sensor data version
+        key: str
+            eg: page-2
+        compute: callable
+            builds the value on the first request of this version
+
+        Return
+        ======
+        value: object
+        """
+        with self._lock:
+            if version != self._version:
+                self._version, self._values = version, {}
+            if key not in self._values:
+                self._values[key] = compute()
+            return self._values[key]
+
+
+def gzip_compress(data, level=6):
+    """
+    Params
+    ======
+    data: str
+        response body
+
+    Return
+    ======
+    data: str
+        gzip (not just zlib) encoded body
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
 
 
 def get_ip_address(ifname):
@@ -231,14 +375,16 @@ def file_exists(url):
         return False
 
 
-def get_sensors(json_file):
+def get_sensors(json_file, doc="sensor_values"):
     """
-    Read sensor values stored in a json file
+    Read sensor values stored in a json file, or rebuild them from a sensor_changes.log
 
     Params
     ======
     json_file: str
-        json path
+        json or change log path
+    doc: str
+        document to read from a change log, sensor_values or ordered_sensor_values
 
     Return
     ======
@@ -246,11 +392,314 @@ def get_sensors(json_file):
         json dump in a dict format
     """
     logger.info("Reading latest sensor values from %s" % json_file)
+    if json_file.endswith(".log"):
+        state, _seq, _timestamp = sensor_changes.replay(json_file)
+        return state[doc]
     with open(json_file) as json_data:
         data = json.load(json_data)
         return data
 
 
+snapshot_readers = {}
+
+
+def get_snapshot(snapshot_file):
+    """
+    Read a sensor_snapshot.cbfs file written by the poller
+
+    Params
+    ======
+    snapshot_file: str
+        snapshot path
+
+    Return
+    ======
+    snapshot: snapshot_io.Snapshot
+        generation, timestamp and state, None when this generation was already read
+    """
+    reader = snapshot_readers.setdefault(snapshot_file, snapshot_io.SnapshotReader(snapshot_file))
+    snapshot = reader.read()
+    if snapshot is not None:
+        logger.info(
+            "Read snapshot generation %s from %s (sensors read at %s)"
+            % (snapshot.generation, snapshot_file, time.ctime(snapshot.timestamp))
+        )
+    return snapshot
+
+
+shm_readers = {}
+
+
+def get_shm_reader(table_file):
+    """
+    Params
+    ======
+    table_file: str
+        shared memory sensor_table path, eg: /dev/shm/cbf.array0.sensor_table
+
+    Return
+    ======
+    reader: shm_transport.ShmTableReader
+    """
+    return shm_readers.setdefault(table_file, shm_transport.ShmTableReader(table_file))
+
+
+http_readers = {}
+
+
+def get_http_reader(url):
+    """
+    Params
+    ======
+    url: str
+        poller snapshot url, eg: http://127.0.0.1:8080/arrays/array0/snapshot
+
+    Return
+    ======
+    reader: snapshot_http.HttpSnapshotReader
+    """
+    return http_readers.setdefault(url, snapshot_http.HttpSnapshotReader(url))
+
+
+# Everything the pages are rendered from, swapped as a whole when the sensor file changes
+SensorData = namedtuple(
+    "SensorData", ["sensor_format", "ordered_sensor_dict", "timestamp", "version", "changes"]
+)
+
+
+def load_sensor_data(sensor_file):
+    """
+    Read the host rows and the non-nominal sensors from a snapshot, change log or json dump
+
+    Params
+    ======
+    sensor_file: str
+        snapshot url, sensor_table, sensor_snapshot.cbfs, sensor_changes.log or
+        sensor_values.json path
+
+    Return
+    ======
+    sensor_data: SensorData
+        None when the snapshot generation was already read. A snapshot's changes are the
+        cells changed since the previous generation, see StatusMatrix.row_changes
+    """
+    if sensor_file.startswith(("http://", "https://")):
+        # fetched by the watcher's conditional GET
+        snapshot = get_http_reader(sensor_file).snapshot
+        if snapshot is None:
+            return None
+        return SensorData(
+            snapshot.state["sensor_values"],
+            snapshot.state.get("ordered_sensor_values", {}),
+            snapshot.timestamp,
+            snapshot.generation,
+            snapshot.state.get("changes"),
+        )
+    if sensor_file.endswith(".sensor_table"):
+        # mapped, no json parsing of the host rows
+        table = get_shm_reader(sensor_file).read()
+        return SensorData(
+            table.sensor_format, table.ordered_sensor_values, table.timestamp, table.generation,
+            None,
+        )
+    if sensor_file.endswith(".cbfs"):
+        snapshot = get_snapshot(sensor_file)
+        if snapshot is None:
+            return None
+        return SensorData(
+            snapshot.state["sensor_values"],
+            snapshot.state.get("ordered_sensor_values", {}),
+            snapshot.timestamp,
+            snapshot.generation,
+            snapshot.state.get("changes"),
+        )
+    try:
+        if sensor_file.endswith(".log"):
+            ordered_sensor_dict = get_sensors(sensor_file, doc="ordered_sensor_values")
+        else:
+            ordered_sensor_dict = get_sensors(
+                sensor_file.replace("sensor_values.json", "ordered_sensor_values.json")
+            )
+    except Exception:
+        ordered_sensor_dict = {}
+    sensor_format = get_sensors(sensor_file)
+    # no generation in a json dump or change log, the content identifies the version
+    version = hash(json.dumps([sensor_format, ordered_sensor_dict], sort_keys=True))
+    return SensorData(
+        sensor_format, ordered_sensor_dict, os.path.getmtime(sensor_file), version, None)
+
+
+# statuses counted in the health summary, input labels are not sensors
+SUMMARY_STATUSES = ("nominal", "warn", "error", "failure", "unknown", "unreachable", "inactive")
+
+
+def summary_id(group, status):
+    return "health_%s_%s" % (group, status)
+
+
+def health_panel(health_summary):
+    """
+    Params
+    ======
+    health_summary: HealthSummary
+
+    Return
+    ======
+    panel: html.Table
+        cells per status overall, per host type and per stage, every count has an id such
+        that pushed changes can update it in place
+    """
+    return html.Table(
+        [html.Tr([html.Th("")] + [
+            html.Th(status, style=set_style(status)) for status in SUMMARY_STATUSES
+        ])]
+        + [
+            html.Tr([html.Th(group)] + [
+                html.Td(
+                    health_summary.count(group, status),
+                    id=summary_id(group, status),
+                    style={"textAlign": "center"},
+                )
+                for status in SUMMARY_STATUSES
+            ])
+            for group in health_summary.groups
+        ],
+        id="health-summary",
+    )
+
+
+def build_layout(sensor_data, row_cache=None, health_summary=None, changes=None):
+    """
+    Params
+    ======
+    sensor_data: SensorData
+    row_cache: RowCache
+        reuse the rows of hosts that did not change [Defaults: None, build every row]
+    health_summary: HealthSummary
+        counts of sensor_data shown above the table [Defaults: None, no summary]
+    changes: list
+        [(host, index, cell), ...] changed since the row cache was last used
+        [Defaults: None, compare every row]
+
+    Return
+    ======
+    layout: html.Div
+        sensor buttons of every host
+    """
+    return html.Div(
+        [
+            html.H3(
+                "Last Updated: %s" % time.ctime(sensor_data.timestamp),
+                id="last-updated",
+                style={"margin": 0, "color": "green"},
+            ),
+            health_panel(health_summary) if health_summary is not None else html.Div(),
+            html.Div(
+                generate_table(sensor_data.sensor_format)
+                if row_cache is None
+                else row_cache.generate_table(sensor_data.sensor_format, changes)
+            ),
+        ]
+    )
+
+
+DashboardState = namedtuple("DashboardState", ["sensor_data", "layout"])
+dashboard_state = None
+row_cache = RowCache()
+broadcaster = sensor_events.EventBroadcaster()
+health_summary = HealthSummary()
+view_cache = VersionCache()
+
+
+def update_dashboard(sensor_data):
+    """
+    Build the layout of newly loaded sensor data, then swap both in with a single assignment.
+    Every viewer's refresh is served from this one layout until the data changes again.
+    """
+    global dashboard_state
+    if dashboard_state is not None and dashboard_state.sensor_data.version == sensor_data.version:
+        logger.debug("Sensor data version %s already shown" % sensor_data.version)
+        return
+    previous_state = dashboard_state
+    changes = None
+    if previous_state is not None:
+        changes = sensor_events.shipped_changes(
+            previous_state.sensor_data.version, sensor_data.sensor_format, sensor_data.changes
+        )
+        if changes is None:
+            # no changes shipped with the data, or they are not against the shown version
+            changes = sensor_events.cell_changes(
+                previous_state.sensor_data.sensor_format, sensor_data.sensor_format
+            )
+    if changes is None:
+        health_summary.rebuild(sensor_data.sensor_format)
+        counts = None
+    else:
+        # O(changes), the counts move with the status transitions
+        counts = health_summary.update(previous_state.sensor_data.sensor_format, changes)
+    dashboard_state = DashboardState(
+        sensor_data, build_layout(sensor_data, row_cache, health_summary, changes)
+    )
+    publish_changes(sensor_data, changes, counts)
+    logger.info(
+        "Dashboard updated to version %s, rebuilt %s of %s rows (sensors read at %s)"
+        % (
+            sensor_data.version,
+            row_cache.rebuilt,
+            len(sensor_data.sensor_format),
+            time.ctime(sensor_data.timestamp),
+        )
+    )
+
+
+def publish_changes(sensor_data, changes, counts):
+    """
+    Push the buttons and health summary counts that changed to the browsers, or make them
+    reload when the table changed
+
+    Params
+    ======
+    sensor_data: SensorData
+    changes: list
+        [(host, index, cell), ...], None when the table changed
+    counts: dict
+        {(group, status): count} that changed
+    """
+    if changes is None:
+        broadcaster.publish(sensor_data.version, "reload", {})
+        return
+    broadcaster.publish(
+        sensor_data.version,
+        "cells",
+        {
+            "updated": "Last Updated: %s" % time.ctime(sensor_data.timestamp),
+            "cells": [
+                {"id": "id_%s_%s" % (host, _c), "label": cell[0], "style": set_style(cell[-1])}
+                for host, _c, cell in changes
+            ],
+            "counts": dict(
+                (summary_id(group, status), count)
+                for (group, status), count in counts.iteritems()
+                if status in SUMMARY_STATUSES
+            ),
+        },
+    )
+
+
+class SensorDash(dash.Dash):
+    """
+    Dash app that also loads the script applying pushed or polled sensor changes
+    """
+
+    push_script = '<script src="/static/sensor_events.js"></script>'
+
+    def index(self, *args, **kwargs):
+        page = super(SensorDash, self).index(*args, **kwargs)
+        if update_mode == "full":
+            return page
+        return page.replace("</footer>", "%s\n</footer>" % self.push_script)
+
+
 if args.get("log_level", "INFO"):
     log_level = args.get("log_level", "INFO").upper()
     try:
@@ -274,27 +723,53 @@ if not args.get("sensor_path"):
         json_dumps_dir = os.path.join(cur_path + "/json_dumps")
         if not os.path.exists(json_dumps_dir):
             raise AssertionError()
-        sensor_values_json = max(
-            glob.iglob(json_dumps_dir + "/sensor_values.json"), key=os.path.getctime
-        )
+        snapshot_files = glob.glob(json_dumps_dir + "/*.sensor_snapshot.cbfs")
+        if snapshot_files:
+            sensor_values_json = max(snapshot_files, key=os.path.getmtime)
+        else:
+            sensor_values_json = max(
+                glob.iglob(json_dumps_dir + "/sensor_values.json"), key=os.path.getctime
+            )
     except AssertionError:
         logger.error("No json dump file. Exiting!!!")
         sys.exit(1)
 else:
     sensor_values_json = args.get("sensor_path")
 
-try:
-    ordered_sensor_dict = get_sensors(json_dumps_dir + "/ordered_sensor_values.json")
-except Exception:
-    ordered_sensor_dict = {}
 
-sensor_format = get_sensors(sensor_values_json)
+def find_history(sensor_file):
+    """
+    Params
+    ======
+    sensor_file: str
+        eg: json_dumps/<hostname>.array0.sensor_snapshot.cbfs
+
+    Return
+    ======
+    path: str
+        the poller's history directory next to it, None for urls and shared memory tables
+    """
+    directory, name = os.path.split(sensor_file)
+    for suffix in ("sensor_snapshot.cbfs", "sensor_changes.log", "sensor_values.json"):
+        if name.endswith(suffix) and "://" not in sensor_file:
+            return os.path.join(directory, name[:-len(suffix)] + "history")
+    return None
+
+
+history_path = args.get("history_path") or find_history(sensor_values_json)
+sensor_history_store = sensor_history.SensorHistory(history_path) if history_path else None
 host = get_ip_address(args.get("interface"))
 
 title = Config.title
 refresh_time = int(Config.refresh_time)
+update_mode = args.get("updates")
+# Server-Sent Events need a thread per open browser
+if update_mode == "push" and not args.get("threaded"):
+    logger.warning("Pushing sensor changes needs a threaded server, polling every %sms" % (
+        refresh_time))
+    update_mode = "cells"
 
-app = dash.Dash(name=title)
+app = SensorDash(name=title)
 try:
     css_link = Config.css_link
     logger.info("Loading css/js from URL: %s" % css_link)
@@ -314,34 +789,115 @@ app.title = types.StringType(title)
 # metadata = Config.metadata
 # app.meta = types.StringType(metadata)
 
-# HTML Layout
-html_layout = html.Div(
-    [
-        html.H3("Last Updated: %s" % time.ctime(), style={"margin": 0, "color": "green"}),
-        html.Div(generate_table()),
-    ]
-)
+# HTML Layout, rebuilt in-process whenever the poller replaces the sensor file
+if sensor_values_json.startswith(("http://", "https://")):
+    # If-None-Match requests, an unchanged snapshot costs an empty 304
+    sensor_watcher = SnapshotWatcher(
+        sensor_values_json,
+        load_sensor_data,
+        on_change=update_dashboard,
+        change_key=lambda url: get_http_reader(url).poll(),
+    ).start()
+elif sensor_values_json.endswith(".sensor_table"):
+    # writes to a shared memory table do not show up in inotify, poll its seqlock instead
+    sensor_watcher = SnapshotWatcher(
+        sensor_values_json,
+        load_sensor_data,
+        on_change=update_dashboard,
+        interval=0.25,
+        change_key=lambda path: get_shm_reader(path).seq,
+    ).start()
+else:
+    sensor_watcher = SnapshotWatcher(
+        sensor_values_json, load_sensor_data, on_change=update_dashboard
+    ).start()
+if dashboard_state is None:
+    logger.error("Could not read sensor values from %s. Exiting!!!" % sensor_values_json)
+    sys.exit(1)
+
+
+
+def serve_layout():
+    """
+    Page layout, rendered with the latest sensor data on every page load
+    """
+    version = str(dashboard_state.sensor_data.version)
+    if update_mode == "full":
+        updates = [dcc.Interval(id="refresh", interval=refresh_time)]
+    else:
+        # read by static/sensor_events.js, which applies the changes after this version
+        config = {"mode": update_mode, "version": version, "refresh": refresh_time}
+        updates = [
+            html.Div(json.dumps(config), id="sensor-events-config", style={"display": "none"})
+        ]
+    if update_mode == "cells":
+        updates += [
+            dcc.Interval(id="refresh", interval=refresh_time),
+            html.Div(
+                json.dumps({"version": version}), id="cell-updates", style={"display": "none"}
+            ),
+        ]
+    return html.Div(
+        [
+            html.Link(rel="stylesheet", href="/static/stylesheet.css"),
+            html.Div(
+                [
+                    # Each "page" will modify this element
+                    html.Div(id="content-container"),
+                    # This Location component represents the URL bar
+                    dcc.Location(id="url", refresh=False),
+                ]
+            ),
+            html.Div(updates + [html.Div(dashboard_state.layout, id="content")]),
+        ]
+    )
+
+
+app.layout = serve_layout
 
-app.layout = html.Div(
-    [
-        html.Link(rel="stylesheet", href="/static/stylesheet.css"),
-        html.Div(
-            [
-                # Each "page" will modify this element
-                html.Div(id="content-container"),
-                # This Location component represents the URL bar
-                dcc.Location(id="url", refresh=False),
-            ]
-        ),
-        html.Div([dcc.Interval(id="refresh", interval=refresh_time), html.Div(id="content")]),
-    ]
-)
 
-# Update the `content` div with the `layout` object.
-# When you save this file, `debug=True` will re-run this script, serving the new layout
-@app.callback(Output("content", "children"), events=[Event("refresh", "interval")])
 def display_layout():
-    return html_layout
+    return dashboard_state.layout
+
+
+def cell_updates(updates):
+    """
+    The cells that changed since the version in the client's `cell-updates` div, as one
+    compact message applied by static/sensor_events.js
+    """
+    version = json.loads(updates)["version"]
+    update = broadcaster.cells_since(version)
+    if update is None:
+        return json.dumps({"version": broadcaster.version, "reload": True})
+    if update["version"] == version:
+        # nothing changed, dash-renderer keeps the div as it is
+        raise PreventUpdate()
+    return json.dumps(update, separators=(",", ":"))
+
+
+if update_mode == "full":
+    # Update the `content` div with the latest `layout` object on every refresh tick.
+    app.callback(Output("content", "children"), events=[Event("refresh", "interval")])(
+        display_layout
+    )
+elif update_mode == "cells":
+    app.callback(
+        Output("cell-updates", "children"),
+        state=[State("cell-updates", "children")],
+        events=[Event("refresh", "interval")],
+    )(cell_updates)
+
+
+@app.server.route("/events")
+def events():
+    """
+    Server-Sent Events stream of the sensor changes after ?version=
+    """
+    return Response(
+        broadcaster.stream(request.args.get("version", "")),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.server.route("/static/<path:path>")
@@ -351,6 +907,209 @@ def static_file(path):
     return send_from_directory(static_folder, path)
 
 
+def detailed_view(sensor_data):
+    """
+    Params
+    ======
+    sensor_data: SensorData
+
+    Return
+    ======
+    view: html.Div
+        the non-nominal sensors as indented json
+    """
+    try:
+        _sensors = json.dumps(
+            OrderedDict(sensor_data.ordered_sensor_dict),
+            indent=4,
+            sort_keys=True,
+            separators=(",", ": "),
+        )
+    except:
+        _sensors = json.dumps(
+            OrderedDict(sensor_data.sensor_format), indent=4, sort_keys=True, separators=(",", ": ")
+        )
+    return html.Div(
+        [
+            dcc.Link("Sensor history", href="/history"),
+            dcc.Link(html.Pre(_sensors), href="/"),
+            html.Br(),
+        ]
+    )
+
+
+HISTORY_HOURS = 24
+
+
+def history_button(status, label=None):
+    return html.Button(
+        children=label or status, style=set_style(status), type="button", className="btn-xl"
+    )
+
+
+def history_view(history_host=None, hours=HISTORY_HOURS):
+    """
+    Params
+    ======
+    history_host: str
+        show the sensors of this host, eg: xhost12 [Defaults: None, a row per host]
+    hours: int
+        time range [Defaults: 24]
+
+    Return
+    ======
+    view: html.Div
+        the worst status and the number of status changes of every host or sensor
+    """
+    if sensor_history_store is None:
+        return html.Div([dcc.Link("No sensor history, see --history", href="/")])
+    start = time.time() - hours * 3600
+    summary = sensor_history_store.summary(start=start, host=history_host)
+    if history_host is None:
+        hosts = {}
+        for name, sensor in summary.iteritems():
+            hosts.setdefault(sensor_history.sensor_host(name), []).append(sensor)
+        header = ["host", "status", "worst", "changes", "sensors changed", "last change"]
+        rows = [
+            [
+                dcc.Link(_host, href="/history/%s" % _host),
+                history_button(sensor_history.worst_status(sensor.status for sensor in sensors)),
+                history_button(sensor_history.worst_status(sensor.worst for sensor in sensors)),
+                sum(sensor.changes for sensor in sensors),
+                len([sensor for sensor in sensors if sensor.changes]),
+                time.ctime(max(sensor.last_change for sensor in sensors))
+                if any(sensor.changes for sensor in sensors) else "",
+            ]
+            for _host, sensors in sorted(hosts.iteritems())
+        ]
+        title = "Sensor history of the last %s hours" % hours
+    else:
+        history = sensor_history_store.query(start=start, host=history_host)
+        header = ["sensor", "status", "worst", "changes", "last change", "recent changes"]
+        rows = [
+            [
+                name,
+                history_button(sensor.status),
+                history_button(sensor.worst),
+                sensor.changes,
+                time.ctime(sensor.last_change) if sensor.last_change else "",
+                html.Div([
+                    history_button(
+                        point.worst, "%s %s" % (time.strftime("%H:%M", time.localtime(
+                            point.timestamp)), point.status))
+                    for point in history[name][-10:] if point.changes
+                ]),
+            ]
+            for name, sensor in sorted(summary.iteritems())
+        ]
+        title = "Sensor history of %s, last %s hours" % (history_host, hours)
+    return html.Div(
+        [
+            html.H3(title, style={"margin": 0}),
+            dcc.Link("Back", href="/history" if history_host else "/"),
+            html.Table(
+                [html.Tr([html.Th(column) for column in header])]
+                + [html.Tr([html.Td(cell) for cell in row]) for row in rows]
+            ),
+        ]
+    )
+
+
+@app.server.route("/history.json")
+def history_json():
+    """
+    Status changes for scripts, eg: /history.json?host=xhost12&hours=48 or
+    /history.json?sensor=xhost12.xeng0.vacc.device-status&start=1539856800
+    """
+    if sensor_history_store is None:
+        return Response('{"error": "no sensor history"}', status=404, mimetype="application/json")
+    try:
+        end = request.args.get("end", type=float)
+        start = request.args.get("start", type=float)
+        if start is None:
+            start = (end or time.time()) - request.args.get(
+                "hours", HISTORY_HOURS, type=float) * 3600
+        history = sensor_history_store.query(
+            start=start,
+            end=end,
+            sensors=request.args.getlist("sensor") or None,
+            host=request.args.get("host"),
+        )
+    except (IOError, sensor_history.HistoryError) as exc:
+        return Response(json.dumps({"error": str(exc)}), status=500, mimetype="application/json")
+    return Response(
+        json.dumps(history, separators=(",", ":"), sort_keys=True), mimetype="application/json"
+    )
+
+
+@app.server.route("/<any(sensor_values, ordered_sensor_values):doc>.json")
+def raw_sensors(doc):
+    """
+    Latest sensor values as compact json for scripts, with an ETag and Last-Modified, eg:
+    /sensor_values.json (host rows) or /ordered_sensor_values.json (non-nominal sensors)
+    """
+    sensor_data = dashboard_state.sensor_data
+    gzipped = "gzip" in request.headers.get("Accept-Encoding", "").lower()
+
+    def encode():
+        documents = {
+            "sensor_values": sensor_data.sensor_format,
+            "ordered_sensor_values": sensor_data.ordered_sensor_dict,
+        }
+        data = json.dumps(documents[doc], separators=(",", ":"), sort_keys=True)
+        return gzip_compress(data) if gzipped else data
+
+    response = Response(
+        view_cache.get(sensor_data.version, (doc, gzipped), encode), mimetype="application/json"
+    )
+    response.set_etag("%s-%s%s" % (doc, sensor_data.version, "-gzip" if gzipped else ""))
+    response.last_modified = sensor_data.timestamp
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    return response.make_conditional(request)
+
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+)
+
+
+@app.server.after_request
+def compress_response(response):
+    """
+    gzip/deflate compress the Dash callback responses and pages, streamed responses such as
+    /events and the already encoded ones are left alone
+    """
+    accept_encoding = request.headers.get("Accept-Encoding", "").lower()
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < 500:
+        return response
+    if "gzip" in accept_encoding:
+        response.set_data(gzip_compress(data))
+        response.headers["Content-Encoding"] = "gzip"
+    elif "deflate" in accept_encoding:
+        response.set_data(zlib.compress(data))
+        response.headers["Content-Encoding"] = "deflate"
+    else:
+        return response
+    response.vary.add("Accept-Encoding")
+    return response
+
+
 @app.callback(Output("content-container", "children"), [Input("url", "pathname")])
 def display_page(pathname):
     # https://stackoverflow.com/questions/43981275/index-json-files-in-elasticsearch-using-python#43982859
@@ -362,16 +1121,14 @@ def display_page(pathname):
         # return html_layout
         pass
     elif pathname == "/page-2":
-        try:
-            _sensors = json.dumps(
-                OrderedDict(ordered_sensor_dict), indent=4, sort_keys=True, separators=(",", ": ")
-            )
-        except:
-            _sensors = json.dumps(
-                OrderedDict(sensor_format), indent=4, sort_keys=True, separators=(",", ": ")
-            )
-
-        return html.Div([dcc.Link(html.Pre(_sensors), href="/"), html.Br()])
+        sensor_data = dashboard_state.sensor_data
+        return view_cache.get(sensor_data.version, "page-2", lambda: detailed_view(sensor_data))
+    elif pathname == "/history" or (pathname or "").startswith("/history/"):
+        # the poller appends to the history whenever the sensor data changes
+        history_host = pathname[len("/history/"):] or None
+        return view_cache.get(
+            dashboard_state.sensor_data.version, pathname, lambda: history_view(history_host)
+        )
     else:
         return html.Div(
             [
@@ -387,6 +1144,7 @@ if __name__ == "__main__":
         host=host,
         port=args.get("port"),
         debug=args.get("debug"),
-        extra_files=[sensor_values_json],
+        # sensor data is reloaded in-process, restarting on file changes is not needed
+        use_reloader=False,
         threaded=args.get("threaded"),
     )
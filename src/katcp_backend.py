@@ -0,0 +1,511 @@
+"""
+katcp connection backends used by SensorPoll.
+
+blocking: one katcp.BlockingClient (and thread) per connection, requests park the calling
+    thread in blocking_request.
+ioloop: katcp.AsyncClient connections sharing a single tornado ioloop, requests are
+    katcp futures with real timeouts and there are no fixed sleeps on the connect path.
+"""
+
+import atexit
+import logging
+import random
+import threading
+import time
+import weakref
+
+import katcp
+from katcp import ioloop_manager, resource_client
+from tornado import gen
+
+# stopped at exit by a single hook, rather than one per instance that would keep every
+# instance alive, eg: a ConnectionManager per poll cycle of an unreachable array
+_managers = weakref.WeakSet()
+_io_managers = weakref.WeakSet()
+
+
+def _stop_all():
+    for manager in list(_managers):
+        manager.stop()
+    for io_manager in list(_io_managers):
+        io_manager.stop()
+
+
+atexit.register(_stop_all)
+
+
+class SensorSamplingMixin(object):
+    """
+    Hands asynchronous #sensor-status informs over to a callback.
+
+    Informs are received on the client's ioloop thread, the callback should therefore be
+    thread-safe and must not issue blocking requests.
+    """
+
+    def __init__(self, host, port, on_sensor_status=None, on_reconnect=None, **kwargs):
+        super(SensorSamplingMixin, self).__init__(host, port, **kwargs)
+        self._on_sensor_status = on_sensor_status
+        self._on_reconnect = on_reconnect
+        self._was_connected = False
+
+    def inform_sensor_status(self, msg):
+        """#sensor-status timestamp nsensors name status value"""
+        if self._on_sensor_status is not None:
+            self._on_sensor_status(msg.arguments)
+
+    def notify_connected(self, connected):
+        # Sampling strategies are per-connection, they are lost when katcp auto-reconnects
+        if connected and self._was_connected and self._on_reconnect is not None:
+            self._on_reconnect()
+        self._was_connected = self._was_connected or connected
+
+
+class SensorSamplingClient(SensorSamplingMixin, katcp.BlockingClient):
+    pass
+
+
+class AsyncSensorSamplingClient(SensorSamplingMixin, katcp.AsyncClient):
+    pass
+
+
+class BlockingBackend(object):
+    """
+    Thread per connection katcp.BlockingClient backend
+    """
+
+    name = "blocking"
+
+    def connect(self, host, port, timeout=10, **kwargs):
+        """
+        Parameters
+        =========
+        host: str
+            IP to connect to!
+        port: int
+            Port to connect to!
+        timeout: int
+            katcp timeout [Defaults :10]
+        kwargs: dict
+            passed to SensorSamplingClient, eg: on_sensor_status
+
+        Return
+        ======
+        client: SensorSamplingClient
+            connected client
+        """
+        client = SensorSamplingClient(host, port, **kwargs)
+        client.setDaemon(True)
+        client.start()
+        time.sleep(0.1)
+        if not (client.wait_running(timeout) and client.wait_connected(timeout)):
+            client.stop()
+            raise RuntimeError("Timed out connecting to {}:{}".format(host, port))
+        return client
+
+    def request(self, client, katcprequest, args=(), timeout=10):
+        """
+        Return
+        ======
+        reply, informs : tuple
+            katcp request messages
+        """
+        return client.blocking_request(
+            katcp.Message.request(katcprequest, *args), timeout=timeout
+        )
+
+    def requests(self, client, katcprequest, args_list, timeout=10):
+        """
+        Send the requests without waiting for each reply, then wait once for all of them
+
+        Return
+        ======
+        replies: list
+            reply per request in args_list order, None when it did not arrive in time
+        """
+        replies = [None] * len(args_list)
+        pending = [len(args_list)]
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def reply_cb(msg, index):
+            replies[index] = msg
+            with lock:
+                pending[0] -= 1
+                if not pending[0]:
+                    done.set()
+
+        if not args_list:
+            return replies
+        for index, args in enumerate(args_list):
+            # a request that times out is replied to with a fail by katcp
+            client.callback_request(
+                katcp.Message.request(katcprequest, *args), reply_cb=reply_cb,
+                user_data=(index,), timeout=timeout)
+        done.wait(timeout + 1)
+        return replies
+
+    def stop(self, client):
+        client.stop()
+
+
+class IOLoopBackend(object):
+    """
+    Non-blocking katcp.AsyncClient backend, every connection in the process shares one
+    tornado ioloop thread. Use IOLoopBackend.shared() to get the process-wide instance.
+    """
+
+    name = "ioloop"
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self.io_manager = ioloop_manager.IOLoopManager()
+        self.io_manager.setDaemon(True)
+        self.ioloop = self.io_manager.get_ioloop()
+        self.io_manager.start()
+        self.io_wrapper = resource_client.IOLoopThreadWrapper(self.ioloop)
+        _io_managers.add(self.io_manager)
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _call(self, wait_time, func, *args, **kwargs):
+        # Run func on the ioloop and wait up to wait_time for its (future) result
+        return self.io_wrapper.call_in_ioloop(func, args, kwargs, timeout=wait_time)
+
+    def connect(self, host, port, timeout=10, **kwargs):
+        """
+        Same as BlockingBackend.connect, returns once the katcp protocol info was received
+        """
+        client = AsyncSensorSamplingClient(host, port, **kwargs)
+        client.set_ioloop(self.ioloop)
+        client.start()
+        try:
+            self._call(timeout, client.until_protocol, timeout=timeout)
+        except Exception:
+            client.stop()
+            raise RuntimeError("Timed out connecting to {}:{}".format(host, port))
+        return client
+
+    def request(self, client, katcprequest, args=(), timeout=10):
+        """
+        Return
+        ======
+        reply, informs : tuple
+            katcp request messages
+        """
+        # the extra second lets the katcp request timeout fire before ours does
+        return self._call(
+            timeout + 1,
+            client.future_request,
+            katcp.Message.request(katcprequest, *args),
+            timeout=timeout,
+        )
+
+    def requests(self, client, katcprequest, args_list, timeout=10):
+        """
+        Same as BlockingBackend.requests
+        """
+
+        @gen.coroutine
+        def send_all():
+            results = yield [
+                client.future_request(katcp.Message.request(katcprequest, *args), timeout=timeout)
+                for args in args_list
+            ]
+            raise gen.Return([reply for reply, _ in results])
+
+        return self._call(timeout + 1, send_all)
+
+    def stop(self, client):
+        client.stop()
+
+
+class Backoff(object):
+    """
+    Jittered exponential backoff, capped at a maximum delay
+
+    Params
+    ======
+    initial: float
+        first delay in seconds [Defaults: 0.5]
+    maximum: float
+        cap on the delay in seconds [Defaults: 60]
+    factor: float
+        delay multiplier per failed attempt [Defaults: 2]
+    jitter: float
+        fraction of the delay that is randomised, such that many pollers do not
+        reconnect in lockstep [Defaults: 0.5]
+    """
+
+    def __init__(self, initial=0.5, maximum=60, factor=2, jitter=0.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
+
+
+class ConnectionDown(Exception):
+    """
+    A managed katcp connection is down and its next reconnect attempt is not due yet
+    """
+
+
+class ManagedConnection(object):
+    """
+    State and metrics of one named katcp connection
+    """
+
+    def __init__(self, name, port, backoff):
+        self.name = name
+        self.port = port
+        self.backoff = backoff
+        self.client = None
+        self.state = "connecting"
+        # time of the last state change
+        self.since = time.time()
+        self.next_attempt = 0
+        self.connects = 0
+        self.failures = 0
+        # seconds spent disconnected, excluding the current outage
+        self.downtime = 0.0
+        self.last_error = None
+
+    @property
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected()
+
+    @property
+    def blind_time(self):
+        """
+        Seconds since the connection went down, 0 while connected
+        """
+        return 0.0 if self.state == "connected" else time.time() - self.since
+
+    def metrics(self):
+        return {
+            "port": self.port,
+            "state": self.state,
+            "since": self.since,
+            "connects": self.connects,
+            "failures": self.failures,
+            # consecutive failed attempts of the current outage
+            "attempts": self.backoff.attempts,
+            "blind_time": self.blind_time,
+            "downtime": self.downtime + (self.blind_time if self.connects else 0.0),
+            "next_attempt": self.next_attempt,
+            "last_error": self.last_error,
+        }
+
+
+class ConnectionManager(object):
+    """
+    Named katcp connections, eg: primary, array and sensor port. Each connection is
+    reconnected on its own, with jittered exponential backoff between failed attempts,
+    so a dropped sensor port does not tear down the others.
+
+    Params
+    ======
+    backend: BlockingBackend or IOLoopBackend
+        katcp backend used to connect
+    host: str
+        IP to connect to!
+    timeout: int
+        katcp timeout [Defaults :10]
+    initial_delay: float
+        first reconnect delay in seconds [Defaults: 0.5]
+    max_delay: float
+        cap on the reconnect delay in seconds [Defaults: 60]
+    on_restored: callable
+        called with the connection name after a dropped connection was re-established
+    connect_kwargs: dict
+        passed to backend.connect, eg: on_sensor_status
+    """
+
+    def __init__(
+        self, backend, host, timeout=10, initial_delay=0.5, max_delay=60, on_restored=None,
+        **connect_kwargs
+    ):
+        self.backend = backend
+        self.host = host
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.on_restored = on_restored
+        self.connect_kwargs = connect_kwargs
+        self.logger = logging.getLogger(__name__)
+        self._connections = {}
+        self._lock = threading.RLock()
+        _managers.add(self)
+
+    def __contains__(self, name):
+        return name in self._connections
+
+    def connect(self, name, port, attempts=None):
+        """
+        Connect a named connection, sleeping through the backoff between failed attempts.
+        A connection that is already connected to the port is kept.
+
+        Params
+        ======
+        name: str
+            connection name, eg: sensor
+        port: int
+            Port to connect to!
+        attempts: int
+            give up after x failed attempts [Defaults: None, keep trying]
+
+        Return
+        ======
+        client: katcp.client.DeviceClient
+        """
+        while True:
+            with self._lock:
+                conn = self._connections.get(name)
+                if conn is None or conn.port != port:
+                    self._stop(conn)
+                    conn = ManagedConnection(
+                        name, port, Backoff(self.initial_delay, self.max_delay))
+                    self._connections[name] = conn
+                elif conn.is_connected:
+                    return conn.client
+                try:
+                    return self._attempt(conn)
+                except ConnectionDown:
+                    if attempts is not None and conn.backoff.attempts >= attempts:
+                        raise
+                    delay = max(0, conn.next_attempt - time.time())
+            # without the lock, such that metrics and stop are not held up by the backoff
+            time.sleep(delay)
+
+    def get(self, name):
+        """
+        Connected client of a named connection, reconnecting it if its next attempt is due
+
+        Raises
+        ======
+        ConnectionDown: the connection is down and could not be re-established
+        """
+        with self._lock:
+            conn = self._connections[name]
+            if conn.is_connected:
+                return conn.client
+            if conn.state == "connected":
+                self._mark_down(conn, "connection lost")
+            if time.time() < conn.next_attempt:
+                raise ConnectionDown(
+                    "{} connection to {}:{} down for {:.1f}s, next attempt in {:.1f}s".format(
+                        name, self.host, conn.port, conn.blind_time,
+                        conn.next_attempt - time.time()))
+            return self._attempt(conn)
+
+    def check(self, client):
+        """
+        Mark the connection owning a client as down if the client lost its connection
+        """
+        with self._lock:
+            for conn in self._connections.values():
+                if conn.client is client and conn.state == "connected" and not conn.is_connected:
+                    self._mark_down(conn, "connection lost")
+
+    def _attempt(self, conn):
+        self._stop(conn)
+        try:
+            conn.client = self.backend.connect(
+                self.host, conn.port, timeout=self.timeout, **self.connect_kwargs)
+        except Exception as exc:
+            conn.client = None
+            conn.failures += 1
+            conn.last_error = str(exc)
+            delay = conn.backoff.next_delay()
+            conn.next_attempt = time.time() + delay
+            if conn.state == "connected":
+                self._mark_down(conn, str(exc))
+            raise ConnectionDown(
+                "Could not connect {} to {}:{}, retrying in {:.1f}s".format(
+                    conn.name, self.host, conn.port, delay))
+        reconnected = conn.connects > 0
+        if reconnected:
+            conn.downtime += conn.blind_time
+            self.logger.warning(
+                "%s connection to %s:%s restored after %.1fs blind" % (
+                    conn.name, self.host, conn.port, conn.blind_time))
+        conn.connects += 1
+        conn.state = "connected"
+        conn.since = time.time()
+        conn.backoff.reset()
+        if reconnected and self.on_restored is not None:
+            self.on_restored(conn.name)
+        return conn.client
+
+    def _mark_down(self, conn, reason):
+        self.logger.error(
+            "%s connection to %s:%s down: %s" % (conn.name, self.host, conn.port, reason))
+        conn.state = "down"
+        conn.since = time.time()
+        conn.last_error = reason
+
+    def _stop(self, conn):
+        if conn is not None and conn.client is not None:
+            try:
+                self.backend.stop(conn.client)
+            except Exception:
+                pass
+            conn.client = None
+
+    def stop(self, name=None):
+        """
+        Stop one or all connections
+        """
+        with self._lock:
+            for conn in self._connections.values():
+                if name is None or conn.name == name:
+                    self._stop(conn)
+
+    def metrics(self):
+        """
+        Connection state metrics, eg: how long each connection has been blind
+
+        Return
+        ======
+        metrics: dict
+            {name: {'state': 'connected', 'blind_time': 0.0, 'downtime': 12.3, ...}}
+        """
+        with self._lock:
+            return dict((name, conn.metrics()) for name, conn in self._connections.items())
+
+
+BACKENDS = {
+    BlockingBackend.name: BlockingBackend,
+    IOLoopBackend.name: IOLoopBackend.shared,
+}
+
+
+def get_backend(name="blocking"):
+    """
+    Params
+    ======
+    name: str
+        blocking or ioloop
+
+    Return
+    ======
+    backend: BlockingBackend or IOLoopBackend
+    """
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError("No such katcp backend: %s, options %s" % (name, ", ".join(BACKENDS)))
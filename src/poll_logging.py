@@ -0,0 +1,269 @@
+"""
+Logging for the sensor poller, configured once and kept off the poll cycle.
+
+Records are put on a queue by a QueueHandler on the root logger and formatted and written
+by a listener thread, so a slow terminal or a storm of errors does not stall a poll cycle.
+Repeated identical warnings and errors are rate limited before they are queued, and loggers
+are created once per class.
+
+Usage
+=====
+    configure_logging("DEBUG")
+
+    class SensorPoll(LoggingClass):
+        def poll(self):
+            self.logger.debug("Polled %s sensors", count)
+"""
+
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+
+import coloredlogs
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    # python 2, the handlers were added in python 3.2
+    QueueHandler = QueueListener = None
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+LOG_FORMAT = (
+    "%(asctime)s - %(name)s - %(levelname)s - %(module)s - %(pathname)s : %(lineno)d - "
+    "%(message)s"
+)
+# records waiting for the listener, beyond this they are dropped rather than block
+QUEUE_SIZE = 10000
+
+if QueueHandler is None:
+
+    class QueueHandler(logging.Handler):
+        """
+        Put records on a queue, see logging.handlers.QueueHandler in python 3
+        """
+
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def enqueue(self, record):
+            self.queue.put_nowait(record)
+
+        def prepare(self, record):
+            self.format(record)
+            record.msg = record.message
+            record.args = None
+            record.exc_info = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.enqueue(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        """
+        Hand the records on a queue to handlers in a thread, see
+        logging.handlers.QueueListener in python 3
+        """
+
+        _sentinel = None
+
+        def __init__(self, queue, *handlers, **kwargs):
+            self.queue = queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get("respect_handler_level", False)
+            self._thread = None
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor, name="QueueListener")
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+        def handle(self, record):
+            for handler in self.handlers:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+
+        def _monitor(self):
+            while True:
+                record = self.queue.get()
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+
+        def enqueue_sentinel(self):
+            self.queue.put_nowait(self._sentinel)
+
+        def stop(self):
+            self.enqueue_sentinel()
+            self._thread.join()
+            self._thread = None
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread and drops records rather than
+    block when the queue is full
+
+    The records stay in this process, so their arguments and tracebacks need not be
+    formatted before they are queued.
+    """
+
+    def __init__(self, queue):
+        QueueHandler.__init__(self, queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through the first of a run of identical warnings and errors per interval, the next
+    one let through says how many were suppressed
+
+    Params
+    ======
+    interval: float
+        seconds to suppress a repeated message for [Defaults: 60]
+    level: int
+        only records at this level and above are rate limited [Defaults: logging.WARNING]
+    """
+
+    # forget messages not seen for an interval once this many are tracked
+    MAX_TRACKED = 1000
+
+    def __init__(self, interval=60, level=logging.WARNING):
+        logging.Filter.__init__(self)
+        self.interval = interval
+        self.level = level
+        # (logger, level, message) -> [time let through, suppressed since]
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.time()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and now - seen[0] < self.interval:
+                seen[1] += 1
+                return False
+            if len(self._seen) >= self.MAX_TRACKED:
+                self._seen = dict(
+                    (_key, _seen) for _key, _seen in self._seen.items()
+                    if now - _seen[0] < self.interval
+                )
+            self._seen[key] = [now, 0]
+        if seen is not None and seen[1]:
+            record.msg = "%s (repeated %d times in the last %.1fs)" % (
+                record.getMessage(), seen[1], now - seen[0])
+            record.args = None
+        return True
+
+
+_lock = threading.Lock()
+_listener = None
+_loggers = {}
+
+
+def configure_logging(level="INFO", fmt=None, rate_limit=60):
+    """
+    Configure the root logger once: records are queued, rate limited and written to stderr
+    by a listener thread. Later calls only change the level.
+
+    Params
+    ======
+    level: str
+        eg: INFO, DEBUG, ERROR [Defaults: INFO]
+    fmt: str
+        log format [Defaults: LOG_FORMAT when debugging, else the coloredlogs format]
+    rate_limit: float
+        seconds to suppress repeated identical warnings and errors for, 0 to log all of
+        them [Defaults: 60]
+
+    Raises
+    ======
+    RuntimeError: no such log level
+    """
+    global _listener
+    try:
+        level = getattr(logging, level.upper())
+    except AttributeError:
+        raise RuntimeError("No such log level: %s" % level)
+    root = logging.getLogger()
+    with _lock:
+        root.setLevel(level)
+        if _listener is not None:
+            return
+        if fmt is None:
+            fmt = LOG_FORMAT if level == logging.DEBUG else coloredlogs.DEFAULT_LOG_FORMAT
+        stream_handler = logging.StreamHandler()
+        # %(hostname)s and %(programname)s of the coloredlogs format
+        coloredlogs.HostNameFilter.install(handler=stream_handler, fmt=fmt)
+        coloredlogs.ProgramNameFilter.install(handler=stream_handler, fmt=fmt)
+        if coloredlogs.terminal_supports_colors(stream_handler.stream):
+            stream_handler.setFormatter(coloredlogs.ColoredFormatter(fmt=fmt))
+        else:
+            stream_handler.setFormatter(logging.Formatter(fmt))
+        records = queue.Queue(QUEUE_SIZE)
+        queue_handler = LazyQueueHandler(records)
+        if rate_limit:
+            queue_handler.addFilter(RateLimitFilter(rate_limit))
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        _listener = QueueListener(records, stream_handler)
+        _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Write the queued records and stop the listener thread
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name):
+    """
+    Cached logger, configures logging with the defaults if nobody did
+    """
+    try:
+        return _loggers[name]
+    except KeyError:
+        if _listener is None:
+            configure_logging()
+        return _loggers.setdefault(name, logging.getLogger(name))
+
+
+class LoggingClass(object):
+    @property
+    def logger(self):
+        cls = self.__class__
+        try:
+            return cls.__dict__["_logger"]
+        except KeyError:
+            cls._logger = get_logger(".".join([os.path.basename(sys.argv[0]), cls.__name__]))
+            return cls._logger
@@ -0,0 +1,350 @@
+"""
+Poller health metrics: per-stage timings, katcp request round trips, inform counts, payload
+sizes and cycle lag against the poll time.
+
+Metrics are Prometheus style histograms, counters and gauges keyed by their labels, eg:
+sensor_poll_stage_seconds{array="array0",stage="map"}. They are rendered in the Prometheus
+text exposition format or as JSON, see snapshot_http for the /metrics and /metrics.json
+endpoints, and summarised per window for the log.
+"""
+
+import bisect
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+# seconds, katcp round trips of a small array up to full cycles of a large one
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name: (type, help)
+METRICS = OrderedDict([
+    ("sensor_poll_cycle_seconds", ("histogram", "Duration of a poll cycle of all arrays")),
+    ("sensor_poll_cycles_total", ("counter", "Poll cycles run")),
+    ("sensor_poll_cycle_overruns_total", ("counter", "Poll cycles that took longer than the "
+                                                     "poll time")),
+    ("sensor_poll_cycle_lag_seconds", ("gauge", "Seconds the last poll cycle started after "
+                                                "its deadline")),
+    ("sensor_poll_missed_cycles_total", ("counter", "Poll cycle deadlines skipped because a "
+                                                    "cycle overran them")),
+    ("sensor_poll_period_seconds", ("gauge", "Current target seconds between poll cycles")),
+    ("sensor_poll_stage_seconds", ("histogram", "Duration of a poll cycle stage of an array")),
+    ("sensor_poll_request_seconds", ("histogram", "Round trip of a katcp request")),
+    ("sensor_poll_requests_total", ("counter", "katcp requests sent")),
+    ("sensor_poll_informs_total", ("counter", "Informs received in katcp request replies")),
+    ("sensor_poll_informs", ("gauge", "Informs received in the last reply to a katcp request")),
+    ("sensor_poll_payload_bytes", ("gauge", "Size of the last written document")),
+    ("sensor_poll_written_bytes_total", ("counter", "Bytes written per document")),
+    ("sensor_poll_connection_up", ("gauge", "1 while a katcp connection is connected")),
+    ("sensor_poll_connection_blind_seconds", ("gauge", "Seconds since a katcp connection went "
+                                                       "down, 0 while connected")),
+    ("sensor_poll_connection_connects_total", ("counter", "Successful katcp connects")),
+    ("sensor_poll_connection_failures_total", ("counter", "Failed katcp connect attempts")),
+])
+
+
+def format_labels(labels):
+    """
+    eg: (('array', 'array0'), ('stage', 'map')) -> {array="array0",stage="map"}
+    """
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+            "\n", "\\n"))
+        for key, value in labels
+    )
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+    """
+    Params
+    ======
+    buckets: tuple
+        sorted upper bounds, the +Inf bucket is implied [Defaults: TIME_BUCKETS]
+    """
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Return
+        ======
+        buckets: list
+            [(upper bound, observations <= upper bound), ..., (inf, count)]
+        """
+        total = 0
+        buckets = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+
+class PollMetrics(object):
+    """
+    Thread safe metrics of a poller, shared by the pollers of every array
+
+    Params
+    ======
+    poll_time: float
+        target seconds between the starts of two poll cycles, for the overruns
+        [Defaults: None]
+    connections: callable
+        returns the connection metrics, see MultiArrayPoll.connection_metrics, read when
+        the metrics are rendered [Defaults: None]
+    """
+
+    def __init__(self, poll_time=None, connections=None):
+        self.poll_time = poll_time
+        self.connections = connections
+        self._lock = threading.Lock()
+        # (name, labels) -> Histogram, counter or gauge value
+        self._values = {}
+        # (name, labels) -> [count, sum, max] since the last summary
+        self._window = {}
+        self._window_start = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = Histogram()
+            histogram.observe(value)
+            window = self._window.setdefault(key, [0, 0.0, 0.0])
+            window[0] += 1
+            window[1] += value
+            window[2] = max(window[2], value)
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    @contextmanager
+    def timer(self, array, stage):
+        """
+        Time a stage of an array's poll cycle, failed stages included
+
+        eg: with metrics.timer('array0', 'map'): ...
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe("sensor_poll_stage_seconds", time.time() - started,
+                         array=array, stage=stage)
+
+    def request(self, array, request, seconds, informs):
+        """
+        Record the round trip of a katcp request and the informs of its reply
+        """
+        self.observe("sensor_poll_request_seconds", seconds, array=array, request=request)
+        self.increment("sensor_poll_requests_total", array=array, request=request)
+        self.increment("sensor_poll_informs_total", informs, array=array, request=request)
+        self.set("sensor_poll_informs", informs, array=array, request=request)
+
+    def payload(self, array, document, size):
+        """
+        Record the size of a written document, eg: sensor_values.json
+        """
+        self.set("sensor_poll_payload_bytes", size, array=array, document=document)
+        self.increment("sensor_poll_written_bytes_total", size, array=array, document=document)
+
+    def cycle(self, started, seconds):
+        """
+        Record a poll cycle of all arrays
+
+        Params
+        ======
+        started: float
+            time the cycle started
+        seconds: float
+            duration of the cycle
+        """
+        self.observe("sensor_poll_cycle_seconds", seconds)
+        self.increment("sensor_poll_cycles_total")
+        if self.poll_time is not None and seconds > self.poll_time:
+            self.increment("sensor_poll_cycle_overruns_total")
+
+    def schedule(self, period, lag, missed):
+        """
+        Record the deadline of the next poll cycle, see poll_scheduler.PollScheduler
+
+        Params
+        ======
+        period: float
+            current target seconds between poll cycles
+        lag: float
+            seconds the cycle started after its deadline
+        missed: int
+            deadlines skipped before it
+        """
+        self.poll_time = period
+        self.set("sensor_poll_period_seconds", period)
+        self.set("sensor_poll_cycle_lag_seconds", lag)
+        if missed:
+            self.increment("sensor_poll_missed_cycles_total", missed)
+
+    def _connection_values(self):
+        if self.connections is None:
+            return []
+        metrics = self.connections()
+        arrays = metrics.pop("arrays", {})
+        connections = [("", name, conn) for name, conn in metrics.items()] + [
+            (array, name, conn)
+            for array, array_metrics in arrays.items()
+            for name, conn in array_metrics.items()
+        ]
+        values = []
+        for array, name, conn in connections:
+            labels = (("array", array), ("connection", name))
+            values.extend([
+                (("sensor_poll_connection_up", labels), int(conn["state"] == "connected")),
+                (("sensor_poll_connection_blind_seconds", labels), conn["blind_time"]),
+                (("sensor_poll_connection_connects_total", labels), conn["connects"]),
+                (("sensor_poll_connection_failures_total", labels), conn["failures"]),
+            ])
+        return values
+
+    def _snapshot(self):
+        """
+        {name: [(labels, value or Histogram copy), ...]} in METRICS order
+        """
+        with self._lock:
+            values = []
+            for key, value in self._values.items():
+                if isinstance(value, Histogram):
+                    copy = Histogram(value.buckets)
+                    copy.counts, copy.sum, copy.count = list(value.counts), value.sum, value.count
+                    value = copy
+                values.append((key, value))
+        values.extend(self._connection_values())
+        by_name = defaultdict(list)
+        for (name, labels), value in values:
+            by_name[name].append((labels, value))
+        return OrderedDict(
+            (name, sorted(by_name[name])) for name in METRICS if name in by_name
+        )
+
+    def render(self):
+        """
+        Return
+        ======
+        text: str
+            metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, values in self._snapshot().iteritems():
+            metric_type, help_text = METRICS[name]
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            for labels, value in values:
+                if not isinstance(value, Histogram):
+                    lines.append("%s%s %s" % (name, format_labels(labels), format_value(value)))
+                    continue
+                for bound, count in value.cumulative():
+                    lines.append("%s_bucket%s %s" % (
+                        name, format_labels(labels + (("le", format_value(bound)),)), count))
+                lines.append("%s_sum%s %s" % (name, format_labels(labels), repr(value.sum)))
+                lines.append("%s_count%s %s" % (name, format_labels(labels), value.count))
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self):
+        """
+        Return
+        ======
+        metrics: dict
+            {name: [{"labels": {...}, "value": ...}, ...]}, histograms as
+            {"count": ..., "sum": ..., "buckets": {"0.005": count <= 0.005, ...}}
+        """
+        metrics = {}
+        for name, values in self._snapshot().iteritems():
+            metrics[name] = []
+            for labels, value in values:
+                if isinstance(value, Histogram):
+                    value = {
+                        "count": value.count,
+                        "sum": value.sum,
+                        "buckets": OrderedDict(
+                            (format_value(bound), count) for bound, count in value.cumulative()
+                        ),
+                    }
+                metrics[name].append({"labels": dict(labels), "value": value})
+        return metrics
+
+    def summary(self):
+        """
+        Mean and max of every timing since the last summary, and the informs and payload
+        sizes of the last cycle. Starts a new window.
+
+        Return
+        ======
+        summary: str
+            eg: '12 cycles in 60s, cycle 0.412s/0.530s avg/max, lag 0.000s, 0 overruns,
+            0 missed, period 5s;
+            array0: read 0.101s/0.130s, parse 0.052s/0.061s, ...'
+        """
+        with self._lock:
+            window, self._window = self._window, {}
+            elapsed = time.time() - self._window_start
+            self._window_start = time.time()
+            values = dict(self._values)
+
+        def timing(key):
+            count, total, maximum = window[key]
+            return "%.3fs/%.3fs" % (total / count, maximum)
+
+        cycles = window.get(("sensor_poll_cycle_seconds", ()))
+        parts = ["%d cycles in %.0fs" % (cycles[0] if cycles else 0, elapsed)]
+        if cycles:
+            parts.append("cycle %s avg/max" % timing(("sensor_poll_cycle_seconds", ())))
+        if ("sensor_poll_cycle_lag_seconds", ()) in values:
+            parts.append("lag %.3fs" % values[("sensor_poll_cycle_lag_seconds", ())])
+        parts.append("%d overruns" % values.get(("sensor_poll_cycle_overruns_total", ()), 0))
+        parts.append("%d missed" % values.get(("sensor_poll_missed_cycles_total", ()), 0))
+        if ("sensor_poll_period_seconds", ()) in values:
+            parts.append("period %gs" % values[("sensor_poll_period_seconds", ())])
+
+        arrays = defaultdict(list)
+        for key in sorted(window):
+            name, labels = key
+            labels = dict(labels)
+            if name == "sensor_poll_stage_seconds":
+                arrays[labels["array"]].append("%s %s" % (labels["stage"], timing(key)))
+            elif name == "sensor_poll_request_seconds":
+                informs = values.get(("sensor_poll_informs", key[1]), 0)
+                arrays[labels["array"]].append("?%s %s x%d, %d informs" % (
+                    labels["request"], timing(key), window[key][0], informs))
+        for (name, labels), value in sorted(values.items()):
+            if name == "sensor_poll_payload_bytes":
+                labels = dict(labels)
+                arrays[labels["array"]].append("%s %dkB" % (labels["document"], value // 1024))
+        summary = ", ".join(parts)
+        for array in sorted(arrays):
+            summary += "; %s: %s" % (array or "primary", ", ".join(arrays[array]))
+        return summary
@@ -0,0 +1,118 @@
+"""
+Fixed-rate poll cycle deadlines.
+
+Cycles start on deadlines a period apart, from when the scheduler started, rather than a
+period after the previous cycle finished, so the poll period does not drift with the time
+a cycle takes. A cycle that overruns its deadlines does not queue them up: the next cycle
+starts straight away and the deadlines it skipped are counted as missed.
+
+In adaptive mode the period follows the array's health: the fast period while statuses are
+changing or a host is failing, the slow heartbeat period once everything has been quiet
+for a while and the normal period in between.
+"""
+
+import time
+
+
+class PollScheduler(object):
+    """
+    Params
+    ======
+    period: float
+        seconds between poll cycles
+    adaptive: bool
+        adapt the period to the array's health [Defaults: False]
+    fast_period: float
+        period while statuses are changing or a host is failing [Defaults: period / 2]
+    slow_period: float
+        heartbeat period once quiet [Defaults: 6 x period]
+    quiet_time: float
+        seconds without changes or failing hosts before slowing down to the heartbeat
+        [Defaults: 300]
+    """
+
+    def __init__(self, period, adaptive=False, fast_period=None, slow_period=None,
+                 quiet_time=300, clock=time.time, sleep=time.sleep):
+        self.period = period
+        self.adaptive = adaptive
+        self.fast_period = fast_period or period / 2.0
+        self.slow_period = slow_period or period * 6
+        self.quiet_time = quiet_time
+        self._clock = clock
+        self._sleep = sleep
+        self.deadline = None
+        self.current_period = period
+        self.missed = 0
+        # seconds the current cycle started after its deadline
+        self.lag = 0.0
+        self._last_active = clock()
+
+    def period_for(self, active, now):
+        """
+        Params
+        ======
+        active: bool
+            statuses changed or a host is failing in the last cycle
+
+        Return
+        ======
+        period: float
+            period until the next deadline
+        """
+        if not self.adaptive:
+            return self.period
+        if active:
+            self._last_active = now
+            return self.fast_period
+        if now - self._last_active >= self.quiet_time:
+            return self.slow_period
+        return self.period
+
+    def wait(self, active=False, wake=None):
+        """
+        Sleep until the next cycle's deadline, the first cycle starts straight away
+
+        Params
+        ======
+        active: bool
+            statuses changed or a host is failing in the last cycle
+        wake: callable
+            in adaptive mode, checked every fast period while waiting for a slower deadline,
+            eg: sensor-sampling pushed a status change. When true the cycle starts on the
+            fast deadline [Defaults: None]
+
+        Return
+        ======
+        missed: int
+            deadlines skipped because the last cycle overran them
+        """
+        now = self._clock()
+        if self.deadline is None:
+            self.deadline = now
+            return 0
+        period = self.current_period = self.period_for(active, now)
+        deadline = self.deadline + period
+        missed = 0
+        if now > deadline:
+            # start straight away, on the last deadline that passed
+            missed = int((now - deadline) // period)
+            deadline += missed * period
+        else:
+            fast_deadline = self.deadline + self.fast_period
+            # a fixed-rate schedule is not pulled forward
+            wake = wake if self.adaptive else None
+            while now < deadline:
+                if wake is not None and period > self.fast_period and wake():
+                    deadline = max(fast_deadline, now)
+                    self.current_period = self.fast_period
+                    if now >= deadline:
+                        break
+                step = deadline - now
+                if wake is not None and period > self.fast_period:
+                    step = min(step, self.fast_period)
+                self._sleep(step)
+                now = self._clock()
+        self.deadline = deadline
+        self.lag = max(now - deadline, 0.0)
+        self.missed += missed
+        return missed
@@ -0,0 +1,257 @@
+"""
+Append-only change log of the poller's sensor documents.
+
+Every line of a change log is a compact json record:
+
+checkpoint: {"type": "checkpoint", "seq": 0, "timestamp": ..., "state": {doc: {host: row}}}
+    The full state, always the first record of the log.
+delta: {"type": "delta", "seq": 1, "timestamp": ..., "set": {doc: {host: row}},
+        "del": {doc: [host, ...]}}
+    Only the hosts whose rows changed since the previous record.
+
+A new checkpoint replaces the log (temp file + rename), so a consumer rebuilds the latest
+state by applying the deltas to the checkpoint on the first line, see `replay`, or keeps
+following the log with a `ChangeLogReader`.
+"""
+
+import json
+import logging
+import os
+import time
+
+CHECKPOINT = "checkpoint"
+DELTA = "delta"
+
+
+def diff_documents(previous, current):
+    """
+    Hosts added, changed or removed between two states
+
+    Params
+    ======
+    previous: dict
+        {doc: {host: row}}
+    current: dict
+        {doc: {host: row}}
+
+    Return
+    ======
+    changed, removed: tuple
+        {doc: {host: row}}, {doc: [host, ...]}, docs without changes are left out
+    """
+    changed = {}
+    removed = {}
+    for doc, rows in current.iteritems():
+        old_rows = previous.get(doc, {})
+        _changed = dict(
+            (host, row) for host, row in rows.iteritems() if old_rows.get(host) != row
+        )
+        _removed = sorted(host for host in old_rows if host not in rows)
+        if _changed:
+            changed[doc] = _changed
+        if _removed:
+            removed[doc] = _removed
+    for doc, old_rows in previous.iteritems():
+        if doc not in current and old_rows:
+            removed[doc] = sorted(old_rows)
+    return changed, removed
+
+
+def apply_record(state, record):
+    """
+    Apply a change log record to a state in place
+
+    Params
+    ======
+    state: dict
+        {doc: {host: row}}
+    record: dict
+        checkpoint or delta record
+
+    Return
+    ======
+    state: dict
+    """
+    if record["type"] == CHECKPOINT:
+        state.clear()
+        state.update(record["state"])
+        return state
+    for doc, rows in record.get("set", {}).iteritems():
+        state.setdefault(doc, {}).update(rows)
+    for doc, hosts in record.get("del", {}).iteritems():
+        rows = state.get(doc, {})
+        for host in hosts:
+            rows.pop(host, None)
+    return state
+
+
+def iter_records(fileobj):
+    """
+    Complete records in a change log, a trailing line that is still being written is skipped
+    """
+    for line in fileobj:
+        if not line.endswith("\n"):
+            break
+        yield json.loads(line)
+
+
+def replay(path):
+    """
+    Rebuild the latest state from a change log
+
+    Params
+    ======
+    path: str
+        change log path
+
+    Return
+    ======
+    state, seq, timestamp: tuple
+        {doc: {host: row}}, sequence number and timestamp of the last record
+    """
+    state, seq, timestamp = {}, None, None
+    with open(path) as change_log:
+        for record in iter_records(change_log):
+            apply_record(state, record)
+            seq, timestamp = record["seq"], record["timestamp"]
+    if seq is None:
+        raise ValueError("%s has no checkpoint" % path)
+    return state, seq, timestamp
+
+
+class ChangeLog(object):
+    """
+    Write a state to a change log, only the hosts that changed since the previous write are
+    appended.
+
+    Params
+    ======
+    path: str
+        change log path, replaced on the first write
+    checkpoint_interval: int
+        write a full checkpoint instead of a delta when the last one is older than x seconds
+        [Defaults: 3600]
+    checkpoint_records: int
+        write a full checkpoint after x deltas, this bounds the log size and the replay
+        time [Defaults: 1000]
+    """
+
+    def __init__(self, path, checkpoint_interval=3600, checkpoint_records=1000):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_records = checkpoint_records
+        self.logger = logging.getLogger(__name__)
+        self.state = None
+        self.seq = -1
+        self._checkpoint_time = 0
+        self._deltas = 0
+
+    @staticmethod
+    def encode(record):
+        return json.dumps(record, separators=(",", ":"), sort_keys=True) + "\n"
+
+    @property
+    def checkpoint_due(self):
+        return (
+            self.state is None
+            or self._deltas >= self.checkpoint_records
+            or time.time() - self._checkpoint_time >= self.checkpoint_interval
+        )
+
+    def write(self, state, timestamp=None):
+        """
+        Params
+        ======
+        state: dict
+            {doc: {host: row}}, eg: {'sensor_values': {'host00': [...]}}
+        timestamp: float
+            time the state was read [Defaults: now]
+
+        Return
+        ======
+        record: dict
+            the record that was written, None when nothing changed
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.state is not None:
+            changed, removed = diff_documents(self.state, state)
+            if not (changed or removed):
+                return None
+        if self.checkpoint_due:
+            record = {"type": CHECKPOINT, "seq": self.seq + 1, "timestamp": timestamp,
+                      "state": state}
+            self._write_checkpoint(record)
+        else:
+            record = {"type": DELTA, "seq": self.seq + 1, "timestamp": timestamp}
+            if changed:
+                record["set"] = changed
+            if removed:
+                record["del"] = removed
+            with open(self.path, "a") as change_log:
+                change_log.write(self.encode(record))
+            self._deltas += 1
+        self.seq = record["seq"]
+        # rows are rebuilt every cycle, so only the per document dicts need copying
+        self.state = dict((doc, dict(rows)) for doc, rows in state.iteritems())
+        return record
+
+    def _write_checkpoint(self, record):
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, "w") as change_log:
+            change_log.write(self.encode(record))
+            change_log.flush()
+            os.fsync(change_log.fileno())
+        os.rename(tmp_path, self.path)
+        self.logger.debug("Wrote checkpoint %s to %s" % (record["seq"], self.path))
+        self._checkpoint_time = time.time()
+        self._deltas = 0
+
+
+class ChangeLogReader(object):
+    """
+    Follow a change log, applying only the records appended since the last poll. The log is
+    replayed from its checkpoint when it was replaced.
+
+    Params
+    ======
+    path: str
+        change log path
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        self.seq = None
+        self.timestamp = None
+        self._inode = None
+        self._offset = 0
+
+    def poll(self):
+        """
+        Return
+        ======
+        changed: bool
+            True when records were applied to self.state
+        """
+        try:
+            change_log = open(self.path)
+        except IOError:
+            return False
+        changed = False
+        with change_log:
+            stat = os.fstat(change_log.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                # replaced by a new checkpoint
+                self.state = {}
+                self._inode, self._offset = stat.st_ino, 0
+            change_log.seek(self._offset)
+            # readline, file iteration reads ahead and the offset would be lost
+            for line in iter(change_log.readline, ""):
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                apply_record(self.state, record)
+                self.seq, self.timestamp = record["seq"], record["timestamp"]
+                self._offset += len(line)
+                changed = True
+        return changed
@@ -0,0 +1,186 @@
+"""
+Server-Sent Events push of dashboard cell changes.
+
+The dashboard publishes one event per data version, browsers keep a single /events
+connection open and patch the changed buttons in place, see static/sensor_events.js.
+Browsers that poll instead get the same changes merged by cells_since.
+
+cells: {"updated": "Last Updated: ...", "cells": [{"id": "id_host00_3", "label": ..., "style": {...}}],
+        "counts": {"health_all_error": 12, ...}}
+reload: {}
+    the hosts or the row layout changed, or the client missed events, reload the page
+"""
+
+import json
+import threading
+from collections import deque
+
+
+def cell_changes(old_format, new_format):
+    """
+    Cells whose label or status changed between two sets of host rows
+
+    Params
+    ======
+    old_format: dict
+        {host: [[label, status], ...]}
+    new_format: dict
+        {host: [[label, status], ...]}
+
+    Return
+    ======
+    changes: list
+        [(host, index, cell), ...], None when hosts or row lengths differ and the table
+        has to be rebuilt
+    """
+    if set(old_format) != set(new_format):
+        return None
+    changes = []
+    for host, row in new_format.iteritems():
+        old_row = old_format[host]
+        if len(old_row) != len(row):
+            return None
+        changes.extend(
+            (host, _c, cell)
+            for _c, (old_cell, cell) in enumerate(zip(old_row, row))
+            if (old_cell[0], old_cell[-1]) != (cell[0], cell[-1])
+        )
+    return changes
+
+
+def shipped_changes(version, new_format, changes):
+    """
+    Cells the poller reported as changed, without comparing every cell
+
+    Params
+    ======
+    version: int
+        data version the changes have to be against, eg: the shown snapshot generation
+    new_format: dict
+        {host: [[label, status], ...]}
+    changes: dict
+        {"generation": ..., "cells": [[host, index], ...]} shipped with a snapshot, see
+        StatusMatrix.row_changes
+
+    Return
+    ======
+    changes: list
+        [(host, index, cell), ...], None when no changes were shipped against version
+    """
+    if not changes or changes["generation"] != version:
+        return None
+    return [(host, index, new_format[host][index]) for host, index in changes["cells"]]
+
+
+class EventBroadcaster(object):
+    """
+    Fan out versioned events to every connected /events stream
+
+    Params
+    ======
+    history: int
+        events kept for clients that reconnect or loaded an older page [Defaults: 32]
+    heartbeat: int
+        seconds between keep-alive comments on an idle stream [Defaults: 15]
+    """
+
+    def __init__(self, history=32, heartbeat=15):
+        self.heartbeat = heartbeat
+        self.version = None
+        self._events = deque(maxlen=history)
+        self._cond = threading.Condition()
+
+    def publish(self, version, event, data):
+        """
+        Params
+        ======
+        version: str
+            data version the event brings the client to
+        event: str
+            cells or reload
+        data: dict
+            event payload
+        """
+        with self._cond:
+            self._events.append((str(version), event, json.dumps(data)))
+            self.version = str(version)
+            self._cond.notify_all()
+
+    def events_since(self, version):
+        """
+        Return
+        ======
+        events: list
+            [(version, event, data), ...] after version, None when version is unknown
+        """
+        if version == self.version:
+            return []
+        versions = [_version for _version, _event, _data in self._events]
+        if version not in versions:
+            return None
+        return list(self._events)[versions.index(version) + 1:]
+
+    def cells_since(self, version):
+        """
+        The cells events after version merged into one update, for clients that poll
+
+        Params
+        ======
+        version: str
+            data version the client shows
+
+        Return
+        ======
+        update: dict
+            {"version": ..., "updated": ..., "cells": [...], "counts": {...}}, only the
+            latest change of each cell and count, None when the client has to reload
+        """
+        with self._cond:
+            events = self.events_since(version)
+            current = self.version
+        if events is None or any(event == "reload" for _version, event, _data in events):
+            return None
+        update = {"version": current, "cells": [], "counts": {}}
+        cells = {}
+        for _version, _event, data in events:
+            data = json.loads(data)
+            update["updated"] = data["updated"]
+            cells.update((cell["id"], cell) for cell in data["cells"])
+            update["counts"].update(data.get("counts", {}))
+        update["cells"] = sorted(cells.values(), key=lambda cell: cell["id"])
+        return update
+
+    @staticmethod
+    def format_event(version, event, data):
+        return "id: %s\nevent: %s\ndata: %s\n\n" % (version, event, data)
+
+    def stream(self, version):
+        """
+        Params
+        ======
+        version: str
+            data version the client shows
+
+        Return
+        ======
+        stream: generator
+            text/event-stream chunks, runs until the client disconnects
+        """
+        # tell EventSource to retry quickly after the dashboard restarts
+        yield "retry: 2000\n\n"
+        while True:
+            with self._cond:
+                events = self.events_since(version)
+                if events == []:
+                    self._cond.wait(self.heartbeat)
+                    events = self.events_since(version)
+            if events is None:
+                yield self.format_event(self.version, "reload", "{}")
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+            for event in events:
+                yield self.format_event(*event)
+                version = event[0]
+                if event[1] == "reload":
+                    return
@@ -0,0 +1,560 @@
+"""
+Rolling on-disk history of an array's device-status sensor statuses.
+
+A history directory holds an append-only list of sensor names and memory mapped column files
+of status codes, see sensor_status, split in segments of at most a day:
+
+    sensors.json              sensor names, column x of every segment is sensors[x]
+    raw.<start>.times         float64 timestamps of the rows
+    raw.<start>.codes         header, then a row of width status codes per timestamp
+    down.<start>.times        start of every bucket of a downsampled segment
+    down.<start>.codes        header, then the statuses at the end of every bucket
+    down.<start>.worst        header, then the most severe statuses seen during every bucket
+    down.<start>.changes      header, then the status changes during every bucket, at most 255
+
+A row is only appended when a status changed, a status holds until the next row. Raw
+segments older than raw_days are downsampled into buckets of resolution seconds and
+downsampled segments older than retention_days are deleted. With 2000 sensors of which one
+changes on every 10s poll, ie: the worst case, that is about 120MB of raw and 310MB of
+downsampled segments.
+"""
+
+import array
+import bisect
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from sensor_status import MISSING, STATUSES, status_code, worst_code
+from snapshot_io import atomic_write
+
+logger = logging.getLogger(__name__)
+
+MAGIC = "CBFH"
+VERSION = 1
+# magic, version, reserved, reserved, width, resolution
+HEADER = struct.Struct("<4sBBHII")
+DAY = 24 * 60 * 60
+RAW = "raw"
+DOWNSAMPLED = "down"
+
+HistoryPoint = namedtuple("HistoryPoint", ["timestamp", "status", "worst", "changes"])
+HistorySummary = namedtuple("HistorySummary", ["status", "worst", "changes", "last_change"])
+
+
+class HistoryError(Exception):
+    """
+    Not a sensor history segment
+    """
+
+
+def status_name(code):
+    return "missing" if code == MISSING else STATUSES[code]
+
+
+def history_code(status):
+    return MISSING if status == "missing" else status_code(status)
+
+
+def worst_status(statuses):
+    """
+    eg: ['nominal', 'warn', 'missing'] -> warn
+    """
+    return status_name(worst_code(history_code(status) for status in statuses))
+
+
+def sensor_host(name):
+    """
+    eg: xhost12.xeng0.vacc.device-status -> xhost12
+    """
+    return name.split(".")[0].lower()
+
+
+class Segment(object):
+    """
+    Column files of a raw or downsampled segment
+
+    Params
+    ======
+    prefix: str
+        path without the column extension, eg: <history>/raw.1539856800000
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.kind, start = os.path.basename(prefix).split(".")
+        # milliseconds in the file name, such that a segment started within a second of
+        # another one gets its own files
+        self.start = int(start) / 1000.0
+        with open(prefix + ".codes", "rb") as codes:
+            header = codes.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise HistoryError("%s.codes is truncated" % prefix)
+        magic, version, _, _, self.width, self.resolution = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise HistoryError("%s.codes is not a sensor history segment" % prefix)
+
+    @staticmethod
+    def path(directory, kind, start):
+        return os.path.join(directory, "%s.%d" % (kind, round(start * 1000)))
+
+    @property
+    def columns(self):
+        return ("codes", "worst", "changes") if self.kind == DOWNSAMPLED else ("codes",)
+
+    @property
+    def rows(self):
+        """
+        Rows with both a timestamp and codes, a crash may leave a partly appended row
+        """
+        rows = os.path.getsize(self.prefix + ".times") // 8
+        if self.width:
+            rows = min(rows, (os.path.getsize(self.prefix + ".codes") - HEADER.size) // self.width)
+        return rows
+
+    def times(self):
+        times = array.array("d")
+        with open(self.prefix + ".times", "rb") as _file:
+            times.fromstring(_file.read(self.rows * 8))
+        return times
+
+    @property
+    def end(self):
+        """
+        Time the segment's last row, or last bucket, ends
+        """
+        times = self.times()
+        return (times[-1] if times else self.start) + self.resolution
+
+    def column(self, index, rows, name="codes", fill=MISSING):
+        """
+        Params
+        ======
+        index: int
+            column, ie: the sensor's index in sensors.json
+        rows: int
+            rows to read, eg: len(self.times())
+        name: str
+            codes, or worst and changes of a downsampled segment [Defaults: codes]
+        fill: int
+            value of the rows of sensors added after the segment was started, eg: 0 changes
+            [Defaults: MISSING]
+
+        Return
+        ======
+        column: bytearray
+            a value per row
+        """
+        if index >= self.width or not rows:
+            return bytearray([fill]) * rows
+        with open("%s.%s" % (self.prefix, name), "rb") as _file:
+            table = mmap.mmap(_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return bytearray(
+                    table[HEADER.size + index:HEADER.size + rows * self.width:self.width])
+            finally:
+                table.close()
+
+    def last_row(self):
+        rows = self.rows
+        if not rows:
+            return None
+        with open(self.prefix + ".codes", "rb") as codes:
+            codes.seek(HEADER.size + (rows - 1) * self.width)
+            return bytearray(codes.read(self.width))
+
+    def truncate(self):
+        """
+        Drop a partly appended row, eg: after the poller was killed
+        """
+        rows = self.rows
+        with open(self.prefix + ".times", "r+b") as times:
+            times.truncate(rows * 8)
+        with open(self.prefix + ".codes", "r+b") as codes:
+            codes.truncate(HEADER.size + rows * self.width)
+
+    def remove(self):
+        # codes first, a segment without it is not listed
+        for name in self.columns + ("times",):
+            try:
+                os.remove("%s.%s" % (self.prefix, name))
+            except OSError:
+                pass
+
+
+class SensorHistory(object):
+    """
+    Params
+    ======
+    path: str
+        history directory, eg: json_dumps/<hostname>.array0.history
+    raw_days: int
+        days to keep every row for [Defaults: 7]
+    retention_days: int
+        days to keep the downsampled rows for [Defaults: 180]
+    resolution: int
+        seconds per bucket of a downsampled segment [Defaults: 300]
+    """
+
+    def __init__(self, path, raw_days=7, retention_days=180, resolution=300):
+        self.path = path
+        self.raw_days = raw_days
+        self.retention_days = retention_days
+        self.resolution = resolution
+        self._sensors = None
+        self._columns = {}
+        self._segment = None
+        self._times = None
+        self._codes = None
+        self._last_row = None
+
+    @property
+    def sensors_path(self):
+        return os.path.join(self.path, "sensors.json")
+
+    def read_sensors(self):
+        """
+        Return
+        ======
+        sensors: list
+            sensor names in column order
+        """
+        try:
+            with open(self.sensors_path) as sensors:
+                return json.load(sensors)
+        except IOError:
+            return []
+
+    def segments(self, kind=None):
+        """
+        Params
+        ======
+        kind: str
+            raw or down [Defaults: both]
+
+        Return
+        ======
+        segments: list
+            Segment objects sorted by start time
+        """
+        segments = []
+        for codes in glob.glob(os.path.join(self.path, "%s.*.codes" % (kind or "*"))):
+            try:
+                segments.append(Segment(codes[:-len(".codes")]))
+            except (HistoryError, ValueError):
+                logger.warning("Skipping %s" % codes, exc_info=True)
+        return sorted(segments, key=lambda segment: (segment.start, segment.kind))
+
+    def append(self, timestamp, statuses):
+        """
+        Params
+        ======
+        timestamp: float
+            time the sensors were read
+        statuses: dict
+            {sensor_name: status}
+
+        Return
+        ======
+        appended: bool
+            False when no status changed since the last row
+        """
+        if self._sensors is None:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            self._sensors = self.read_sensors()
+            self._columns = dict((name, index) for index, name in enumerate(self._sensors))
+        new_sensors = sorted(set(statuses) - set(self._columns))
+        if new_sensors:
+            self._columns.update(
+                (name, index) for index, name in enumerate(new_sensors, len(self._sensors)))
+            self._sensors.extend(new_sensors)
+            atomic_write(self.sensors_path, json.dumps(self._sensors))
+        row = bytearray([MISSING]) * len(self._sensors)
+        for name, status in statuses.iteritems():
+            row[self._columns[name]] = status_code(status)
+        self._open_segment(timestamp, len(row))
+        if row == self._last_row:
+            return False
+        # codes before the timestamp, readers only see complete rows
+        self._codes.write(row)
+        self._codes.flush()
+        self._times.write(array.array("d", [timestamp]).tostring())
+        self._times.flush()
+        self._last_row = row
+        return True
+
+    def _open_segment(self, timestamp, width):
+        if self._segment is None:
+            self._resume()
+        segment = self._segment
+        if (segment is not None and segment.width == width
+                and int(segment.start // DAY) == int(timestamp // DAY)):
+            return
+        self.close()
+        prefix = Segment.path(self.path, RAW, timestamp)
+        with open(prefix + ".times", "wb"):
+            pass
+        atomic_write(prefix + ".codes", HEADER.pack(MAGIC, VERSION, 0, 0, width, 0))
+        self._segment = Segment(prefix)
+        self._last_row = None
+        self._times = open(prefix + ".times", "ab")
+        self._codes = open(prefix + ".codes", "ab")
+        logger.info("Started sensor history segment %s with %s sensors" % (prefix, width))
+        self.compact(timestamp)
+
+    def _resume(self):
+        raw_segments = self.segments(RAW)
+        if not raw_segments:
+            return
+        segment = raw_segments[-1]
+        segment.truncate()
+        self._segment = segment
+        self._times = open(segment.prefix + ".times", "ab")
+        self._codes = open(segment.prefix + ".codes", "ab")
+        self._last_row = segment.last_row()
+
+    def compact(self, now):
+        """
+        Downsample the raw segments older than raw_days and delete the downsampled segments
+        older than retention_days
+
+        Params
+        ======
+        now: float
+            eg: time.time()
+        """
+        segments = self.segments()
+        raw_starts = set(segment.start for segment in segments if segment.kind == RAW)
+        previous = None
+        for segment in segments:
+            # a partly written downsampled copy is rewritten from its raw segment
+            if segment.kind == DOWNSAMPLED and segment.start in raw_starts:
+                continue
+            if (segment.kind == RAW
+                    and segment.prefix != getattr(self._segment, "prefix", None)
+                    and segment.end < now - self.raw_days * DAY):
+                downsampled = self.downsample(
+                    segment, previous.last_row() if previous else None)
+                segment.remove()
+                segment = downsampled
+            previous = segment
+        for segment in self.segments(DOWNSAMPLED):
+            if segment.end < now - self.retention_days * DAY:
+                logger.info("Deleting sensor history segment %s" % segment.prefix)
+                segment.remove()
+
+    def downsample(self, segment, previous_row=None):
+        """
+        Write the downsampled copy of a raw segment
+
+        Params
+        ======
+        segment: Segment
+            raw segment
+        previous_row: bytearray
+            last row of the segment before, such that a change at the segment's start, eg:
+            across a day boundary, is counted [Defaults: None]
+
+        Return
+        ======
+        segment: Segment
+            the downsampled segment
+        """
+        times = segment.times()
+        # [bucket start, first row, end row]
+        buckets = []
+        for _r, timestamp in enumerate(times):
+            bucket = timestamp // self.resolution * self.resolution
+            if buckets and buckets[-1][0] == bucket:
+                buckets[-1][2] = _r + 1
+            else:
+                buckets.append([bucket, _r, _r + 1])
+        width = segment.width
+        codes = bytearray(len(buckets) * width)
+        worst = bytearray(len(buckets) * width)
+        changes = bytearray(len(buckets) * width)
+        for _c in xrange(width):
+            column = segment.column(_c, len(times))
+            if previous_row is not None and _c < len(previous_row):
+                previous = previous_row[_c]
+            else:
+                previous = column[0] if column else MISSING
+            for _b, (_, first, end) in enumerate(buckets):
+                index = _b * width + _c
+                chunk = column[first:end]
+                codes[index] = chunk[-1]
+                if chunk.count(bytearray([previous])) == len(chunk):
+                    worst[index] = previous
+                    continue
+                worst[index] = worst_code(set(chunk) | set([previous]))
+                count = 0
+                for code in chunk:
+                    if code != previous:
+                        count += 1
+                        previous = code
+                changes[index] = min(count, 255)
+        prefix = Segment.path(self.path, DOWNSAMPLED, segment.start)
+        header = HEADER.pack(MAGIC, VERSION, 0, 0, width, self.resolution)
+        atomic_write(
+            prefix + ".times",
+            array.array("d", [bucket for bucket, _, _ in buckets]).tostring())
+        atomic_write(prefix + ".worst", header + bytes(worst))
+        atomic_write(prefix + ".changes", header + bytes(changes))
+        # last, the segment is listed once its codes exist
+        atomic_write(prefix + ".codes", header + bytes(codes))
+        logger.info("Downsampled %s rows of %s into %s buckets" % (
+            len(times), segment.prefix, len(buckets)))
+        return Segment(prefix)
+
+    def query(self, start=None, end=None, sensors=None, host=None):
+        """
+        Status changes of the sensors over a time range
+
+        Params
+        ======
+        start: float
+            [Defaults: the oldest row]
+        end: float
+            [Defaults: the latest row]
+        sensors: list
+            sensor names, eg: ['xhost12.xeng0.vacc.device-status'] [Defaults: all]
+        host: str
+            only the sensors of this host, eg: xhost12 [Defaults: all]
+
+        Return
+        ======
+        history: dict
+            {sensor_name: [HistoryPoint, ...]}, the first point is the status at start, then
+            a point per status change, or per downsampled bucket in which a status changed
+        """
+        names = self.read_sensors()
+        columns = [
+            (index, name)
+            for index, name in enumerate(names)
+            if (sensors is None or name in sensors)
+            and (host is None or sensor_host(name) == host.lower())
+        ]
+        segments = self.segments()
+        # a raw segment that is being downsampled is read instead of its downsampled copy
+        raw_starts = set(segment.start for segment in segments if segment.kind == RAW)
+        segments = [
+            segment for segment in segments
+            if segment.kind == RAW or segment.start not in raw_starts
+        ]
+        if start is not None:
+            # the last segment started before start holds the status at start
+            starts = [segment.start for segment in segments]
+            segments = segments[max(bisect.bisect_right(starts, start) - 1, 0):]
+        history = dict((name, []) for _, name in columns)
+        state = {}
+        started = set()
+        for segment in segments:
+            if end is not None and segment.start > end:
+                break
+            times = segment.times()
+            rows = len(times)
+            downsampled = segment.kind == DOWNSAMPLED
+            if start is None:
+                first = 0
+            elif downsampled:
+                # the bucket overlapping start is part of the range, the status at start is
+                # the one of the bucket before
+                first = max(bisect.bisect_right(times, start) - 1, 0)
+                if first < rows and times[first] + segment.resolution <= start:
+                    first += 1
+            else:
+                first = bisect.bisect_left(times, start)
+            last = bisect.bisect_right(times, end) if end is not None else rows
+            for index, name in columns:
+                column = segment.column(index, rows)
+                if first:
+                    state[name] = column[first - 1]
+                if first >= last:
+                    continue
+                points = history[name]
+                if name not in started:
+                    started.add(name)
+                    if start is not None and name in state:
+                        code = state[name]
+                        points.append(HistoryPoint(
+                            start, status_name(code), status_name(code), 0))
+                chunk = column[first:last]
+                previous = state.get(name)
+                if not downsampled and previous is not None and (
+                        chunk.count(bytearray([previous])) == len(chunk)):
+                    continue
+                if downsampled:
+                    worst = segment.column(index, rows, "worst")
+                    changes = segment.column(index, rows, "changes", fill=0)
+                for _r, code in enumerate(chunk, first):
+                    if downsampled:
+                        if changes[_r] or code != previous or worst[_r] != code:
+                            # a bucket overlapping start is reported from start
+                            timestamp = times[_r] if start is None else max(times[_r], start)
+                            points.append(HistoryPoint(
+                                timestamp, status_name(code), status_name(worst[_r]),
+                                changes[_r]))
+                    elif code != previous:
+                        points.append(HistoryPoint(
+                            times[_r], status_name(code), status_name(code),
+                            int(previous is not None)))
+                    previous = code
+                state[name] = previous
+        # nothing changed during the range
+        for name in set(history) - started:
+            if start is not None and name in state:
+                code = state[name]
+                history[name].append(HistoryPoint(start, status_name(code), status_name(code), 0))
+        return history
+
+    def summary(self, start=None, end=None, sensors=None, host=None):
+        """
+        Params
+        ======
+        see query
+
+        Return
+        ======
+        summary: dict
+            {sensor_name: HistorySummary}, the status at end, the most severe status, the
+            number of status changes and the time of the last one, None when there was none
+
+        eg: a downsampled bucket that overlaps start is counted
+        >>> import shutil, tempfile
+        >>> history = SensorHistory(tempfile.mkdtemp(), resolution=300)
+        >>> for offset, status in [(100, 'nominal'), (110, 'error'), (120, 'nominal'),
+        ...                        (130, 'warn')]:
+        ...     _ = history.append(864000 + offset, {'xhost00.device-status': status})
+        >>> history.close()
+        >>> raw = history.segments(RAW)[0]
+        >>> _ = history.downsample(raw)
+        >>> raw.remove()
+        >>> history.summary(start=864100, end=864160)['xhost00.device-status']
+        HistorySummary(status='warn', worst='error', changes=3, last_change=864100)
+        >>> shutil.rmtree(history.path)
+        """
+        summary = {}
+        for name, points in self.query(start, end, sensors, host).iteritems():
+            if not points:
+                continue
+            changed = [point.timestamp for point in points if point.changes]
+            summary[name] = HistorySummary(
+                points[-1].status,
+                worst_status(point.worst for point in points),
+                sum(point.changes for point in points),
+                changed[-1] if changed else None,
+            )
+        return summary
+
+    def close(self):
+        for _file in (self._times, self._codes):
+            if _file is not None:
+                _file.close()
+        self._times = self._codes = None
+        # appending again resumes the latest segment
+        self._segment = None
@@ -2,9 +2,6 @@
 
 import argcomplete
 import argparse
-import atexit
-import coloredlogs
-import functools
 import gc
 import json
 import katcp
@@ -16,64 +13,185 @@ import sys
 import time
 import threading
 
-from collections import OrderedDict
-from itertools import izip_longest
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
 from ast import literal_eval as evaluate
 from pprint import PrettyPrinter
 
+from katcp_backend import Backoff, ConnectionDown, ConnectionManager, get_backend
+from poll_logging import LoggingClass, configure_logging
+from poll_metrics import PollMetrics
+from poll_scheduler import PollScheduler
+from sensor_changes import ChangeLog
+from sensor_history import SensorHistory
+from shm_transport import ShmTableWriter
+from snapshot_http import SnapshotServer
+from snapshot_io import SnapshotWriter, atomic_write
+from status_matrix import FHOST_SIG_CHAIN, XHOST_SIG_CHAIN, StatusMatrix
 
-def retry(func, count=20, wait_time=300):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        retExc = TypeError
-        for _ in xrange(count):
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as exc:
-                    retExc = exc
-                    time.sleep(wait_time)
-                    continue
-                break
-        raise retExc
-    return wrapper
-
-
-def combined_Dict_List(*args):
+
+def group_by_host(pairs):
     """
-    Combining two/more dictionaries into one with the same keys
+    Group (host, entry) pairs into per-host lists in a single pass, preserving the order
+    in which entries were seen
 
     Params
     =======
-    args: list
-        list of dicts to combine
+    pairs: iterable
+        (host, entry) pairs, eg: [('fhost00', ['network', 'nominal']), ...]
 
     Return
     =======
     result: dict
-        combined dictionaries
+        {host: [entry, ...]}
     """
     result = {}
-    for _dict in args:
-        for key in result.viewkeys() | _dict.keys():
-            if key in _dict:
-                result.setdefault(key, []).extend([_dict[key]])
+    for host, entry in pairs:
+        try:
+            result[host].append(entry)
+        except KeyError:
+            result[host] = [entry]
     return result
 
 
-# This class could be imported from a utility module
-class LoggingClass(object):
+class SensorSnapshot(object):
+    """
+    Immutable view of every sensor on an array, fetched with a single katcp
+    ?sensor-value round-trip and shared by all mapping stages of a poll cycle.
+
+    Params
+    =======
+    sensor_value_informs: list
+        sensor-value inform arguments, eg: [[timestamp, '1', name, status, value], ...]
+    timestamp: float
+        time the sensors were read [Defaults: now]
+    """
+
+    __slots__ = ("_timestamp", "_sensors", "_statuses", "_names")
+
+    def __init__(self, sensor_value_informs, timestamp=None):
+        self._timestamp = time.time() if timestamp is None else timestamp
+        # sensors name + status + value, sorted by name
+        self._sensors = tuple(
+            sorted(tuple(i[2:5]) for i in sensor_value_informs if len(i) > 4)
+        )
+        # sensors name and status
+        self._statuses = dict((name, status) for name, status, _ in self._sensors)
+        self._names = frozenset(self._statuses)
+
+    def __iter__(self):
+        return iter(self._sensors)
+
+    def __len__(self):
+        return len(self._sensors)
+
+    def __contains__(self, name):
+        return name in self._statuses
+
     @property
-    def logger(self):
-        log_format = "%(asctime)s - %(name)s - %(levelname)s - %(module)s - %(pathname)s : %(lineno)d - %(message)s"
-        name = ".".join([os.path.basename(sys.argv[0]), self.__class__.__name__])
-        logging.basicConfig(format=log_format)
-        coloredlogs.install(fmt=log_format)
-        return logging.getLogger(name)
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def names(self):
+        return self._names
+
+    def status(self, name, default=None):
+        return self._statuses.get(name, default)
+
+
+# rename such that, it fits on html/button
+SENSOR_LABELS = {
+    "network-reorder": "Net-ReOrd",
+    "missing-pkts": "hmcReOrd",
+    "bram-reorder": "bramReOrd",
+}
+
+
+class SensorName(namedtuple("SensorName", ["host", "host_type", "path", "label"])):
+    """
+    Parsed device-status sensor name
+
+    host: str
+        lower-cased host, eg: xhost00
+    host_type: str
+        eg: fhost or xhost
+    path: tuple
+        renamed components between the host and device-status, eg: ('xeng0', 'vacc')
+    label: str
+        text displayed on the button, eg: 'vacc' or '00-020709' for the host itself
+    """
+
+    __slots__ = ()
+
+
+class SensorNameIndex(object):
+    """
+    Index of parsed sensor names on an array.
+
+    Sensor names do not change within an array's lifetime, so names are split and renamed
+    once when the index is built and every poll cycle only looks up sensor statuses.
+
+    Params
+    =======
+    names: iterable
+        all sensor names on the array
+    hostname_mapping: dict
+        host to skarab hostname mapping, eg: {'fhost00': 'skarab020709-01'}
+    host_types: tuple
+        host prefixes to index device-status sensors for [Defaults: ('fhost', 'xhost')]
+    """
+
+    def __init__(self, names, hostname_mapping, host_types=("fhost", "xhost")):
+        self.names = frozenset(names)
+        self.hostname_mapping = hostname_mapping
+        # host of every sensor on a ?host, eg: fhost00.network.tx-err -> fhost00
+        self.hosts = {}
+        self._device_status = dict((host_type, []) for host_type in host_types)
+        for name in sorted(self.names):
+            key_s = name.split(".")
+            host = key_s[0].lower()
+            if host[1:].startswith("host"):
+                self.hosts[name] = host
+            if key_s[-1] != "device-status":
+                continue
+            for host_type in host_types:
+                if host.startswith(host_type):
+                    self._device_status[host_type].append(
+                        (name, self.parse(host, host_type, key_s[1:-1])))
+                    break
+
+    def parse(self, host, host_type, components):
+        path = tuple(SENSOR_LABELS.get(x, x) for x in components)
+        if path:
+            label = path[-1]
+        elif host in self.hostname_mapping:
+            label = host.replace(host_type, "") + self.hostname_mapping[host].replace(
+                "skarab", "-").replace("-01", "")
+        else:
+            label = host.replace(host_type, "")
+        return SensorName(host, host_type, path, label)
+
+    def is_current(self, snapshot, hostname_mapping):
+        """
+        Check whether the index still describes the sensors in the snapshot
+        """
+        return self.hostname_mapping is hostname_mapping and self.names == snapshot.names
+
+    def device_status(self, host_type):
+        """
+        Sorted (sensor name, SensorName) pairs of the host type's device-status sensors
+        """
+        return self._device_status.get(host_type, [])
 
 
 class SensorPoll(LoggingClass):
-    def __init__(self, katcp_ip=None, katcp_port=7147):
+    def __init__(
+        self, katcp_ip=None, katcp_port=7147, array_name=None, sampling_strategy=None,
+        resync_time=300, backend="blocking", connect_attempts=None, max_reconnect_delay=60,
+        json_dumps=True, checkpoint_interval=3600, snapshot_encoding="json", shm_dir=None,
+        snapshot_server=None, history_days=180, history_raw_days=7, metrics=None
+    ):
         """
         Parameters
         =========
@@ -81,7 +199,73 @@ class SensorPoll(LoggingClass):
             IP to connect to!
         katcp_port: int
             Port to connect to! [Defaults: 7147]
+        array_name: str
+            Array to poll, eg: array0 [Defaults: first array in ?array-list]
+        sampling_strategy: str
+            Subscribe to the device-status sensors using katcp sensor-sampling instead of
+            polling all sensor values, eg: 'event' or 'event-rate 1 10' [Defaults: None]
+        resync_time: int
+            When subscribed, re-read all sensor values every x seconds to pick up sensors
+            that are not sampled [Defaults: 300]
+        backend: str
+            katcp connection backend, blocking (thread per connection) or ioloop (shared
+            tornado ioloop) [Defaults: blocking]
+        connect_attempts: int
+            give up connecting to the array after x attempts [Defaults: None, keep trying]
+        max_reconnect_delay: int
+            cap on the exponential backoff between reconnect attempts [Defaults: 60]
+        json_dumps: bool
+            also export the full json dumps, rewritten whenever a host row changed
+            [Defaults: True]
+        checkpoint_interval: int
+            start the change log over with a full checkpoint once the last one is older than
+            x seconds [Defaults: 3600]
+        snapshot_encoding: str
+            encoding of the sensor_snapshot.cbfs file read by the dashboard, json or msgpack
+            [Defaults: json]
+        shm_dir: str
+            also publish the host rows to a shared memory table in this directory, for a
+            dashboard on the same host, eg: /dev/shm [Defaults: None]
+        snapshot_server: snapshot_http.SnapshotServer
+            also serve the latest snapshot over http [Defaults: None]
+        history_days: int
+            keep a history of the device-status sensor statuses for x days, 0 to disable
+            [Defaults: 180]
+        history_raw_days: int
+            keep every status change in the history for x days, downsample the older ones
+            [Defaults: 7]
+        metrics: poll_metrics.PollMetrics
+            record stage timings, katcp round trips and payload sizes, eg: shared by the
+            pollers of every array [Defaults: None, metrics of this poller only]
         """
+        self._backend = get_backend(backend)
+        self.array_name = array_name
+        self.sampling_strategy = sampling_strategy.split() if sampling_strategy else None
+        self.resync_time = resync_time
+        self._sensor_table = {}
+        self._sensor_table_lock = threading.Lock()
+        self._sensors_changed = threading.Event()
+        self._resubscribe = threading.Event()
+        self._last_resync = 0
+        self._sensor_index = None
+        self.json_dumps = json_dumps
+        self.checkpoint_interval = checkpoint_interval
+        self._change_log = None
+        self.snapshot_encoding = snapshot_encoding
+        self._snapshot_writer = None
+        self.shm_dir = shm_dir
+        self._shm_writer = None
+        self.snapshot_server = snapshot_server
+        self.history_days = history_days
+        self.history_raw_days = history_raw_days
+        self._history = None
+        self.metrics = metrics if metrics is not None else PollMetrics()
+        # host x stage statuses of the last poll cycle
+        self.status_matrix = None
+        # host rows changed in the last poll cycle
+        self._rows_changed = False
+        # host x stage statuses of the last written snapshot
+        self._snapshot_matrix = None
 
         try:
             assert katcp_ip
@@ -92,113 +276,164 @@ class SensorPoll(LoggingClass):
             self.logger.exception("Invalid KATCP_IP!")
             raise
         self.katcp_port = katcp_port
-        self._kcp_connect()
+        self.connections = ConnectionManager(
+            self._backend,
+            self.katcp_ip,
+            max_delay=max_reconnect_delay,
+            on_restored=self._connection_restored,
+            on_sensor_status=self._update_sensor_table,
+            on_reconnect=self._resubscribe.set,
+        )
+        self._kcp_connect(attempts=connect_attempts)
+
+    @property
+    def primary_client(self):
+        return self.connections.get("primary")
+
+    @property
+    def sec_client(self):
+        return self.connections.get("array")
+
+    @property
+    def sec_sensors_katcp_con(self):
+        return self.connections.get("sensor")
+
+    @property
+    def connection_metrics(self):
+        """
+        State of the primary, array and sensor port connections, see ConnectionManager
+        """
+        return self.connections.metrics()
+
+    @property
+    def active(self):
+        """
+        Host rows changed in the last poll cycle or a host is failing, see PollScheduler
+        """
+        return self._rows_changed or (
+            self.status_matrix is not None and bool(self.status_matrix.mask().any()))
+
+    @property
+    def pending(self):
+        """
+        Subscribed sensors pushed a status change that was not polled yet
+        """
+        return bool(self.sampling_strategy) and self._sensors_changed.is_set()
+
+    def _kcp_connect(self, attempts=None):
+        """
+        Connect to the primary port, look up the array's ports and connect to them. Failed
+        attempts are retried with jittered exponential backoff.
+
+        Params
+        =======
+        attempts: int
+            give up after x attempts [Defaults: None, keep trying]
+        """
+        backoff = Backoff(self.connections.initial_delay, self.connections.max_delay)
+        while True:
+            try:
+                self._connect_array(attempts)
+            except Exception as exc:
+                self.logger.error(
+                    "No running array on {}:{}!!!! {}".format(self.katcp_ip, self.katcp_port, exc),
+                    #exc_info=True
+                )
+                if attempts is not None and backoff.attempts + 1 >= attempts:
+                    raise
+                delay = backoff.next_delay()
+                self.logger.info("Reconnecting in %.1fs", delay)
+                time.sleep(delay)
+            else:
+                return
 
-    @retry
-    def _kcp_connect(self):
+    def _connect_array(self, attempts=None):
+        self.connections.connect("primary", self.katcp_port, attempts=attempts)
+        reply, informs = self.sensor_request(self.primary_client)
+        assert reply.reply_ok()
+        katcp_array_list = self.select_array(informs)
+        assert isinstance(katcp_array_list, list)
+        self.katcp_array_port, self.katcp_sensor_port = [
+            int(i) for i in katcp_array_list[1].split(",")
+        ]
+        self.array_name = katcp_array_list[0]
+        self.connections.connect("array", self.katcp_array_port, attempts=attempts)
+        self.connections.connect("sensor", self.katcp_sensor_port, attempts=attempts)
+        self.logger.info(
+            "Katcp connection established: IP {}, Primary Port: {}, Array Port: {}, "
+            "Sensor Port: {}".format(
+                self.katcp_ip,
+                self.katcp_port,
+                self.katcp_array_port,
+                self.katcp_sensor_port,
+            )
+        )
+        if self._backend.name == "blocking":
+            time.sleep(1)
         try:
-            self._started = False
-            self.primary_client = self.katcp_request(which_port=self.katcp_port)
-            atexit.register(self.cleanup, self.primary_client)
-            assert isinstance(self.primary_client, katcp.client.BlockingClient)
-            reply, informs = self.sensor_request(self.primary_client)
-            assert reply.reply_ok()
-            katcp_array_list = informs[0].arguments
-            assert isinstance(katcp_array_list, list)
-            self.katcp_array_port, self.katcp_sensor_port = [
-                int(i) for i in katcp_array_list[1].split(",")
-            ]
-            self.array_name = katcp_array_list[0]
-            assert isinstance(self.katcp_array_port, int)
-            assert isinstance(self.katcp_sensor_port, int)
+            self.input_mapping, self.hostname_mapping = self.do_mapping()
         except Exception:
+            self.connections.stop("array")
+            self.connections.stop("sensor")
             self.logger.error(
-                "No running array on {}:{}!!!!".format(self.katcp_ip, self.katcp_port),
-                #exc_info=True
-            )
-            if self.primary_client.is_connected():
-                self.cleanup(self.primary_client)
-            raise
-        else:
-            if self._started:
-                self._started = False
-                self.sec_client = self.katcp_request(which_port=self.katcp_array_port)
-                atexit.register(self.cleanup, self.sec_client)
-
-            if self._started:
-                self._started = False
-                self.sec_sensors_katcp_con = self.katcp_request(
-                    which_port=self.katcp_sensor_port
-                )
-                atexit.register(self.cleanup, self.sec_sensors_katcp_con)
-
-            self.logger.info(
-                "Katcp connection established: IP {}, Primary Port: {}, Array Port: {}, "
-                "Sensor Port: {}".format(
-                    self.katcp_ip,
-                    self.katcp_port,
-                    self.katcp_array_port,
-                    self.katcp_sensor_port,
+                "Ayeyeyeye! it broke cannot do mappings",
+                         # exc_info=True
                 )
-            )
-            time.sleep(1)
-            try:
-                self.input_mapping, self.hostname_mapping = self.do_mapping()
-            except Exception:
-                self.cleanup(self.sec_client)
-                self.cleanup(self.sec_sensors_katcp_con)
-                self.logger.error(
-                    "Ayeyeyeye! it broke cannot do mappings",
-                             # exc_info=True
-                    )
+            raise
+        if self.sampling_strategy:
+            self.subscribe_sensors()
+
+    def _connection_restored(self, name):
+        # a new sensor port connection has no sampling strategies set
+        if name == "sensor":
+            self._resubscribe.set()
+
+    def ensure_connected(self, rediscover_after=3):
+        """
+        Reconnect just the array or sensor port connection that dropped. When one keeps
+        refusing connections the array was probably re-created on new ports, so look the
+        ports up on the primary port again.
+
+        Params
+        =======
+        rediscover_after: int
+            consecutive failed reconnects before the array ports are looked up again
+
+        Raises
+        =======
+        ConnectionDown: the array could not be reconnected (yet)
+        """
+        try:
+            self.connections.get("array")
+            self.connections.get("sensor")
+        except ConnectionDown:
+            metrics = self.connections.metrics()
+            if max(metrics[name]["attempts"] for name in ("array", "sensor")) < rediscover_after:
                 raise
+            self.logger.info("Looking up the ports of %s again", self.array_name)
+            try:
+                self._kcp_connect(attempts=1)
+            except Exception as exc:
+                raise ConnectionDown(str(exc))
 
-    def katcp_request(
-        self, which_port, katcprequest="array-list", katcprequestArg=None, timeout=10
-    ):
+    def select_array(self, informs):
         """
-        Katcp requests
+        Find the array-list inform of the array to poll
 
-        Parameters
-        =========
-        which_port: str
-            Katcp port to connect to!
-        katcprequest: str
-            Katcp requests messages [Defaults: 'array-list']
-        katcprequestArg: str
-            katcp requests messages arguments eg. array-list array0 [Defaults: None]
-        timeout: int
-            katcp timeout [Defaults :10]
+        Params
+        =======
+        informs: list
+            array-list informs, eg: #array-list array0 7148,7149 ...
 
         Return
-        ======
-        reply, informs : tuple
-            katcp request messages
+        =======
+        arguments: list
+            array-list inform arguments of this array, the first array if no name was given
         """
-        # self._started = False
-        if not self._started:
-            self._started = True
-            self.logger.info(
-                "Establishing katcp connection on {}:{}".format(
-                    self.katcp_ip, which_port
-                )
-            )
-            client = katcp.BlockingClient(self.katcp_ip, which_port)
-            client.setDaemon(True)
-            client.start()
-            time.sleep(0.1)
-            try:
-                is_connected = client.wait_running(timeout)
-                assert is_connected
-                self.logger.info(
-                    "Katcp client connected to {}:{}\n".format(
-                        self.katcp_ip, which_port
-                    )
-                )
-                return client
-            except Exception:
-                client.stop()
-                self.logger.error("Could not connect to katcp, timed out.")
+        for inform in informs:
+            if self.array_name is None or inform.arguments[0] == self.array_name:
+                return inform.arguments
+        raise KeyError("No array named %s on %s" % (self.array_name, self.katcp_ip))
 
     def sensor_request(
         self, client, katcprequest="array-list", katcprequestArg=None, timeout=10
@@ -208,11 +443,11 @@ class SensorPoll(LoggingClass):
 
         Parameters
         =========
-        client: katcp.client.BlockingClient
+        client: katcp.client.DeviceClient
             katcp running client
         katcprequest: str
             Katcp requests messages [Defaults: 'array-list']
-        katcprequestArg: str
+        katcprequestArg: str or list
             katcp requests messages arguments eg. array-list array0 [Defaults: None]
         timeout: int
             katcp timeout [Defaults :10]
@@ -223,34 +458,47 @@ class SensorPoll(LoggingClass):
             katcp request messages
         """
         try:
-            if katcprequestArg:
-                reply, informs = client.blocking_request(
-                    katcp.Message.request(katcprequest, katcprequestArg),
-                    timeout=timeout,
-                )
+            if isinstance(katcprequestArg, (list, tuple)):
+                args = katcprequestArg
+            elif katcprequestArg:
+                args = [katcprequestArg]
             else:
-                reply, informs = client.blocking_request(
-                    katcp.Message.request(katcprequest), timeout=timeout
-                )
+                args = []
+            started = time.time()
+            reply, informs = self._backend.request(
+                client, katcprequest, args, timeout=timeout
+            )
+            # a single sensor's value, eg: the mappings, is not timed with all sensor values
+            self.metrics.request(
+                self.array_name,
+                "%s %s" % (katcprequest, args[0])
+                if katcprequest == "sensor-value" and args else katcprequest,
+                time.time() - started,
+                len(informs),
+            )
             assert reply.reply_ok()
         except Exception:
             self.logger.error("Failed to execute katcp command")
-            # time.sleep(20)
+            self.connections.check(client)
             raise
         else:
             return reply, informs
 
-    def cleanup(self, client):
-        if self._started:
-            self.logger.debug("Some Cleaning Up!!!")
-            client.stop()
-            time.sleep(0.1)
-            if client.is_connected():
-                self.logger.error("Did not clean up client properly, %s" % client.bind_address)
-
+    def cleanup(self):
+        self.logger.debug("Some Cleaning Up!!!")
+        self.connections.stop()
+        if self._shm_writer is not None:
+            self._shm_writer.close()
+        if self._history is not None:
+            self._history.close()
 
     @property
     def get_sensor_values(self):
+        if self.sampling_strategy and self._sensor_table:
+            with self._sensor_table_lock:
+                yield [[timestamp, "1", name, status, value]
+                       for name, (timestamp, status, value) in self._sensor_table.iteritems()]
+            return
         try:
             assert self.katcp_sensor_port
             reply, informs = self.sensor_request(
@@ -262,6 +510,101 @@ class SensorPoll(LoggingClass):
             self.logger.error("No Sensors!!! Exiting!!!")
             raise
 
+    def _update_sensor_table(self, arguments):
+        """
+        Update the in-memory sensor table from a #sensor-status inform, flagging the mappings
+        for a rebuild only when the sensor status actually changed.
+
+        Params
+        ======
+        arguments: list
+            inform arguments, eg: [timestamp, '1', name, status, value]
+        """
+        try:
+            timestamp, name, status, value = arguments[0], arguments[2], arguments[3], arguments[4]
+        except IndexError:
+            return
+        with self._sensor_table_lock:
+            previous = self._sensor_table.get(name)
+            self._sensor_table[name] = (timestamp, status, value)
+        if previous is None or previous[1] != status:
+            self._sensors_changed.set()
+
+    def subscribe_sensors(self):
+        """
+        Seed the sensor table with the current sensor values and set the sampling strategy
+        on all device-status sensors, such that changes are pushed to us as #sensor-status
+        informs instead of polling.
+
+        The other sensors, and device-status sensors whose sampling could not be set, are
+        not subscribed: their values are only refreshed by the resync every resync_time
+        seconds.
+        """
+        self._resubscribe.clear()
+        reply, informs = self.sensor_request(
+            self.sec_sensors_katcp_con, katcprequest="sensor-value")
+        with self._sensor_table_lock:
+            self._sensor_table = dict(
+                (i.arguments[2], (i.arguments[0], i.arguments[3], i.arguments[4]))
+                for i in informs if len(i.arguments) > 4
+            )
+            sensor_names = [name for name in self._sensor_table if "device-status" in name]
+        self._last_resync = time.time()
+        self._sensors_changed.set()
+        self.logger.info(
+            "Setting sensor-sampling '%s' on %s device-status sensors",
+            " ".join(self.sampling_strategy), len(sensor_names))
+        client = self.sec_sensors_katcp_con
+        flags = client.protocol_flags
+        failed = sensor_names
+        if sensor_names and flags is not None and flags.bulk_set_sensor_sampling:
+            # katcp v5.1, a single request for all sensors
+            failed = self._set_sampling(client, [",".join(sensor_names)])
+            if failed:
+                self.logger.warning(
+                    "Bulk sensor-sampling failed on %s, setting it per sensor", self.array_name)
+                failed = sensor_names
+        if failed:
+            failed = self._set_sampling(client, failed)
+        if failed:
+            self.logger.warning(
+                "Could not set sensor-sampling on %s of %s sensors on %s, they are only "
+                "refreshed on resync, eg: %s",
+                len(failed), len(sensor_names), self.array_name, failed[0])
+
+    def _set_sampling(self, client, names):
+        """
+        Set the sampling strategy of the sensors with one ?sensor-sampling request per
+        entry of names, all sent before waiting for the replies
+
+        Return
+        ======
+        failed: list
+            entries of names whose request failed or timed out
+        """
+        started = time.time()
+        replies = self._backend.requests(
+            client, "sensor-sampling", [[name] + self.sampling_strategy for name in names])
+        self.metrics.request(self.array_name, "sensor-sampling", time.time() - started, 0)
+        failed = [
+            name for name, reply in zip(names, replies) if reply is None or not reply.reply_ok()
+        ]
+        if failed:
+            self.connections.check(client)
+        return failed
+
+    @property
+    def sensors_changed(self):
+        """
+        Check whether the sensor mappings need to be rebuilt, always True when polling
+        """
+        if not self.sampling_strategy:
+            return True
+        if self._resubscribe.is_set() or (time.time() - self._last_resync > self.resync_time):
+            self.logger.info("Re-subscribing to sensors on %s", self.array_name)
+            self.subscribe_sensors()
+        return self._sensors_changed.is_set()
+
     @property
     def get_hostmapping(self):
         try:
@@ -275,7 +618,7 @@ class SensorPoll(LoggingClass):
             assert int(reply.arguments[-1])
             yield [inform.arguments for inform in informs]
         except AssertionError:
-            self.cleanup(self.sec_sensors_katcp_con)
+            self.connections.stop("sensor")
             self.logger.error("No Sensors!!! Exiting!!!")
             raise
 
@@ -293,27 +636,24 @@ class SensorPoll(LoggingClass):
             assert int(reply.arguments[-1])
             yield [inform.arguments for inform in informs]
         except AssertionError:
-            self.cleanup(self.sec_client)
+            self.connections.stop("array")
             self.logger.error("No Sensors!!! Exiting!!!")
             raise
 
-    @property
-    def get_sensor_dict(self):
-        sensor_value_informs = next(self.get_sensor_values)
-        self.logger.debug("Converting sensor list to dict!!!")
-        # sensors name + status + value
-        self.original_sensors = dict(
-            (x[0], x[1:]) for x in [i[2:] for i in sensor_value_informs]
-        )
-        # sensors name and status
-        simplified_sensors = dict(
-            (x[0], x[1]) for x in [i[2:] for i in sensor_value_informs]
-        )
-        simplified_ordered_sensors = OrderedDict(sorted(simplified_sensors.items()))
-        try:
-            return simplified_ordered_sensors
-        except Exception as exc:
-            raise exc
+    def take_snapshot(self):
+        """
+        Read all sensor values once for this poll cycle
+
+        Return
+        =======
+        snapshot: SensorSnapshot
+            immutable sensor snapshot, passed to every mapping stage
+        """
+        with self.metrics.timer(self.array_name, "read"):
+            sensor_value_informs = next(self.get_sensor_values)
+        self.logger.debug("Converting sensor list to snapshot!!!")
+        with self.metrics.timer(self.array_name, "parse"):
+            return SensorSnapshot(sensor_value_informs)
 
     def do_mapping(self):
         try:
@@ -348,77 +688,36 @@ class SensorPoll(LoggingClass):
             )
             return [input_mapping, hostname_mapping]
 
-    def get_list_index(self, String, List):
-        """
-        Find the index of a string in a list
-
-        Params
-        =======
-        String: str
-            String to search in list
-        List: list
-            List to be searched!
-
-        Return
-        =======
-        list
-        """
-        try:
-            return [_c for _c, i in enumerate(List) if any(String in x for x in i)][0]
-        except Exception:
-            self.logger.error("Failed to find the index of string in list")
-
-    def new_mapping(self, _host):
+    def new_mapping(self, _host, snapshot):
         try:
-            self.logger.debug("Sorting ordered sensor dict by %ss!!!" % _host)
-            ordered_sensor_dict = self.get_sensor_dict
-            assert isinstance(ordered_sensor_dict, OrderedDict)
+            self.logger.debug("Sorting sensor snapshot by %ss!!!", _host)
+            assert isinstance(snapshot, SensorSnapshot)
         except Exception:
-            self.logger.error("Failed to retrieve sensor dict", exc_info=True)
+            self.logger.error("Failed to retrieve sensor snapshot", exc_info=True)
         else:
-            mapping = []
-            for key, value in ordered_sensor_dict.iteritems():
-                key_s = key.split(".")
-                host = key_s[0].lower()
-                if host.startswith(_host) and ("device-status" in key_s):
-                    new_value = [x.replace("device-status", value) for x in key_s[1:]]
-                    if "network-reorder" in new_value:
-                        # rename such that, it fits on html/button
-                        _indices = new_value.index("network-reorder")
-                        new_value[_indices] = new_value[_indices].replace(
-                            "network-reorder", "Net-ReOrd"
-                        )
-                    if "missing-pkts" in new_value:
-                        # rename such that, it fits on html/button
-                        _indices = new_value.index("missing-pkts")
-                        new_value[_indices] = new_value[_indices].replace(
-                            "missing-pkts", "hmcReOrd"
-                        )
-                    if "bram-reorder" in new_value:
-                        # rename such that, it fits on html/button
-                        _indices = new_value.index("bram-reorder")
-                        new_value[_indices] = new_value[_indices].replace(
-                            "bram-reorder", "bramReOrd"
-                        )
-
-                    new_dict = dict(
-                        izip_longest(*[iter([host, new_value])] * 2, fillvalue="")
-                    )
-                    mapping.append(new_dict)
+            # the host's own device-status is displayed with its hostname
+            new_mapping = group_by_host(
+                (sensor.host, list(sensor.path or (sensor.label,)) + [snapshot.status(key)])
+                for key, sensor in self.sensor_index(snapshot).device_status(_host)
+            )
+            return new_mapping
 
-            new_mapping = combined_Dict_List(*mapping)
-            for host, _list in new_mapping.iteritems():
-                if host in self.hostname_mapping:
-                    new_hostname = host.replace(_host, "") + self.hostname_mapping[
-                        host
-                    ].replace("skarab", "-").replace("-01", "")
-                _ = [value.insert(0, new_hostname)
-                    for value in _list if len(value) == 1]
+    def sensor_index(self, snapshot):
+        """
+        Parsed sensor names of the array, rebuilt only when the set of sensor names changed
 
-            return new_mapping
+        Return
+        =======
+        index: SensorNameIndex
+        """
+        if self._sensor_index is None or not self._sensor_index.is_current(
+            snapshot, self.hostname_mapping
+        ):
+            self.logger.info("Indexing %s sensor names", len(snapshot))
+            self._sensor_index = SensorNameIndex(snapshot.names, self.hostname_mapping)
+        return self._sensor_index
 
-    @property
-    def map_xhost_sensors(self):
+    def map_xhost_sensors(self, snapshot):
         """
         Needs to be in this format:
             'host03': [
@@ -434,58 +733,28 @@ class SensorPoll(LoggingClass):
             }
 
         """
-        xhost_sig_chain = [
-            "-02",
-            "network",
-            "spead-rx",
-            "Net-ReOrd",
-            "hmcReOrd",
-            "bramReOrd",
-            "vacc",
-            "spead-tx",
-        ]
         try:
-            new_mapping = self.new_mapping("xhost")
+            new_mapping = self.new_mapping("xhost", snapshot)
             assert isinstance(new_mapping, dict)
         except Exception:
             self.logger.error("Failed to map xhosts", exc_info=True)
         else:
             new_dict_mapping = {}
             for keys, values in new_mapping.iteritems():
-                keys_ = keys[1:]
-                new_dict_mapping[keys_] = []
-                for value in values:
-                    if (len(value) <= 2) and (not value[0].startswith("xeng")):
-                        new_dict_mapping[keys_].append(value)
-                    if (
-                        value[0].startswith("xeng")
-                        and value not in new_dict_mapping.values()
-                    ):
-                        if "vacc" in value:
-                            new_dict_mapping[keys_].append(value[1:])
-                        if "spead-tx" in value:
-                            new_dict_mapping[keys_].append(value[1:])
-                        if "bramReOrd" in value:
-                            new_dict_mapping[keys_].append(value[1:])
-
-            # _ = [listA.insert(_index, listA.pop(self.get_list_index(_sig, listA)))
-            #      for _, listA in new_dict_mapping.iteritems() for _index, _sig in enumerate(xhost_sig_chain)]
-            # return new_dict_mapping
-            fixed_dict_mapping = {}
-            for host_, listA in new_dict_mapping.iteritems():
-                listA = listA[: len(xhost_sig_chain)]
-                for _index, _sig in enumerate(xhost_sig_chain):
-                    listA.insert(_index, listA.pop(self.get_list_index(_sig, listA)))
-                fixed_dict_mapping[host_] = listA
-            return fixed_dict_mapping
+                # xeng entries, eg: ['xeng0', 'vacc', 'error'] -> ['vacc', 'error']. The first
+                # xengine wins the vacc, spead-tx and bramReOrd stages
+                new_dict_mapping[keys[1:]] = XHOST_SIG_CHAIN.order(
+                    value[1:] if value[0].startswith("xeng") else value
+                    for value in values
+                    if len(value) <= 2 or value[0].startswith("xeng")
+                )
+            return new_dict_mapping
 
-    @property
-    def map_fhost_sensors(self):
+    def map_fhost_sensors(self, snapshot):
         """
         {
              'fhost03': [
                             ['SKA-020709', 'warn'],
-                            ['fhost00', 'skarab020709-01'],
                             ['ant0_y', 'inputlabel'],
                             ['network', 'nominal'],
                             ['spead-rx', 'failure'],
@@ -494,82 +763,37 @@ class SensorPoll(LoggingClass):
                             ['pfb', 'warn'],
                             ['ct', 'nominal'],
                             ['spead-tx', 'nominal'],
-                            ['->XEngine', 'xhost']
                         ]
         }
 
+        Entries that belong to no stage of FHOST_SIG_CHAIN are dropped, see SignalChain.order
         """
-
-        # Abbreviated signal chain
-        # F_LRU -> Host -> input_label -> network-trx -> spead-rx -> network-reorder -> cd -> pfb -->>
-        #    -->> ct -> spead-tx -> network-trx : [To Xengine ]
-        # issue reading cmc3 input labels
-        # fhost_sig_chain = ['SKA', 'fhost', 'network', 'spead-rx', 'Net-ReOrd', 'cd', 'pfb',
-        fhost_sig_chain = [
-            "-02",
-            "input",
-            "network",
-            "spead-rx",
-            "Net-ReOrd",
-            "cd",
-            "pfb",
-            "ct",
-            "spead-tx",
-        ]
         try:
-            new_mapping = self.new_mapping("fhost")
+            new_mapping = self.new_mapping("fhost", snapshot)
             assert isinstance(new_mapping, dict)
         except Exception:
             self.logger.error("Failed to map fhosts", exc_info=True)
         else:
+            new_dict_mapping = {}
             for host, values in new_mapping.iteritems():
                 if host in self.hostname_mapping:
-                    values.insert(
-                        2, [self.input_mapping[self.hostname_mapping[host]], "inputlabel"]
+                    values.append(
+                        [self.input_mapping[self.hostname_mapping[host]], "inputlabel"]
                     )
                     # values.append(['->XEngine', 'xhost'])
-
-            new_dict_mapping = {}
-            for host, values in new_mapping.iteritems():
-                host_ = host[1:]
-                new_dict_mapping[host_] = values
-            # Update mappings
-            _ = [listA.insert(_index, listA.pop(self.get_list_index(_sig, listA)))
-                for _, listA in new_dict_mapping.iteritems()
-                for _index, _sig in enumerate(fhost_sig_chain)
-                ]
+                new_dict_mapping[host[1:]] = FHOST_SIG_CHAIN.order(values)
 
             return new_dict_mapping
 
-    @property
-    def get_original_mapped_sensors(self):
-        mapping = []
-        for key, value in self.original_sensors.iteritems():
-            host = key.split(".")[0].lower()
-            if host[1:].startswith("host"):
-                if value[0] != "nominal":
-                    value.insert(0, key)
-                    new_dict = dict(
-                        izip_longest(*[iter([host, value])] * 2, fillvalue="")
-                    )
-                    mapping.append(new_dict)
-
-        new_mapping = combined_Dict_List(*mapping)
+    def get_original_mapped_sensors(self, snapshot):
+        hosts = self.sensor_index(snapshot).hosts
+        new_mapping = group_by_host(
+            (hosts[key], [key, status, value])
+            for key, status, value in snapshot
+            if status != "nominal" and key in hosts
+        )
         return new_mapping
 
-    @staticmethod
-    def merged_sensors_dict(dict1, dict2):
-        """
-        merge two dictionaries
-        https://stackoverflow.com/questions/38987/how-to-merge-two-dictionaries-in-a-single-expression#26853961
-        """
-        for key, value in dict2.iteritems():
-            dict1.setdefault(key, []).extend(value)
-        return dict1
-        # merged_sensors = f_sensors.copy()
-        # merged_sensors.update(x_sensors)
-        # return merged_sensors
-
     def create_dumps_dir(self):
         """
         Create json dumps directory
@@ -581,42 +805,341 @@ class SensorPoll(LoggingClass):
             _dir, _name = os.path.split(os.path.dirname(os.path.realpath(__name__)))
         path = _dir + "/json_dumps"
         if not os.path.exists(path):
-            self.logger.info("Created %s for storing json dumps." % path)
+            self.logger.info("Created %s for storing json dumps.", path)
             os.makedirs(path)
 
-    def write_sorted_sensors_to_file(self):
+    def dump_path(self, name):
+        """
+        Params
+        ======
+        name: str
+            eg: sensor_values.json
+
+        Return
+        ======
+        path: str
+            {json_dumps}/{hostname}.{array_name}.{name}
+        """
         try:
-            sensors = self.merged_sensors_dict(
-                self.map_fhost_sensors, self.map_xhost_sensors
+            cur_path = os.path.split(os.path.dirname(os.path.abspath(__file__)))[0]
+        except Exception:
+            cur_path = os.path.split(os.path.dirname(os.path.abspath(__name__)))[0]
+        return "{}/json_dumps/{}.{}.{}".format(cur_path, self.hostname, self.array_name, name)
+
+    @property
+    def change_log(self):
+        if self._change_log is None:
+            self.create_dumps_dir()
+            self._change_log = ChangeLog(
+                self.dump_path("sensor_changes.log"),
+                checkpoint_interval=self.checkpoint_interval,
             )
+        return self._change_log
+
+    @property
+    def snapshot_writer(self):
+        if self._snapshot_writer is None:
+            self.create_dumps_dir()
+            self._snapshot_writer = SnapshotWriter(
+                self.dump_path("sensor_snapshot.cbfs"), encoding=self.snapshot_encoding)
+        return self._snapshot_writer
+
+    @property
+    def shm_writer(self):
+        if self._shm_writer is None:
+            self._shm_writer = ShmTableWriter(os.path.join(
+                self.shm_dir, "{}.{}.sensor_table".format(self.hostname, self.array_name)))
+        return self._shm_writer
+
+    @property
+    def history(self):
+        if self._history is None:
+            self.create_dumps_dir()
+            self._history = SensorHistory(
+                self.dump_path("history"),
+                raw_days=self.history_raw_days,
+                retention_days=self.history_days,
+            )
+        return self._history
+
+    def record_history(self, snapshot):
+        """
+        Append the statuses of the array's device-status sensors to the history, a failure is
+        logged and does not stop the poll cycle
+        """
+        index = self.sensor_index(snapshot)
+        statuses = dict(
+            (name, snapshot.status(name))
+            for host_type in ("fhost", "xhost")
+            for name, _ in index.device_status(host_type)
+        )
+        try:
+            self.history.append(snapshot.timestamp, statuses)
+        except Exception:
+            self.logger.error("Failed to append to %s", self.history.path, exc_info=True)
+
+    def write_sorted_sensors_to_file(self):
+        self.ensure_connected()
+        if not self.sensors_changed:
+            self.logger.debug("No sensor status changes on %s, nothing to update", self.array_name)
+            self._rows_changed = False
+            return
+        self._sensors_changed.clear()
+        try:
+            snapshot = self.take_snapshot()
+            with self.metrics.timer(self.array_name, "map"):
+                # the host rows are a view of the matrix, fhost stages followed by xhost
+                # stages
+                matrix = StatusMatrix.from_chains(
+                    ("fhost", FHOST_SIG_CHAIN, self.map_fhost_sensors(snapshot)),
+                    ("xhost", XHOST_SIG_CHAIN, self.map_xhost_sensors(snapshot)),
+                )
+                sensors = matrix.to_rows()
+                original_sensors = self.get_original_mapped_sensors(snapshot)
         except Exception:
             self.logger.error(
                 "Failed to map the host sensors",
                 exc_info=True
                 )
             raise
+        if self.history_days:
+            with self.metrics.timer(self.array_name, "history"):
+                self.record_history(snapshot)
+        changes = matrix.diff(self.status_matrix)
+        self.status_matrix = matrix
+        self._rows_changed = changes is None or bool(changes)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Failing elements per stage on %s: %s",
+                              self.array_name, matrix.counts_per_stage())
+        state = {"sensor_values": sensors, "ordered_sensor_values": original_sensors}
+        with self.metrics.timer(self.array_name, "change_log"):
+            record = self.change_log.write(state, timestamp=snapshot.timestamp)
+        if record is None:
+            self.logger.debug("No host rows changed on %s, nothing to update", self.array_name)
+            return
+        # the cells changed since the last snapshot, such that the dashboard showing it
+        # updates them only
+        cells = matrix.row_changes(self._snapshot_matrix)
+        if cells is not None:
+            state = dict(
+                state, changes={"generation": self.snapshot_writer.generation, "cells": cells})
+        with self.metrics.timer(self.array_name, "snapshot"):
+            generation = self.snapshot_writer.write(state, snapshot.timestamp)
+        self._snapshot_matrix = matrix
+        self.metrics.payload(self.array_name, "snapshot", self.snapshot_writer.size)
+        if self.shm_dir:
+            with self.metrics.timer(self.array_name, "shm"):
+                self.shm_writer.publish(
+                    sensors, original_sensors, snapshot.timestamp, generation)
+        if self.snapshot_server is not None:
+            with self.metrics.timer(self.array_name, "http"):
+                self.snapshot_server.publish(
+                    self.array_name, state, generation, snapshot.timestamp)
+        self.logger.info(
+            "Wrote %s %s to %s and snapshot generation %s, %s (sensors read at %s)",
+            record["type"], record["seq"], self.change_log.path, generation,
+            "new host table" if changes is None else "%s cells changed" % len(changes),
+            time.ctime(snapshot.timestamp))
+        if self.json_dumps:
+            _filename = self.dump_path("sensor_values.json")
+            self.logger.info("Updating file: %s", _filename)
+            with self.metrics.timer(self.array_name, "serialize"):
+                dumps = [
+                    ("sensor_values.json", json.dumps(sensors, indent=4, sort_keys=True)),
+                    ("ordered_sensor_values.json",
+                     json.dumps(original_sensors, indent=4, sort_keys=True)),
+                ]
+            with self.metrics.timer(self.array_name, "write"):
+                for name, data in dumps:
+                    atomic_write(self.dump_path(name), data)
+            for name, data in dumps:
+                self.metrics.payload(self.array_name, name, len(data))
+
+
+class MultiArrayPoll(LoggingClass):
+    def __init__(
+        self, katcp_ip, katcp_port=7147, array_names=None, timeout=10, backend="blocking",
+        http_port=None, http_host="0.0.0.0", poll_time=None, metrics_log_time=0, **kwargs
+    ):
+        """
+        Poll every array reported by ?array-list concurrently from a single process. Each
+        array keeps its own SensorPoll state and writes its own json dumps, so a poll cycle
+        takes as long as the slowest array.
+
+        Parameters
+        =========
+        katcp_ip: str
+            IP to connect to!
+        katcp_port: int
+            Port to connect to! [Defaults: 7147]
+        array_names: list
+            Only poll these arrays [Defaults: all arrays]
+        timeout: int
+            katcp timeout [Defaults :10]
+        backend: str
+            katcp connection backend shared by all arrays, blocking or ioloop
+            [Defaults: blocking]
+        http_port: int
+            serve every array's latest snapshot on this port, with ETags [Defaults: None]
+        http_host: str
+            address the snapshot server binds to [Defaults: 0.0.0.0]
+        poll_time: int
+            target seconds between poll cycles, for the overrun metrics [Defaults: None]
+        metrics_log_time: int
+            log a summary of the poll metrics every x seconds, 0 to never [Defaults: 0]
+        kwargs: dict
+            passed to every SensorPoll, eg: sampling_strategy
+        """
+        self.katcp_ip = katcp_ip
+        self.katcp_port = katcp_port
+        self.array_names = array_names
+        self.timeout = timeout
+        self.metrics = PollMetrics(poll_time=poll_time, connections=lambda: self.connection_metrics)
+        self.metrics_log_time = metrics_log_time
+        self._metrics_logged = time.time()
+        self.snapshot_server = None
+        if http_port:
+            self.snapshot_server = SnapshotServer(
+                http_host, http_port, name=katcp_ip, metrics=self.metrics).start()
+        # a newly found array gets one connection attempt per cycle
+        self.poll_kwargs = dict(
+            kwargs, backend=backend, connect_attempts=1, snapshot_server=self.snapshot_server,
+            metrics=self.metrics,
+        )
+        self.connections = ConnectionManager(
+            get_backend(backend),
+            self.katcp_ip,
+            timeout=timeout,
+            max_delay=kwargs.get("max_reconnect_delay", 60),
+        )
+        self.sensor_polls = {}
+        self._pool = None
+        self._pool_size = 0
+
+    @property
+    def connection_metrics(self):
+        """
+        State of the primary connection and of every array's connections
+        """
+        metrics = self.connections.metrics()
+        metrics["arrays"] = dict(
+            (array_name, sensor_poll.connection_metrics)
+            for array_name, sensor_poll in self.sensor_polls.items()
+        )
+        return metrics
+
+    @property
+    def active(self):
+        """
+        Host rows changed in the last poll cycle or a host is failing on any array
+        """
+        return any(sensor_poll.active for sensor_poll in self.sensor_polls.values())
+
+    @property
+    def pending(self):
+        """
+        Any array's subscribed sensors pushed a status change that was not polled yet
+        """
+        return any(sensor_poll.pending for sensor_poll in self.sensor_polls.values())
+
+    def discover_arrays(self):
+        """
+        Names of the running arrays on the primary port
+
+        Return
+        =======
+        array_names: list
+        """
+        if "primary" in self.connections:
+            client = self.connections.get("primary")
         else:
-            self.create_dumps_dir()
-            try:
-                cur_path = os.path.split(os.path.dirname(os.path.abspath(__file__)))[0]
-            except Exception:
-                cur_path = os.path.split(os.path.dirname(os.path.abspath(__name__)))[0]
-            else:
-                _filename = "{}/json_dumps/{}.{}.sensor_values.json".format(
-                    cur_path, self.hostname, self.array_name)
-                _sensor_filename = "{}/json_dumps/{}.{}.ordered_sensor_values.json".format(
-                    cur_path, self.hostname, self.array_name)
-                self.logger.info("Updating file: %s" % _filename)
-                with open(_filename, "w") as outfile:
-                    json.dump(sensors, outfile, indent=4, sort_keys=True)
-                with open(_sensor_filename, "w") as outfile:
-                    json.dump(
-                        self.get_original_mapped_sensors,
-                        outfile,
-                        indent=4,
-                        sort_keys=True,
-                    )
-                self.logger.info("Updated: %s" % _filename)
+            client = self.connections.connect("primary", self.katcp_port, attempts=1)
+        try:
+            reply, informs = self.connections.backend.request(
+                client, "array-list", timeout=self.timeout)
+        except Exception:
+            self.connections.check(client)
+            raise
+        if not reply.reply_ok():
+            self.connections.check(client)
+            raise RuntimeError("array-list failed on {}:{}".format(self.katcp_ip, self.katcp_port))
+        return [
+            inform.arguments[0]
+            for inform in informs
+            if not self.array_names or inform.arguments[0] in self.array_names
+        ]
+
+    def _poll_array(self, array_name):
+        try:
+            if array_name not in self.sensor_polls:
+                self.logger.info("Found array %s, connecting", array_name)
+                self.sensor_polls[array_name] = SensorPoll(
+                    self.katcp_ip, self.katcp_port, array_name=array_name, **self.poll_kwargs
+                )
+            with self.metrics.timer(array_name, "total"):
+                self.sensor_polls[array_name].write_sorted_sensors_to_file()
+        except ConnectionDown as exc:
+            self.logger.warning("Not polling array %s: %s", array_name, exc)
+        except Exception:
+            self.logger.error("Failed to poll array %s", array_name, exc_info=True)
+            sensor_poll = self.sensor_polls.get(array_name)
+            if sensor_poll is not None and all(
+                metrics["state"] == "connected"
+                for metrics in sensor_poll.connection_metrics.values()
+            ):
+                # not a dropped connection, start over on the next cycle without affecting
+                # the other arrays
+                self.sensor_polls.pop(array_name).cleanup()
+
+    def write_sorted_sensors_to_file(self):
+        started = time.time()
+        try:
+            self._poll_arrays()
+        finally:
+            self.metrics.cycle(started, time.time() - started)
+            if self.metrics_log_time and (
+                    time.time() - self._metrics_logged >= self.metrics_log_time):
+                self._metrics_logged = time.time()
+                self.logger.info("Poll metrics: %s", self.metrics.summary())
+
+    def _poll_arrays(self):
+        try:
+            array_names = self.discover_arrays()
+        except ConnectionDown as exc:
+            self.logger.warning(str(exc))
+            return
+        except Exception as exc:
+            # keep polling, the next cycle retries the discovery
+            self.logger.error("No running arrays on {}:{}!!!! {}".format(
+                self.katcp_ip, self.katcp_port, exc))
+            return
+        for array_name in set(self.sensor_polls) - set(array_names):
+            self.logger.info("Array %s is gone, stop polling it", array_name)
+            self.sensor_polls.pop(array_name).cleanup()
+            if self.snapshot_server is not None:
+                self.snapshot_server.remove(array_name)
+        if not array_names:
+            self.logger.warning("No arrays to poll on %s", self.katcp_ip)
+            return
+        if len(array_names) > self._pool_size:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+            self._pool_size = len(array_names)
+            self._pool = ThreadPool(processes=self._pool_size)
+        self._pool.map(self._poll_array, array_names)
+
+    def cleanup(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        for array_name in list(self.sensor_polls):
+            self.sensor_polls.pop(array_name).cleanup()
+        self.connections.stop()
+        if self.snapshot_server is not None:
+            self.snapshot_server.stop()
+            self.snapshot_server = None
 
 
 if __name__ == "__main__":
@@ -643,6 +1166,157 @@ if __name__ == "__main__":
         type=int,
         help="Poll the sensors every x seconds [Default: 10]",
     )
+    parser.add_argument(
+        "--adaptive",
+        dest="adaptive",
+        action="store_true",
+        default=False,
+        help="Poll every --fast-poll-time seconds while statuses are changing or a host is "
+        "failing, and every --slow-poll-time seconds once all has been quiet for "
+        "--quiet-time seconds [Default: False]",
+    )
+    parser.add_argument(
+        "--fast-poll-time",
+        dest="fast_poll",
+        action="store",
+        default=None,
+        type=float,
+        help="Adaptive poll period while statuses are changing or a host is failing "
+        "[Default: half the --poll-time]",
+    )
+    parser.add_argument(
+        "--slow-poll-time",
+        dest="slow_poll",
+        action="store",
+        default=None,
+        type=float,
+        help="Adaptive heartbeat poll period once quiet [Default: 6 x --poll-time]",
+    )
+    parser.add_argument(
+        "--quiet-time",
+        dest="quiet_time",
+        action="store",
+        default=300,
+        type=int,
+        help="Seconds without status changes or failing hosts before the adaptive poll "
+        "slows down to the heartbeat [Default: 300]",
+    )
+    parser.add_argument(
+        "--array",
+        dest="array_names",
+        action="append",
+        default=None,
+        help="Array to poll, can be repeated [Default: all arrays in ?array-list]",
+    )
+    parser.add_argument(
+        "--sampling",
+        dest="sampling",
+        action="store",
+        default=None,
+        help="Subscribe to device-status sensors using katcp sensor-sampling instead of "
+        "polling, eg: 'event' or 'event-rate 1 10' [Default: None]",
+    )
+    parser.add_argument(
+        "--resync-time",
+        dest="resync_time",
+        action="store",
+        default=300,
+        type=int,
+        help="When subscribed, re-read all sensor values every x seconds, the sensors that "
+        "are not subscribed are only refreshed then [Default: 300]",
+    )
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        action="store",
+        default="blocking",
+        choices=["blocking", "ioloop"],
+        help="katcp backend, a thread per connection or one shared ioloop [Default: blocking]",
+    )
+    parser.add_argument(
+        "--max-reconnect-delay",
+        dest="max_reconnect_delay",
+        action="store",
+        default=60,
+        type=int,
+        help="Cap on the exponential backoff between reconnect attempts [Default: 60]",
+    )
+    parser.add_argument(
+        "--no-json-dumps",
+        dest="json_dumps",
+        action="store_false",
+        default=True,
+        help="Only append changes to the sensor_changes.log, do not rewrite the full json "
+        "dumps [Default: False]",
+    )
+    parser.add_argument(
+        "--checkpoint-time",
+        dest="checkpoint_interval",
+        action="store",
+        default=3600,
+        type=int,
+        help="Start the change log over with a full checkpoint every x seconds [Default: 3600]",
+    )
+    parser.add_argument(
+        "--snapshot-encoding",
+        dest="snapshot_encoding",
+        action="store",
+        default="json",
+        choices=["json", "msgpack"],
+        help="Encoding of the snapshot file read by the dashboard [Default: json]",
+    )
+    parser.add_argument(
+        "--shm-dir",
+        dest="shm_dir",
+        action="store",
+        default=None,
+        help="Also publish the host rows to a shared memory table in this directory, for a "
+        "dashboard on the same host, eg: /dev/shm [Default: None]",
+    )
+    parser.add_argument(
+        "--http-port",
+        dest="http_port",
+        action="store",
+        default=None,
+        type=int,
+        help="Serve the latest snapshot of every array over http on this port, eg: 8080 "
+        "[Default: None]",
+    )
+    parser.add_argument(
+        "--http-host",
+        dest="http_host",
+        action="store",
+        default="0.0.0.0",
+        help="Address the snapshot http server binds to [Default: 0.0.0.0]",
+    )
+    parser.add_argument(
+        "--history-days",
+        dest="history_days",
+        action="store",
+        default=180,
+        type=int,
+        help="Keep a history of the device-status sensor statuses for x days, 0 to disable "
+        "[Default: 180]",
+    )
+    parser.add_argument(
+        "--history-raw-days",
+        dest="history_raw_days",
+        action="store",
+        default=7,
+        type=int,
+        help="Keep every status change in the history for x days, older ones are downsampled "
+        "to 5 minutes [Default: 7]",
+    )
+    parser.add_argument(
+        "--metrics-log-time",
+        dest="metrics_log_time",
+        action="store",
+        default=0,
+        type=int,
+        help="Log a summary of the poll stage timings, katcp round trips and payload sizes "
+        "every x seconds, 0 to never. The metrics are served on /metrics of --http-port "
+        "[Default: 0]",
+    )
     parser.add_argument(
         "--loglevel",
         dest="log_level",
@@ -650,36 +1324,69 @@ if __name__ == "__main__":
         default="INFO",
         help="log level to use, default INFO, options INFO, DEBUG, ERROR",
     )
+    parser.add_argument(
+        "--log-rate-limit",
+        dest="log_rate_limit",
+        action="store",
+        default=60,
+        type=int,
+        help="Log a repeated identical warning or error once per x seconds, 0 to log all of "
+        "them [Default: 60]",
+    )
 
     argcomplete.autocomplete(parser)
     args = vars(parser.parse_args())
     pp = PrettyPrinter(indent=4)
-    log_level = None
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(module)s - %(pathname)s : %(lineno)d - %(message)s"
-    if args.get("log_level", "INFO"):
-        log_level = args.get("log_level", "INFO").upper()
-        try:
-            logging.basicConfig(level=getattr(logging, log_level), format=log_format)
-        except AttributeError:
-            raise RuntimeError("No such log level: %s" % log_level)
-        else:
-            if log_level == "DEBUG":
-                coloredlogs.install(level=log_level, fmt=log_format)
-            else:
-                coloredlogs.install(level=log_level)
+    configure_logging(args.get("log_level") or "INFO", rate_limit=args.get("log_rate_limit"))
 
     katcp_ip = args.get("katcp_host_ip")
     katcp_port = args.get("katcp_host_port")
 
-    sensor_poll = SensorPoll(katcp_ip, katcp_port)
+    sensor_poll = MultiArrayPoll(
+        katcp_ip,
+        katcp_port,
+        array_names=args.get("array_names"),
+        backend=args.get("backend"),
+        http_port=args.get("http_port"),
+        http_host=args.get("http_host"),
+        max_reconnect_delay=args.get("max_reconnect_delay"),
+        sampling_strategy=args.get("sampling"),
+        resync_time=args.get("resync_time"),
+        json_dumps=args.get("json_dumps"),
+        checkpoint_interval=args.get("checkpoint_interval"),
+        snapshot_encoding=args.get("snapshot_encoding"),
+        shm_dir=args.get("shm_dir"),
+        history_days=args.get("history_days"),
+        history_raw_days=args.get("history_raw_days"),
+        poll_time=args.get("poll"),
+        metrics_log_time=args.get("metrics_log_time"),
+    )
     main_logger = LoggingClass()
     try:
         poll_time = args.get("poll")
-        main_logger.logger.info("Begin sensor polling every %s seconds!!!" % poll_time)
+        scheduler = PollScheduler(
+            poll_time,
+            adaptive=args.get("adaptive"),
+            fast_period=args.get("fast_poll"),
+            slow_period=args.get("slow_poll"),
+            quiet_time=args.get("quiet_time"),
+        )
+        main_logger.logger.info("Begin sensor polling every %s seconds!!!", poll_time)
+        period = poll_time
         while True:
+            missed = scheduler.wait(
+                active=sensor_poll.active, wake=lambda: sensor_poll.pending)
+            if missed:
+                main_logger.logger.warning(
+                    "Poll cycle overran, skipped %s cycles (%s in total)", missed, scheduler.missed)
+            if scheduler.current_period != period:
+                period = scheduler.current_period
+                main_logger.logger.info("Polling every %s seconds", period)
+            sensor_poll.metrics.schedule(period, scheduler.lag, missed)
             sensor_poll.write_sorted_sensors_to_file()
             main_logger.logger.debug("Updating sensor on dashboard!!!")
             main_logger.logger.info("---------------------RELOADING SENSORS---------------------")
-            time.sleep(poll_time)
     except Exception:
         main_logger.logger.error("Error occurred now breaking...")
+    finally:
+        sensor_poll.cleanup()
@@ -0,0 +1,64 @@
+"""
+Sensor status names shared by the poller and the dashboard, and their codes in binary tables.
+"""
+
+# katcp sensor statuses, plus the poller's input label pseudo status
+STATUSES = (
+    "unknown",
+    "nominal",
+    "warn",
+    "error",
+    "failure",
+    "unreachable",
+    "inactive",
+    "inputlabel",
+)
+STATUS_CODES = dict((status, code) for code, status in enumerate(STATUSES))
+# padding cell of a row that is shorter than the table width
+MISSING = 255
+
+
+def status_code(status):
+    """
+    Params
+    ======
+    status: str
+        eg: nominal
+
+    Return
+    ======
+    code: int
+        index in STATUSES, unknown for statuses that are not in it
+    """
+    return STATUS_CODES.get(status.lower(), STATUS_CODES["unknown"])
+
+
+# least to most severe, the worst status of a time span is the one ranked highest. The input
+# label pseudo status is not a sensor status, it is left out of the rollups like MISSING
+SEVERITY = (
+    "nominal",
+    "inactive",
+    "unknown",
+    "warn",
+    "unreachable",
+    "error",
+    "failure",
+)
+SEVERITY_RANKS = dict((STATUS_CODES[status], rank) for rank, status in enumerate(SEVERITY))
+SEVERITY_RANKS[MISSING] = -1
+SEVERITY_RANKS[STATUS_CODES["inputlabel"]] = -1
+
+
+def worst_code(codes):
+    """
+    Params
+    ======
+    codes: iterable
+        status codes, MISSING included
+
+    Return
+    ======
+    code: int
+        the most severe code, MISSING or inputlabel when there are only such codes
+    """
+    return max(codes, key=SEVERITY_RANKS.__getitem__)
@@ -0,0 +1,227 @@
+"""
+Shared memory transport of the host rows, for a poller and dashboard on the same host.
+
+The poller maps a file, typically in /dev/shm, and publishes a fixed layout table:
+
+    header    magic "CBFT", version, reserved, seq, generation, timestamp, hosts, cells,
+              host_len, label_len, blob_len, capacity
+    hosts     hosts x host_len bytes, NUL padded host names
+    labels    hosts x cells x label_len bytes, NUL padded cell labels
+    statuses  hosts x cells status codes, see sensor_status
+    blob      blob_len bytes, compact json of the non-nominal sensors (page-2)
+
+Writes are guarded by a seqlock: seq is odd while the table is being written, a reader
+retries until it read the same even seq before and after copying the table. When the
+table outgrows the file, or the poller restarts, the file is replaced and readers map the
+new one.
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+from sensor_status import MISSING, STATUSES, status_code
+
+MAGIC = "CBFT"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQdIIIIIQ")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+
+ShmTable = namedtuple(
+    "ShmTable", ["generation", "timestamp", "sensor_format", "ordered_sensor_values", "statuses"]
+)
+
+
+class ShmError(Exception):
+    """
+    Not a shared memory table, or no consistent read was possible
+    """
+
+
+def padded_length(strings, minimum=8):
+    # round up to 8 bytes, such that small label changes keep the layout
+    longest = max([minimum] + [len(string) for string in strings])
+    return (longest + 7) // 8 * 8
+
+
+class ShmTableWriter(object):
+    """
+    Params
+    ======
+    path: str
+        file to map, eg: /dev/shm/cbf_sensors.array0
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seq = 0
+        self._file = None
+        self._map = None
+        self.capacity = 0
+
+    def _open(self, size):
+        capacity = max(size * 2, mmap.PAGESIZE)
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, "wb") as table:
+            table.truncate(capacity)
+        new_file = open(tmp_path, "r+b")
+        new_map = mmap.mmap(new_file.fileno(), capacity)
+        os.rename(tmp_path, self.path)
+        self.close()
+        self._file, self._map, self.capacity = new_file, new_map, capacity
+
+    def publish(self, sensor_format, ordered_sensor_values=None, timestamp=None, generation=0):
+        """
+        Params
+        ======
+        sensor_format: dict
+            {host: [[label, status], ...]}
+        ordered_sensor_values: dict
+            non-nominal sensors {host: [[name, status, value], ...]} [Defaults: None]
+        timestamp: float
+            time the sensors were read [Defaults: now]
+        generation: int
+            data version, eg: the snapshot generation
+        """
+        hosts = sorted(sensor_format)
+        cells = max([len(sensor_format[host]) for host in hosts] or [0])
+        labels = [[cell[0].encode("utf-8") for cell in sensor_format[host]] for host in hosts]
+        host_names = [host.encode("utf-8") for host in hosts]
+        host_len = padded_length(host_names)
+        label_len = padded_length([label for row in labels for label in row])
+        blob = json.dumps(ordered_sensor_values or {}, separators=(",", ":"))
+
+        label_data = bytearray(len(hosts) * cells * label_len)
+        status_data = bytearray([MISSING]) * (len(hosts) * cells)
+        for _h, host in enumerate(hosts):
+            for _c, cell in enumerate(sensor_format[host]):
+                index = _h * cells + _c
+                label = labels[_h][_c]
+                label_data[index * label_len:index * label_len + len(label)] = label
+                status_data[index] = status_code(cell[-1])
+        body = b"".join(
+            [struct.pack("%ds" % host_len, host) for host in host_names]
+            + [bytes(label_data), bytes(status_data), blob]
+        )
+        size = HEADER.size + len(body)
+        if size > self.capacity:
+            self._open(size)
+
+        # seqlock: odd while writing, the even seq is stored last
+        self.seq += 1
+        SEQ.pack_into(self._map, SEQ_OFFSET, self.seq)
+        self._map[HEADER.size:size] = body
+        self._map[:HEADER.size] = HEADER.pack(
+            MAGIC, VERSION, 0, self.seq, generation,
+            time.time() if timestamp is None else timestamp,
+            len(hosts), cells, host_len, label_len, len(blob), self.capacity,
+        )
+        self.seq += 1
+        SEQ.pack_into(self._map, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+class ShmTableReader(object):
+    """
+    Params
+    ======
+    path: str
+        mapped file written by a ShmTableWriter
+    retries: int
+        give up after x torn reads [Defaults: 100]
+    """
+
+    def __init__(self, path, retries=100):
+        self.path = path
+        self.retries = retries
+        self._file = None
+        self._map = None
+        self._inode = None
+
+    def _open(self):
+        self.close()
+        self._file = open(self.path, "rb")
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != MAGIC:
+            self.close()
+            raise ShmError("%s is not a sensor table" % self.path)
+
+    def _header(self):
+        if self._map is None or os.stat(self.path).st_ino != self._inode:
+            self._open()
+        return HEADER.unpack_from(self._map)
+
+    @property
+    def seq(self):
+        """
+        Current seq, changes whenever the poller published a table
+        """
+        return self._header()[3]
+
+    def read(self):
+        """
+        Return
+        ======
+        table: ShmTable
+            generation, timestamp, {host: [[label, status], ...]}, non-nominal sensors and
+            the raw status codes
+
+        Raises
+        ======
+        ShmError: no consistent read after self.retries attempts
+        """
+        for _ in xrange(self.retries):
+            header = self._header()
+            (_magic, version, _flags, seq, generation, timestamp, hosts, cells, host_len,
+             label_len, blob_len, _capacity) = header
+            if version != VERSION:
+                raise ShmError("Unsupported sensor table version %s" % version)
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            labels_offset = HEADER.size + hosts * host_len
+            statuses_offset = labels_offset + hosts * cells * label_len
+            blob_offset = statuses_offset + hosts * cells
+            # a single copy of the table, checked against the seq afterwards
+            data = self._map[HEADER.size:blob_offset + blob_len]
+            if SEQ.unpack_from(self._map, SEQ_OFFSET)[0] != seq:
+                continue
+            return self._decode(
+                data, generation, timestamp, hosts, cells, host_len, label_len, blob_len)
+        raise ShmError("No consistent read of %s after %s attempts" % (self.path, self.retries))
+
+    @staticmethod
+    def _decode(data, generation, timestamp, hosts, cells, host_len, label_len, blob_len):
+        labels_offset = hosts * host_len
+        statuses_offset = labels_offset + hosts * cells * label_len
+        statuses = bytearray(data[statuses_offset:statuses_offset + hosts * cells])
+        sensor_format = {}
+        for _h in xrange(hosts):
+            host = data[_h * host_len:(_h + 1) * host_len].rstrip(b"\0").decode("utf-8")
+            row = []
+            for _c in xrange(cells):
+                index = _h * cells + _c
+                if statuses[index] == MISSING:
+                    continue
+                start = labels_offset + index * label_len
+                label = data[start:start + label_len].rstrip(b"\0").decode("utf-8")
+                row.append([label, STATUSES[statuses[index]]])
+            sensor_format[host] = row
+        blob = data[len(data) - blob_len:] if blob_len else b"{}"
+        return ShmTable(generation, timestamp, sensor_format, json.loads(blob), statuses)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
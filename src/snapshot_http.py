@@ -0,0 +1,244 @@
+"""
+HTTP endpoint serving the poller's latest mapped snapshot of every array, and its client.
+
+GET /arrays
+    {array_name: {"generation": ..., "timestamp": ..., "url": "/arrays/<array_name>/snapshot"}}
+GET /arrays/<array_name>/snapshot
+    {"array": ..., "generation": ..., "timestamp": ..., "sensor_values": {...},
+     "ordered_sensor_values": {...}}
+
+Responses carry a strong ETag derived from the snapshot generation, a request with a
+matching If-None-Match gets an empty 304. Bodies are encoded once per snapshot, not per
+request.
+
+GET /metrics
+    poller metrics in the Prometheus text format, see poll_metrics
+GET /metrics.json
+    the same metrics as JSON
+"""
+
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import logging
+import threading
+import urllib2
+import urlparse
+
+from snapshot_io import Snapshot
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATHS = ("/metrics", "/metrics.json")
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class SnapshotRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    server_version = "SensorPoll/1.0"
+
+    def _respond(self, body=True):
+        path = urlparse.urlparse(self.path).path.rstrip("/")
+        if path in METRICS_PATHS and self.server.metrics is not None:
+            self._respond_metrics(path, body)
+            return
+        entry = self.server.resources.get(path)
+        if entry is None:
+            self.send_error(404, "No snapshot at %s" % path)
+            return
+        etag, data = entry
+        if_none_match = [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]
+        if etag in if_none_match or "*" in if_none_match:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        # cache, but revalidate every time
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def _respond_metrics(self, path, body=True):
+        # rendered per request, metrics change with every poll cycle
+        if path == "/metrics":
+            content_type, data = PROMETHEUS_CONTENT_TYPE, self.server.metrics.render()
+        else:
+            content_type = "application/json"
+            data = json.dumps(self.server.metrics.as_dict(), separators=(",", ":"),
+                              sort_keys=True)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond()
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SnapshotServer(object):
+    """
+    Params
+    ======
+    host: str
+        address to bind to [Defaults: 0.0.0.0]
+    port: int
+        port to listen on [Defaults: 8080]
+    name: str
+        poller name used in the ETags, eg: the CBF hostname [Defaults: '']
+    metrics: poll_metrics.PollMetrics
+        also serve these metrics on /metrics and /metrics.json [Defaults: None]
+    """
+
+    def __init__(self, host="0.0.0.0", port=8080, name="", metrics=None):
+        self.name = name
+        self.httpd = ThreadingHTTPServer((host, port), SnapshotRequestHandler)
+        self.httpd.resources = {}
+        self.httpd.metrics = metrics
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._update_index()
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        """
+        Serve in a daemon thread
+
+        Return
+        ======
+        server: SnapshotServer
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="SnapshotServer")
+        self._thread.setDaemon(True)
+        self._thread.start()
+        logger.info("Serving snapshots on http://%s:%s/arrays" % self.address)
+        return self
+
+    @staticmethod
+    def snapshot_path(array_name):
+        return "/arrays/%s/snapshot" % array_name
+
+    def publish(self, array_name, state, generation, timestamp):
+        """
+        Params
+        ======
+        array_name: str
+            eg: array0
+        state: dict
+            {'sensor_values': {...}, 'ordered_sensor_values': {...}}
+        generation: int
+            snapshot generation, the ETag changes with it
+        timestamp: float
+            time the sensors were read
+        """
+        document = dict(state, array=array_name, generation=generation, timestamp=timestamp)
+        data = json.dumps(document, separators=(",", ":"), sort_keys=True)
+        etag = '"%s.%s.%s"' % (self.name, array_name, generation)
+        with self._lock:
+            self._snapshots[array_name] = (generation, timestamp)
+            # a new dict, request threads only ever see a complete set of resources
+            resources = dict(self.httpd.resources)
+            resources[self.snapshot_path(array_name)] = (etag, data)
+            self.httpd.resources = resources
+            self._update_index()
+
+    def remove(self, array_name):
+        with self._lock:
+            self._snapshots.pop(array_name, None)
+            resources = dict(self.httpd.resources)
+            resources.pop(self.snapshot_path(array_name), None)
+            self.httpd.resources = resources
+            self._update_index()
+
+    def _update_index(self):
+        index = dict(
+            (array_name, {
+                "generation": generation,
+                "timestamp": timestamp,
+                "url": self.snapshot_path(array_name),
+            })
+            for array_name, (generation, timestamp) in self._snapshots.items()
+        )
+        data = json.dumps(index, separators=(",", ":"), sort_keys=True)
+        etag = '"%s"' % hashlib.sha1(data).hexdigest()
+        resources = dict(self.httpd.resources)
+        resources["/arrays"] = (etag, data)
+        self.httpd.resources = resources
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class HttpSnapshotReader(object):
+    """
+    Conditional GET client of a SnapshotServer snapshot
+
+    Params
+    ======
+    url: str
+        eg: http://10.103.254.6:8080/arrays/array0/snapshot
+    timeout: int
+        request timeout in seconds [Defaults: 5]
+    """
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self.etag = None
+        self.snapshot = None
+
+    def read(self):
+        """
+        Return
+        ======
+        snapshot: snapshot_io.Snapshot
+            generation, timestamp and state, None when unchanged since the last read
+        """
+        request = urllib2.Request(self.url)
+        if self.etag is not None:
+            request.add_header("If-None-Match", self.etag)
+        try:
+            response = urllib2.urlopen(request, timeout=self.timeout)
+        except urllib2.HTTPError as exc:
+            if exc.code == 304:
+                return None
+            raise
+        document = json.load(response)
+        self.etag = response.info().getheader("ETag")
+        self.snapshot = Snapshot(document["generation"], document["timestamp"], document)
+        return self.snapshot
+
+    def poll(self):
+        """
+        Read the snapshot if it changed
+
+        Return
+        ======
+        etag: str
+            ETag of the latest snapshot
+        """
+        self.read()
+        return self.etag
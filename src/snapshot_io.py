@@ -0,0 +1,225 @@
+"""
+Snapshot file shared by the poller and the dashboard.
+
+A snapshot file is a fixed size header followed by the encoded state:
+
+    magic     4s  "CBFS"
+    version   B   format version
+    encoding  B   0: json, 1: msgpack
+    generation Q  incremented by every write, survives poller restarts
+    timestamp d   time the sensors were read
+    length    I   payload length
+    crc       I   crc32 of the payload
+
+Files are written to a temporary file and renamed over the previous snapshot, a reader
+therefore always sees a complete file, and the header lets it check the payload and skip
+generations it has already seen.
+"""
+
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = "CBFS"
+VERSION = 1
+HEADER = struct.Struct(">4sBBQdII")
+ENCODINGS = {"json": 0, "msgpack": 1}
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotError(Exception):
+    """
+    Not a snapshot file, or a truncated/corrupt one
+    """
+
+
+Snapshot = namedtuple("Snapshot", ["generation", "timestamp", "state"])
+
+
+def atomic_write(path, data):
+    """
+    Write data to a temporary file next to path and rename it over path
+
+    Params
+    ======
+    path: str
+        destination
+    data: str
+        file content
+    """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as outfile:
+            outfile.write(data)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def encode(state, encoding="json"):
+    if encoding == "msgpack":
+        return msgpack.packb(state, use_bin_type=True)
+    return json.dumps(state, separators=(",", ":"))
+
+
+def decode(payload, encoding="json"):
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise SnapshotError("msgpack snapshot, but msgpack is not installed")
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+def read_header(fileobj):
+    """
+    Return
+    ======
+    header: tuple
+        magic, version, encoding, generation, timestamp, length, crc
+    """
+    data = fileobj.read(HEADER.size)
+    if len(data) != HEADER.size:
+        raise SnapshotError("Truncated snapshot header")
+    header = HEADER.unpack(data)
+    if header[0] != MAGIC:
+        raise SnapshotError("Not a snapshot file")
+    if header[1] != VERSION:
+        raise SnapshotError("Unsupported snapshot version %s" % header[1])
+    return header
+
+
+def read_snapshot(path):
+    """
+    Params
+    ======
+    path: str
+        snapshot path
+
+    Return
+    ======
+    snapshot: Snapshot
+        generation, timestamp and state
+
+    Raises
+    ======
+    SnapshotError: the file is not a valid snapshot
+    """
+    with open(path, "rb") as infile:
+        _magic, _version, encoding, generation, timestamp, length, crc = read_header(infile)
+        payload = infile.read(length)
+    if len(payload) != length or zlib.crc32(payload) & 0xffffffff != crc:
+        raise SnapshotError("Corrupt snapshot payload in %s" % path)
+    names = dict((value, name) for name, value in ENCODINGS.items())
+    if encoding not in names:
+        raise SnapshotError("Unknown snapshot encoding %s" % encoding)
+    return Snapshot(generation, timestamp, decode(payload, names[encoding]))
+
+
+class SnapshotWriter(object):
+    """
+    Params
+    ======
+    path: str
+        snapshot path
+    encoding: str
+        json or msgpack, falls back to json when msgpack is not installed [Defaults: json]
+    """
+
+    def __init__(self, path, encoding="json"):
+        if encoding not in ENCODINGS:
+            raise ValueError(
+                "No such snapshot encoding: %s, options %s" % (encoding, ", ".join(ENCODINGS)))
+        if encoding == "msgpack" and msgpack is None:
+            logger.warning("msgpack is not installed, writing json snapshots")
+            encoding = "json"
+        self.path = path
+        self.encoding = encoding
+        self.generation = 0
+        # bytes of the last written snapshot
+        self.size = 0
+        try:
+            with open(path, "rb") as infile:
+                # carry on from the previous poller's generation, readers only move forward
+                self.generation = read_header(infile)[3]
+        except (IOError, SnapshotError):
+            pass
+
+    def write(self, state, timestamp):
+        """
+        Params
+        ======
+        state: dict
+            eg: {'sensor_values': {...}, 'ordered_sensor_values': {...}}
+        timestamp: float
+            time the sensors were read
+
+        Return
+        ======
+        generation: int
+            generation of the written snapshot
+        """
+        payload = encode(state, self.encoding)
+        generation = self.generation + 1
+        header = HEADER.pack(
+            MAGIC, VERSION, ENCODINGS[self.encoding], generation, timestamp, len(payload),
+            zlib.crc32(payload) & 0xffffffff)
+        atomic_write(self.path, header + payload)
+        self.generation = generation
+        self.size = len(header) + len(payload)
+        return generation
+
+
+class SnapshotReader(object):
+    """
+    Read a snapshot file only when it holds a newer generation than the last one read
+
+    Params
+    ======
+    path: str
+        snapshot path
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.generation = None
+        self.timestamp = None
+
+    def read(self):
+        """
+        Return
+        ======
+        snapshot: Snapshot
+            None when the generation was already read
+
+        Raises
+        ======
+        SnapshotError: the file is not a valid snapshot
+        """
+        with open(self.path, "rb") as infile:
+            generation, timestamp = read_header(infile)[3:5]
+        if generation == self.generation:
+            return None
+        if self.generation is not None and generation < self.generation:
+            if timestamp <= self.timestamp:
+                logger.warning(
+                    "Ignoring %s, generation %s is older than %s" % (
+                        self.path, generation, self.generation))
+                return None
+            logger.warning("%s generation went back to %s, poller restarted" % (
+                self.path, generation))
+        snapshot = read_snapshot(self.path)
+        self.generation, self.timestamp = snapshot.generation, snapshot.timestamp
+        return snapshot
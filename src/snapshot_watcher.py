@@ -0,0 +1,138 @@
+"""
+Reload a file in-process whenever it is replaced, eg: the poller's sensor snapshot.
+
+Uses inotify (pyinotify) when it is installed and falls back to polling the file's
+mtime/inode/size, or a custom change key such as a shared memory table's seq.
+"""
+
+import logging
+import os
+import threading
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+class SnapshotWatcher(object):
+    """
+    Params
+    ======
+    path: str
+        file to watch, or anything change_key understands
+    load: callable
+        load(path), returns the new data or None to keep the current data
+    on_change: callable
+        called with the new data after it was swapped in [Defaults: None]
+    interval: float
+        mtime polling interval in seconds, when pyinotify is not available [Defaults: 1]
+    change_key: callable
+        change_key(path), returns a value that changes whenever the data changed, the file
+        is then polled instead of watched with inotify [Defaults: None, file stat]
+    """
+
+    def __init__(self, path, load, on_change=None, interval=1, change_key=None):
+        # a custom change key may watch something other than a file, eg: a url
+        self.path = path if change_key is not None else os.path.abspath(path)
+        self.load = load
+        self.on_change = on_change
+        self.interval = interval
+        self.change_key = change_key
+        self.logger = logging.getLogger(__name__)
+        self.current = None
+        self._stat = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._notifier = None
+
+    def _file_stat(self):
+        if self.change_key is not None:
+            try:
+                return self.change_key(self.path)
+            except Exception:
+                return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime, stat.st_size
+
+    def reload(self):
+        """
+        Load the file if it changed since the last load and swap the data in
+
+        Return
+        ======
+        changed: bool
+        """
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return False
+        try:
+            data = self.load(self.path)
+        except Exception:
+            self.logger.error("Failed to reload %s, keeping the current data" % self.path,
+                              exc_info=True)
+            return False
+        self._stat = stat
+        if data is None:
+            return False
+        # a single reference assignment, readers see either the old or the new data
+        self.current = data
+        if self.on_change is not None:
+            self.on_change(data)
+        return True
+
+    def start(self):
+        """
+        Load the file and start watching it in a daemon thread
+
+        Return
+        ======
+        watcher: SnapshotWatcher
+        """
+        self.reload()
+        if pyinotify is not None and self.change_key is None:
+            try:
+                self._start_inotify()
+                return self
+            except Exception:
+                self.logger.warning(
+                    "inotify watch on %s failed, polling every %ss" % (self.path, self.interval),
+                    exc_info=True)
+        self._thread = threading.Thread(target=self._poll, name="SnapshotWatcher")
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def _poll(self):
+        while not self._stopped.wait(self.interval):
+            self.reload()
+
+    def _start_inotify(self):
+        watcher = self
+
+        class EventHandler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                if event.pathname == watcher.path:
+                    watcher.reload()
+
+        watch_manager = pyinotify.WatchManager()
+        # the poller renames a temp file over the snapshot, watch the directory for it
+        watch_manager.add_watch(
+            os.path.dirname(self.path),
+            pyinotify.IN_MOVED_TO | pyinotify.IN_CLOSE_WRITE,
+            quiet=False,
+        )
+        self._notifier = pyinotify.ThreadedNotifier(watch_manager, EventHandler())
+        self._notifier.setDaemon(True)
+        self._notifier.start()
+        self.logger.info("Watching %s with inotify" % self.path)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._notifier is not None:
+            self._notifier.stop()
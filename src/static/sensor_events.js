@@ -0,0 +1,90 @@
+/*
+ * Patch the sensor buttons in place from the dashboard's /events stream.
+ * The page carries its data version in #sensor-events-config, the server replays what this
+ * version missed or asks for a reload when the table layout changed.
+ * In cells mode the changes arrive through the #cell-updates div instead, which a Dash
+ * callback fills with the cells that changed since the version it holds.
+ */
+(function () {
+    "use strict";
+
+    function applyStyle(element, style) {
+        element.removeAttribute("style");
+        Object.keys(style).forEach(function (key) {
+            if (key.indexOf("-") >= 0) {
+                element.style.setProperty(key, style[key]);
+            } else {
+                element.style[key] = style[key];
+            }
+        });
+    }
+
+    function applyCells(data) {
+        data.cells.forEach(function (cell) {
+            var button = document.getElementById(cell.id);
+            if (button === null) {
+                return;
+            }
+            button.textContent = cell.label;
+            applyStyle(button, cell.style);
+        });
+        Object.keys(data.counts || {}).forEach(function (id) {
+            var count = document.getElementById(id);
+            if (count !== null) {
+                count.textContent = data.counts[id];
+            }
+        });
+        var updated = document.getElementById("last-updated");
+        if (updated !== null) {
+            updated.textContent = data.updated;
+        }
+    }
+
+    function watchCellUpdates(config) {
+        var updates = document.getElementById("cell-updates");
+        if (updates === null || !window.MutationObserver) {
+            window.setInterval(function () { window.location.reload(); }, config.refresh);
+            return;
+        }
+        new MutationObserver(function () {
+            var data = JSON.parse(updates.textContent);
+            if (data.reload) {
+                window.location.reload();
+            } else if (data.cells) {
+                applyCells(data);
+            }
+        }).observe(updates, {childList: true, characterData: true, subtree: true});
+    }
+
+    function connect(config) {
+        if (config.mode === "cells") {
+            watchCellUpdates(config);
+            return;
+        }
+        if (!window.EventSource) {
+            // no push, reload the page at the old polling interval
+            window.setInterval(function () { window.location.reload(); }, config.refresh);
+            return;
+        }
+        var source = new EventSource("/events?version=" + encodeURIComponent(config.version));
+        source.addEventListener("cells", function (event) {
+            applyCells(JSON.parse(event.data));
+        });
+        source.addEventListener("reload", function () {
+            source.close();
+            window.location.reload();
+        });
+    }
+
+    // the layout is rendered by dash-renderer after this script was loaded
+    function waitForLayout() {
+        var config = document.getElementById("sensor-events-config");
+        if (config === null) {
+            window.setTimeout(waitForLayout, 100);
+            return;
+        }
+        connect(JSON.parse(config.textContent));
+    }
+
+    waitForLayout();
+})();
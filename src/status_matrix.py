@@ -0,0 +1,445 @@
+"""
+Host x signal chain stage matrix of sensor statuses.
+
+The host rows, {host: [[label, status], ...]}, are held as a uint8 matrix of status codes,
+see sensor_status, with a row per host and a column per signal chain stage: the fhost
+stages followed by the xhost stages. Counts of failing elements, worst statuses and diffs
+against the previous poll cycle are numpy operations on the matrix, the host rows are a
+view of it.
+
+HealthSummary keeps the array-wide counts per status, host type and stage of the host rows
+up to date from the cells that changed.
+"""
+
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from sensor_status import MISSING, SEVERITY, STATUS_CODES, STATUSES, status_code
+
+
+class SignalChain(object):
+    """
+    Precomputed stage-rank table used to order a host's entries along its signal chain.
+
+    An entry belongs to the first stage contained in any of its fields, eg: ['ant0_xy',
+    'inputlabel'] belongs to 'input'. Ranks are memoized per entry, such that ordering a
+    host's row is a single pass of dict lookups.
+
+    Params
+    =======
+    stages: list
+        signal chain stages, in display order
+    labels: dict
+        readable names of stages whose match key is not, eg: {'-02': 'host'}
+        [Defaults: None, the stage itself]
+    """
+
+    def __init__(self, stages, labels=None):
+        self.stages = tuple(stages)
+        self.labels = tuple((labels or {}).get(stage, stage) for stage in self.stages)
+        self._exact = dict((stage, _c) for _c, stage in enumerate(self.stages))
+        self._ranks = {}
+
+    def __len__(self):
+        return len(self.stages)
+
+    def rank(self, entry):
+        """
+        Stage index of an entry, None if it does not belong to any stage
+        """
+        key = tuple(entry)
+        try:
+            return self._ranks[key]
+        except KeyError:
+            rank = self._exact.get(entry[0])
+            if rank is None:
+                rank = next(
+                    (_c for _c, stage in enumerate(self.stages) if any(stage in x for x in entry)),
+                    None,
+                )
+            self._ranks[key] = rank
+            return rank
+
+    def order(self, entries):
+        """
+        Slot entries into their stages
+
+        Params
+        =======
+        entries: list
+            host entries, eg: [['network', 'nominal'], ['00-020709', 'warn'], ...]
+
+        Return
+        =======
+        row: list
+            one entry per stage, in signal chain order. The first entry of a stage wins and
+            missing stages are filled with a [label, MISSING_STAGE_STATUS] placeholder.
+            Entries not belonging to any stage, eg: ['->XEngine', 'xhost'], are dropped,
+            such that every row has a cell per StatusMatrix column
+
+        eg:
+        >>> FHOST_SIG_CHAIN.order([['network', 'nominal'], ['->XEngine', 'xhost']])[:3]
+        [['host', 'unknown'], ['input', 'unknown'], ['network', 'nominal']]
+        """
+        row = [None] * len(self.stages)
+        for entry in entries:
+            rank = self.rank(entry)
+            if rank is not None and row[rank] is None:
+                row[rank] = entry
+        return [
+            entry if entry is not None else [label, MISSING_STAGE_STATUS]
+            for label, entry in zip(self.labels, row)
+        ]
+
+
+MISSING_STAGE_STATUS = "unknown"
+# readable names of the stages matched by a substring of the entry, '-02' is in the host's
+# own device-status label, eg: SKA-020709
+STAGE_LABELS = {"-02": "host"}
+
+# Abbreviated signal chain
+# F_LRU -> Host -> input_label -> network-trx -> spead-rx -> network-reorder -> cd -> pfb -->>
+#    -->> ct -> spead-tx -> network-trx : [To Xengine ]
+# issue reading cmc3 input labels
+# fhost_sig_chain = ['SKA', 'fhost', 'network', 'spead-rx', 'Net-ReOrd', 'cd', 'pfb',
+FHOST_SIG_CHAIN = SignalChain(
+    ["-02", "input", "network", "spead-rx", "Net-ReOrd", "cd", "pfb", "ct", "spead-tx"],
+    STAGE_LABELS,
+)
+XHOST_SIG_CHAIN = SignalChain(
+    ["-02", "network", "spead-rx", "Net-ReOrd", "hmcReOrd", "bramReOrd", "vacc", "spead-tx"],
+    STAGE_LABELS,
+)
+
+FAILING = ("error", "failure")
+# severity rank + 1 of every code, 0 for MISSING, inputlabel and codes that are not statuses
+SEVERITY_TABLE = np.zeros(256, dtype=np.uint8)
+for _rank, _status in enumerate(SEVERITY):
+    SEVERITY_TABLE[STATUS_CODES[_status]] = _rank + 1
+CODE_BY_SEVERITY = np.array([MISSING] + [STATUS_CODES[_status] for _status in SEVERITY],
+                            dtype=np.uint8)
+# status name of every code, None for MISSING
+STATUS_NAMES = np.array(list(STATUSES) + [None] * (256 - len(STATUSES)), dtype=object)
+
+
+class StatusMatrix(object):
+    """
+    Params
+    ======
+    hosts: list
+        sorted host names, eg: ['host00', 'host01']
+    stages: list
+        column names, eg: ['fhost.network', ..., 'xhost.vacc', ...]
+    codes: numpy.ndarray
+        hosts x stages uint8 status codes, MISSING where a host has no such stage
+    labels: numpy.ndarray
+        hosts x stages button labels, eg: '00-020709', 'ant0_xy' or 'vacc'
+    """
+
+    def __init__(self, hosts, stages, codes, labels):
+        self.hosts = list(hosts)
+        self.stages = list(stages)
+        self.codes = codes
+        self.labels = labels
+
+    @classmethod
+    def from_chains(cls, *chains):
+        """
+        Params
+        ======
+        chains: tuple
+            (name, SignalChain, {host: row ordered by the chain}) per chain, a host's rows are
+            concatenated in the given order, eg: ('fhost', FHOST_SIG_CHAIN, fhost_rows)
+
+        Return
+        ======
+        matrix: StatusMatrix
+        """
+        hosts = sorted(set(host for _, _, rows in chains for host in rows))
+        index = dict((host, _h) for _h, host in enumerate(hosts))
+        width = sum(len(chain) for _, chain, _ in chains)
+        codes = np.full((len(hosts), width), MISSING, dtype=np.uint8)
+        labels = np.empty((len(hosts), width), dtype=object)
+        stages = []
+        for name, chain, rows in chains:
+            offset = len(stages)
+            for host, row in rows.iteritems():
+                row = row[:len(chain)]
+                _h = index[host]
+                codes[_h, offset:offset + len(row)] = [status_code(entry[-1]) for entry in row]
+                labels[_h, offset:offset + len(row)] = [entry[0] for entry in row]
+            stages.extend("%s.%s" % (name, stage) for stage in chain.stages)
+        return cls(hosts, stages, codes, labels)
+
+    @classmethod
+    def from_rows(cls, sensor_format):
+        """
+        Params
+        ======
+        sensor_format: dict
+            {host: [[label, status], ...]}, eg: read back from sensor_values.json
+
+        Return
+        ======
+        matrix: StatusMatrix
+            stages are the cell positions, '0', '1', ...
+        """
+        hosts = sorted(sensor_format)
+        width = max([len(sensor_format[host]) for host in hosts] or [0])
+        codes = np.full((len(hosts), width), MISSING, dtype=np.uint8)
+        labels = np.empty((len(hosts), width), dtype=object)
+        for _h, host in enumerate(hosts):
+            row = sensor_format[host]
+            codes[_h, :len(row)] = [status_code(cell[-1]) for cell in row]
+            labels[_h, :len(row)] = [cell[0] for cell in row]
+        return cls(hosts, [str(_c) for _c in xrange(width)], codes, labels)
+
+    def to_rows(self):
+        """
+        Return
+        ======
+        sensor_format: dict
+            {host: [[label, status], ...]}, the stages a host does not have are left out
+        """
+        statuses = STATUS_NAMES[self.codes].tolist()
+        labels = self.labels.tolist()
+        return dict(
+            (host, [
+                [label, status] for label, status in zip(labels[_h], statuses[_h])
+                if status is not None
+            ])
+            for _h, host in enumerate(self.hosts)
+        )
+
+    def mask(self, statuses=FAILING):
+        """
+        Return
+        ======
+        mask: numpy.ndarray
+            hosts x stages, True where the status is one of statuses
+        """
+        return np.isin(self.codes, [STATUS_CODES[status] for status in statuses])
+
+    def counts_per_stage(self, statuses=FAILING):
+        """
+        Return
+        ======
+        counts: dict
+            {stage: hosts whose stage is in one of statuses}, eg: failing elements per stage
+        """
+        return dict(zip(self.stages, self.mask(statuses).sum(axis=0).tolist()))
+
+    def counts_per_host(self, statuses=FAILING):
+        """
+        Return
+        ======
+        counts: dict
+            {host: stages in one of statuses}
+        """
+        return dict(zip(self.hosts, self.mask(statuses).sum(axis=1).tolist()))
+
+    def _worst(self, axis=None):
+        return STATUS_NAMES[CODE_BY_SEVERITY[SEVERITY_TABLE[self.codes].max(axis=axis)]]
+
+    def worst_per_stage(self):
+        """
+        Return
+        ======
+        worst: dict
+            {stage: most severe status of all hosts}, None for a stage no host has
+        """
+        if not self.hosts:
+            return dict((stage, None) for stage in self.stages)
+        return dict(zip(self.stages, self._worst(axis=0).tolist()))
+
+    def worst_per_host(self):
+        """
+        Return
+        ======
+        worst: dict
+            {host: most severe status of its stages}
+        """
+        if not self.stages:
+            return dict((host, None) for host in self.hosts)
+        return dict(zip(self.hosts, self._worst(axis=1).tolist()))
+
+    def worst(self):
+        """
+        Return
+        ======
+        status: str
+            most severe status of the array, None when it is empty. Input labels are not
+            statuses and are left out
+
+        eg:
+        >>> StatusMatrix.from_rows({'host00': [
+        ...     ['SKA-020709', 'nominal'], ['ant0_xy', 'inputlabel'], ['network', 'nominal']
+        ... ]}).worst()
+        'nominal'
+        """
+        return self._worst() if self.codes.size else None
+
+    def diff(self, previous):
+        """
+        Params
+        ======
+        previous: StatusMatrix
+            eg: the previous poll cycle's matrix
+
+        Return
+        ======
+        changes: list
+            [(host, stage), ...] cells whose status or label changed, None when the hosts or
+            stages differ and there is no cell by cell diff
+        """
+        if previous is None or previous.hosts != self.hosts or previous.stages != self.stages:
+            return None
+        changed = (self.codes != previous.codes) | (self.labels != previous.labels)
+        rows, columns = np.nonzero(changed)
+        return [
+            (self.hosts[_h], self.stages[_c]) for _h, _c in zip(rows.tolist(), columns.tolist())
+        ]
+
+    def row_changes(self, previous):
+        """
+        Cells of the host rows, see to_rows, whose status or label changed, such that a
+        reader of the rows can update the changed cells only
+
+        Params
+        ======
+        previous: StatusMatrix
+            eg: the matrix of the last published host rows
+
+        Return
+        ======
+        changes: list
+            [[host, index], ...] positions in the host rows, None when the hosts or the row
+            layout differ
+
+        eg:
+        >>> previous = StatusMatrix.from_rows({'host00': [['cd', 'nominal'], ['pfb', 'nominal']]})
+        >>> current = StatusMatrix.from_rows({'host00': [['cd', 'nominal'], ['pfb', 'warn']]})
+        >>> current.row_changes(previous)
+        [['host00', 1]]
+        """
+        if previous is None or previous.hosts != self.hosts or previous.stages != self.stages:
+            return None
+        present = self.codes != MISSING
+        if (present != (previous.codes != MISSING)).any():
+            return None
+        changed = present & ((self.codes != previous.codes) | (self.labels != previous.labels))
+        rows, columns = np.nonzero(changed)
+        # the stages a host does not have are left out of its row
+        index = np.cumsum(present, axis=1) - 1
+        return [
+            [self.hosts[_h], int(index[_h, _c])]
+            for _h, _c in zip(rows.tolist(), columns.tolist())
+        ]
+
+
+class HealthSummary(object):
+    """
+    Number of cells per status, overall, per host type and per signal chain stage
+
+    The counts are built once from the host rows and then moved along with the status
+    transitions of the changed cells, a poll cycle costs O(changes). A cell's host type and
+    stage follow from its position, a host row is its fhost stages followed by its xhost
+    stages, see SignalChain.order.
+
+    Params
+    ======
+    chains: tuple
+        (host type, SignalChain) in row order [Defaults: fhost and xhost]
+    skip_stages: tuple
+        stages that are labels rather than sensors [Defaults: ('input',)]
+    """
+
+    # the host's own device-status
+    STAGE_NAMES = STAGE_LABELS
+    TOTAL = "all"
+
+    def __init__(self, chains=(("fhost", FHOST_SIG_CHAIN), ("xhost", XHOST_SIG_CHAIN)),
+                 skip_stages=("input",)):
+        self.chains = chains
+        self.skip_stages = skip_stages
+        # row length -> (host type, stage) of every cell, None for cells that are not counted
+        self._layouts = {}
+        for _c in xrange(1, len(chains) + 1):
+            for offset in xrange(len(chains) - _c + 1):
+                layout = [
+                    None if stage in skip_stages else (
+                        host_type, self.STAGE_NAMES.get(stage, stage))
+                    for host_type, chain in chains[offset:offset + _c]
+                    for stage in chain.stages
+                ]
+                self._layouts.setdefault(len(layout), layout)
+        self.counts = defaultdict(Counter)
+
+    @property
+    def stages(self):
+        """
+        Stage names in signal chain order, the stages shared by host types once
+        """
+        stages = []
+        for _, chain in self.chains:
+            for stage in chain.stages:
+                stage = self.STAGE_NAMES.get(stage, stage)
+                if stage not in self.skip_stages and stage not in stages:
+                    stages.append(stage)
+        return stages
+
+    @property
+    def groups(self):
+        """
+        Every row of the summary, the total, the host types and the stages
+        """
+        return [self.TOTAL] + [host_type for host_type, _ in self.chains] + self.stages
+
+    def _move(self, row_length, index, status, count, changed):
+        layout = self._layouts.get(row_length)
+        if layout is None or layout[index] is None:
+            return
+        status = status.lower()
+        for group in (self.TOTAL,) + layout[index]:
+            self.counts[group][status] += count
+            changed[(group, status)] = self.counts[group][status]
+
+    def rebuild(self, sensor_format):
+        """
+        Count every cell, eg: when hosts were added or removed
+
+        Params
+        ======
+        sensor_format: dict
+            {host: [[label, status], ...]}
+        """
+        self.counts = defaultdict(Counter)
+        changed = {}
+        for row in sensor_format.itervalues():
+            for _c, cell in enumerate(row):
+                self._move(len(row), _c, cell[-1], 1, changed)
+
+    def update(self, old_format, changes):
+        """
+        Params
+        ======
+        old_format: dict
+            host rows the counts were built from
+        changes: list
+            [(host, index, cell), ...] see sensor_events.cell_changes
+
+        Return
+        ======
+        changed: dict
+            {(group, status): count} of every count that moved
+        """
+        changed = {}
+        for host, index, cell in changes:
+            row_length = len(old_format[host])
+            self._move(row_length, index, old_format[host][index][-1], -1, changed)
+            self._move(row_length, index, cell[-1], 1, changed)
+        return changed
+
+    def count(self, group, status):
+        return self.counts[group][status]